@@ -0,0 +1,238 @@
+"""Headless benchmarks for the rules hot paths, compared against benchmarks/baseline.json
+
+Run from anywhere with: python benchmarks/bench_rules.py
+Save the current results as the baseline with: python benchmarks/bench_rules.py --save-baseline
+Baselines are only comparable on the machine that saved them.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from dnd_export import CharacterExporter, format_text
+from dnd_graph import CharacterGraph
+from dnd_init_class import initRaceClass as raceClass
+from dnd_rules import CharacterRules
+from dnd_rules_cache import RULES_FILE, RulesCache
+from dnd_view_model import ClassGridModel
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+
+class LabelStub():
+    """Stands in for the wx.StaticText windows and page that ClassGridModel draws on, so the grid logic runs without a display"""
+    def __init__(self, label: str = ''):
+        self.label = label
+
+    def GetLabel(self) -> str:
+        return self.label
+
+    def SetLabel(self, label: str) -> None:
+        self.label = label
+
+    def Freeze(self) -> None:
+        pass
+
+    def Thaw(self) -> None:
+        pass
+
+    def Layout(self) -> None:
+        pass
+
+
+class BenchmarkSuite():
+    """Collects the benchmark cases, times them and compares the results with a stored baseline"""
+    def __init__(self, min_time: float = 0.2, repeat: int = 5):
+        self.min_time = min_time
+        self.repeat = repeat
+        self.RULES = CharacterRules()
+        self.CONSTANTS = self.RULES.CONSTANTS
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cases = {}
+        self.add_cases()
+
+    def add_cases(self) -> None:
+        """Registers every benchmark as a name and a zero argument callable"""
+        rng = random.Random(0)
+        self.cases['roll_5e'] = lambda: self.RULES.roll_5e(rng)
+        try:
+            from dnd_GUI_dynamics import RollDice
+        except ImportError:
+            pass
+        else:
+            self.cases['RollDice.roll_5e'] = lambda: RollDice().roll_5e()
+        for lines in (24, 1000, 10000):
+            path = self.rules_file(lines)
+            self.cases[f'initRaceClass[{lines} lines]'] = lambda path=path: raceClass(path, 1, 'Race\n')
+            cache = RulesCache(os.path.join(self.temp_dir.name, 'cache'))
+            cache.load(path)
+            self.cases[f'load_rules warm snapshot[{lines} lines]'] = lambda path=path, cache=cache: (cache.clear(), cache.load(path))
+        steps = [(score, score + 1) for score in range(self.CONSTANTS.MIN_POINTS, self.CONSTANTS.MAX_POINTS)]
+        steps += [(new, old) for old, new in steps]
+        self.cases['update_values_logic[14 steps]'] = lambda: [self.RULES.update_values_logic(current, new) for current, new in steps]
+        totals = ['15', '14', '12', '12', '10', '8']
+        old_list = ['15', '14', '12', '12', '10', '8']
+        values_list = ['15', '15', '12', '12', '10', '8']
+        colours = ['green'] * 6
+        self.cases['alter_colour_logic_loop'] = lambda: self.RULES.colour_changes(old_list, values_list, totals, colours, totals)
+        race_dict = raceClass(RULES_FILE, 1, 'Race\n').race_dict
+        grid_model = ClassGridModel(LabelStub(), [LabelStub('+0') for _ in range(18)], self.CONSTANTS, CharacterGraph({}, race_dict, self.RULES))
+        grid_model.set_scores(dict(zip(self.CONSTANTS.ABILITY_NAMES, totals)))
+        self.cases['race_value_logic[every race]'] = lambda: [grid_model.set_race(race, ['Dexterity', 'Wisdom']) for race in race_dict]
+        character_dict = {'Class': 'Cleric', 'Race': 'Gnome'}
+        scores = {'Strength': 13, 'Dexterity': 10, 'Constitution': 14, 'Intelligence': 15, 'Wisdom': 13, 'Charisma': 17}
+        modifiers = self.RULES.modifiers(scores)
+        counter = iter(range(10 ** 12))
+        sheet_dir = os.path.join(self.temp_dir.name, 'sheets')
+        os.makedirs(sheet_dir)
+        self.cases['write_file'] = lambda: self.write_file(os.path.join(sheet_dir, f'{next(counter) % 1000}.txt'), character_dict, scores, modifiers)
+        batch = [{'character': character_dict, 'scores': scores, 'modifiers': modifiers}] * 1000
+        self.cases['CharacterExporter.write_many[txt, 1000]'] = lambda: self.export_batch(batch)
+
+    def close(self) -> None:
+        """Removes the temp folder"""
+        self.temp_dir.cleanup()
+
+    def export_batch(self, batch: list) -> None:
+        """Streams a batch into one new shard and deletes it, so repeated runs do not fill the disk"""
+        with CharacterExporter(os.path.join(self.temp_dir.name, 'export'), 'txt') as exporter:
+            exporter.write_many(batch)
+        for path in exporter.shard_paths:
+            os.remove(path)
+
+    def write_file(self, file_path: str, character_dict: dict, score_dict: dict, modifier_dict: dict) -> None:
+        """The body of FinalisePage.write_file, which needs a wx page to call directly"""
+        with open(file_path, 'w') as file:
+            file.write(format_text(character_dict, score_dict, modifier_dict))
+
+    def rules_file(self, lines: int) -> str:
+        """Writes a rules file with about lines lines, half classes and half races, into the temp folder"""
+        with open(RULES_FILE) as file:
+            text = file.read()
+        class_part, race_part = text.split('\nRace\n')
+        class_lines = [line for line in class_part.splitlines()[1:] if line.strip()]
+        race_lines = [line for line in race_part.splitlines() if line.strip()]
+        extra = max(0, lines // 2 - len(class_lines))
+        class_lines += [f'Homebrew Class {i} | {self.CONSTANTS.ABILITY_NAMES[i % 6]}' for i in range(extra)]
+        extra = max(0, lines // 2 - len(race_lines))
+        race_lines += [f'Homebrew Race {i} | {self.CONSTANTS.ABILITY_NAMES[i % 6]} | 2 | {self.CONSTANTS.ABILITY_NAMES[(i + 1) % 6]} | 1' for i in range(extra)]
+        path = os.path.join(self.temp_dir.name, f'rules_{lines}.txt')
+        with open(path, 'w') as file:
+            file.write('Class\n' + '\n'.join(class_lines) + '\n\nRace\n' + '\n'.join(race_lines) + '\n')
+        return path
+
+    def time_case(self, function) -> float:
+        """Best ops/sec over repeat runs, each run calling function for at least min_time seconds"""
+        calls = 1
+        while True:
+            start = time.perf_counter()
+            for _ in range(calls):
+                function()
+            elapsed = time.perf_counter() - start
+            if elapsed >= self.min_time / 10:
+                break
+            calls *= 2
+        calls = max(1, int(calls * self.min_time / max(elapsed, 1e-9)))
+        best = float('inf')
+        for _ in range(self.repeat):
+            start = time.perf_counter()
+            for _ in range(calls):
+                function()
+            best = min(best, (time.perf_counter() - start) / calls)
+        return 1 / best
+
+    def memory_case(self, function, calls: int = 100) -> int:
+        """Peak bytes traced by tracemalloc while calling function calls times"""
+        tracemalloc.start()
+        try:
+            for _ in range(calls):
+                function()
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    def run(self, selected: list = None) -> dict:
+        """
+        Runs the benchmarks
+
+        Args:
+        selected (list): substrings of the case names to run, None for all
+
+        Returns:
+        dict: case names as keys and dicts with 'ops_per_sec' and 'peak_bytes' as values
+        """
+        results = {}
+        for name, function in self.cases.items():
+            if selected and not any(part in name for part in selected):
+                continue
+            results[name] = {'ops_per_sec': self.time_case(function), 'peak_bytes': self.memory_case(function)}
+        return results
+
+    def compare(self, results: dict, baseline: dict, tolerance: float) -> list:
+        """
+        Finds the cases that are slower than the baseline by more than tolerance
+
+        Args:
+        results (dict): from run
+        baseline (dict): stored results
+        tolerance (float): allowed fractional slow down, 0.25 allows 25%
+
+        Returns:
+        list: names of regressed cases
+        """
+        return [name for name, result in results.items() if name in baseline and result['ops_per_sec'] < baseline[name]['ops_per_sec'] * (1 - tolerance)]
+
+    def report(self, results: dict, baseline: dict, regressions: list) -> str:
+        """Formats the results as a table"""
+        lines = [f'{"benchmark":<42}{"ops/sec":>14}{"peak KiB":>10}{"baseline":>14}{"ratio":>8}']
+        for name, result in results.items():
+            base = baseline.get(name, {}).get('ops_per_sec')
+            ratio = f'{result["ops_per_sec"] / base:.2f}' if base else '-'
+            base_text = f'{base:,.0f}' if base else '-'
+            flag = '  REGRESSED' if name in regressions else ''
+            lines.append(f'{name:<42}{result["ops_per_sec"]:>14,.0f}{result["peak_bytes"] / 1024:>10.1f}{base_text:>14}{ratio:>8}{flag}')
+        return '\n'.join(lines)
+
+
+def load_baseline(path: str) -> dict:
+    """Reads the stored baseline, an empty dict when there is none"""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as file:
+        return json.load(file)['results']
+
+
+def main(argv: list = None) -> int:
+    """Runs the suite from the command line, returning 1 when any case regressed"""
+    parser = argparse.ArgumentParser(description='Benchmark the rules hot paths')
+    parser.add_argument('cases', nargs='*', help='only run cases whose name contains one of these')
+    parser.add_argument('--baseline', default=BASELINE_FILE, help='baseline JSON file')
+    parser.add_argument('--save-baseline', action='store_true', help='store these results as the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.3, help='allowed fractional slow down before a case counts as regressed')
+    parser.add_argument('--min-time', type=float, default=0.2, help='seconds per timing run')
+    args = parser.parse_args(argv)
+    suite = BenchmarkSuite(min_time=args.min_time)
+    try:
+        results = suite.run(args.cases)
+    finally:
+        suite.close()
+    baseline = load_baseline(args.baseline)
+    regressions = suite.compare(results, baseline, args.tolerance)
+    print(suite.report(results, baseline, regressions))
+    if args.save_baseline:
+        with open(args.baseline, 'w') as file:
+            json.dump({'python': sys.version.split()[0], 'results': {**baseline, **results}}, file, indent=2, sort_keys=True)
+        print(f'Baseline saved to {args.baseline}')
+        return 0
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
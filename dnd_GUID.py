@@ -1,31 +1,93 @@
+import os
 import wx
 import wx.adv
 from dnd_GUI_dynamics import *
-from dnd_init_class import initRaceClass as raceClass
+from dnd_rules_cache import load_rules
+from dnd_rules_watch import watch_rules
+from dnd_dice import compile_expression
+from dnd_export import OUTPUT_ROOT, format_text
+from dnd_graph import CharacterGraph
+from dnd_storage import DATABASE_PATH, CharacterStore
+from dnd_view_model import ClassGridModel
 
 class MyWizard(wx.adv.Wizard):
     def __init__(self):
-        """Initialises instance variables and calls creation of static ordered pages"""
+        """Initialises instance variables and calls creation of the landing page, later pages are built on first navigation"""
         super().__init__(parent=None, title="Character Creation Wizard")
         self.SetPageSize(wx.Size(500,400))
-        self.CONSTANTS = Constants()
+        self.CONSTANTS = Constants.shared()
         self.GUI = GUIElements()
-        self.create_base_pages()
+        self.base_pages = {}
         self.extra_pages = []
         self.page_2 = ''
         self.score_dict = {}
+        self.create_base_pages()
+        self.rules_watcher = watch_rules()
+        if self.rules_watcher is not None:
+            self.rules_watcher.subscribe(self.on_rules_changed)
     
     def create_base_pages(self):
-        """Creates statically ordered pages and binds events to page changes where data required to pull through"""
+        """Creates the landing page and binds its page change, c_page and f_page are created by get_page when the wizard first moves to them"""
         self.l_page = LandingPage(self, self.GUI)
-        self.c_page = ClassPage(self, self.GUI, self.CONSTANTS)
-        self.f_page = FinalisePage(self, self.GUI, self.CONSTANTS)
-        self.l_page.Chain(self.c_page)
-        self.c_page.Chain(self.f_page)
+        self.l_page.lazy_next = 'c_page'
         self.l_page.Bind(wx.adv.EVT_WIZARD_BEFORE_PAGE_CHANGED, self.on_next_page)
-        self.c_page.Bind(wx.adv.EVT_WIZARD_PAGE_CHANGING, lambda event, parent=self.c_page, next_page=self.f_page, grid=self.f_page.f_grid: self.next_page_dict(event, parent, next_page, grid))
-        self.c_page.Bind(wx.adv.EVT_WIZARD_BEFORE_PAGE_CHANGED, self.c_page.update_score_dict)
-        self.f_page.Bind(wx.adv.EVT_WIZARD_PAGE_CHANGED, self.update_char_details)
+
+    @property
+    def c_page(self):
+        """The ClassPage, created on first use"""
+        return self.get_page('c_page')
+
+    @property
+    def f_page(self):
+        """The FinalisePage, created on first use"""
+        return self.get_page('f_page')
+
+    def get_page(self, name):
+        """Returns the named base page, creating it and binding its page change events the first time"""
+        if name not in self.base_pages:
+            if name == 'c_page':
+                page = ClassPage(self, self.GUI, self.CONSTANTS)
+                page.lazy_next = 'f_page'
+                page.Bind(wx.adv.EVT_WIZARD_PAGE_CHANGING, lambda event, parent=page: self.on_page_changing(event, parent, 'f_page'))
+                page.Bind(wx.adv.EVT_WIZARD_BEFORE_PAGE_CHANGED, lambda event, parent=page: self.on_before_page_changed(event, parent, parent.update_score_dict))
+            else:
+                page = FinalisePage(self, self.GUI, self.CONSTANTS)
+                page.Bind(wx.adv.EVT_WIZARD_PAGE_CHANGED, self.update_char_details)
+            self.base_pages[name] = page
+        return self.base_pages[name]
+
+    def chain_base(self, page, name):
+        """Chains page to the named base page if it has been created, otherwise marks page so the base page is created when the wizard leaves it"""
+        if name in self.base_pages:
+            page.Chain(self.base_pages[name])
+            page.lazy_next = None
+        else:
+            page.lazy_next = name
+
+    def HasNextPage(self, page):
+        """Counts a page whose next page has not been created yet as having one, so its button shows Next rather than Finish"""
+        return getattr(page, 'lazy_next', None) is not None or super().HasNextPage(page)
+
+    def on_before_page_changed(self, event, page, handler):
+        """Runs a page's own before page changed handler, then creates and chains its lazy next page if moving forward was allowed"""
+        handler(event)
+        if event.GetDirection() and event.IsAllowed() and getattr(page, 'lazy_next', None):
+            page.Chain(self.get_page(page.lazy_next))
+            page.lazy_next = None
+
+    def on_page_changing(self, event, parent, name):
+        """Called on page changing, pulls scores through to the named base page when moving forward"""
+        if event.GetDirection():
+            self.next_page_dict(event, parent, self.get_page(name))
+
+    def on_rules_changed(self, rules, changes):
+        """Called on the watcher thread when the rules file is reloaded, hands the new rules to the GUI thread"""
+        wx.CallAfter(self.refresh_rules, rules)
+
+    def refresh_rules(self, rules):
+        """Refreshes c_page's choices with reloaded rules, a c_page built later loads them itself"""
+        if self and 'c_page' in self.base_pages:
+            self.c_page.refresh_rules(rules)
 
     def on_next_page(self, event):
         """Used by l_page to decide either five e or pb page to chain and calls methods to handle that"""
@@ -42,41 +104,45 @@ class MyWizard(wx.adv.Wizard):
         if 'pb_page' not in self.extra_pages:
             self.pb_page = PointsBuyPage(self, self.CONSTANTS, self.GUI)
             self.extra_pages.append('pb_page')
+            self.pb_page.Bind(wx.adv.EVT_WIZARD_BEFORE_PAGE_CHANGED, lambda event, parent=self.pb_page: self.on_before_page_changed(event, parent, parent.on_page_change))
+            self.pb_page.Bind(wx.adv.EVT_WIZARD_PAGE_CHANGING, lambda event, parent=self.pb_page: self.on_page_changing(event, parent, 'c_page'))
         if self.page_2 != 'pb_page':
             self.l_page.Chain(self.pb_page)
-            self.pb_page.Chain(self.c_page)
+            self.chain_base(self.pb_page, 'c_page')
             self.page_2 = 'pb_page'
-            self.pb_page.Bind(wx.adv.EVT_WIZARD_BEFORE_PAGE_CHANGED, self.pb_page.on_page_change)
-            self.pb_page.Bind(wx.adv.EVT_WIZARD_PAGE_CHANGING, lambda event, parent=self.pb_page, next_page=self.c_page, grid=self.c_page.c_grid: self.next_page_dict(event, parent, next_page, grid))
 
     def run_eeeee_page(self):
-        """Called to handle user moving to five e page, creates eeeee page or sets it in order and binds page change for data pull through"""
+        """Called to handle user moving to five e page, creates eeeee page or sets it in order and binds page change for data pull through. Its next page is a_page, chained by on_move_from_eeeee, so lazy_next only keeps the Next button showing until then"""
         if 'eeeee_page' not in self.extra_pages:
             self.eeeee_page = Roll5ePage(self, self.CONSTANTS, self.GUI)
             self.extra_pages.append('eeeee_page')
+            self.eeeee_page.Bind(wx.adv.EVT_WIZARD_BEFORE_PAGE_CHANGED, self.on_move_from_eeeee)
         if self.page_2 != 'eeeee_page':
             self.l_page.Chain(self.eeeee_page)
-            self.eeeee_page.Chain(self.c_page)
+            self.eeeee_page.lazy_next = 'a_page'
             self.page_2 = 'eeeee_page'
-            self.eeeee_page.Bind(wx.adv.EVT_WIZARD_BEFORE_PAGE_CHANGED, self.on_move_from_eeeee)
 
     def on_move_from_eeeee(self, event):
-        """Creates a_page and chains it after eeeee page, then to c_page, binds page change events for data pull through"""
+        """Creates a_page the first time, binding page change events for data pull through, later moves reuse a_page, resetting it when the rolls have changed. Every move chains eeeee page to a_page and a_page to c_page again, since choosing points buy in between chains c_page after pb_page"""
         if hasattr(self.eeeee_page, 'score_totals'):
             self.score_totals = self.eeeee_page.score_totals
-            self.a_page = AssignRollsPage(self, self.score_totals, self.CONSTANTS, self.GUI)
-            self.eeeee_page.Chain(self.a_page)    
-            self.a_page.Chain(self.c_page)
-            self.a_page.Bind(wx.adv.EVT_WIZARD_BEFORE_PAGE_CHANGED, self.a_page.on_page_change)
-            self.a_page.Bind(wx.adv.EVT_WIZARD_PAGE_CHANGING, lambda event, parent=self.a_page, next_page=self.c_page, grid=self.c_page.c_grid: self.next_page_dict(event, parent, next_page, grid))
-
+            if 'a_page' not in self.extra_pages:
+                self.a_page = AssignRollsPage(self, self.score_totals, self.CONSTANTS, self.GUI)
+                self.extra_pages.append('a_page')
+                self.a_page.Bind(wx.adv.EVT_WIZARD_BEFORE_PAGE_CHANGED, lambda event, parent=self.a_page: self.on_before_page_changed(event, parent, parent.on_page_change))
+                self.a_page.Bind(wx.adv.EVT_WIZARD_PAGE_CHANGING, lambda event, parent=self.a_page: self.on_page_changing(event, parent, 'c_page'))
+            elif self.a_page.score_totals != self.score_totals:
+                self.a_page.reset(self.score_totals)
+            self.eeeee_page.Chain(self.a_page)
+            self.eeeee_page.lazy_next = None
+            self.chain_base(self.a_page, 'c_page')
         else:
             event.Veto()
 
-    def next_page_dict(self, event, parent, next_page, grid):
-        """Called on event when changing to c_page, pulls data for score_dict from previous page to next page and calls update_grid_data to update next page"""
+    def next_page_dict(self, event, parent, next_page):
+        """Called on event when changing to c_page or f_page, pulls data for score_dict from previous page to next page and calls the next page's show_scores to update its grid"""
         self.score_dict = parent.score_dict
-        self.GUI.update_grid_data(self.score_dict, grid)
+        next_page.show_scores(self.score_dict)
         next_page.score_dict = self.score_dict
 
     def update_char_details(self, event):
@@ -125,6 +191,7 @@ class Roll5ePage(wx.adv.WizardPageSimple):
         self.e_page_sizer = wx.BoxSizer(wx.VERTICAL)
         self.GUI.create_title_subtitle(self.e_page_sizer, "Lets roll your stats!", 'Your rolls so far')
         self.create_score_holder()
+        self.create_expression_entry()
         self.create_dice_roller()
         self.roll_button()
         self.SetSizer(self.e_page_sizer)
@@ -139,20 +206,40 @@ class Roll5ePage(wx.adv.WizardPageSimple):
         self.e_page_sizer.Add(self.score_grid, 0, wx.ALIGN_CENTRE, 5)
         self.e_page_sizer.AddSpacer(70)
 
+    def create_expression_entry(self):
+        """Creates a text box holding the dice expression rolled for each score, 4d6kh3 unless changed before the first roll"""
+        self.expression_text = wx.TextCtrl(self, value=self.CONSTANTS.ROLL_EXPRESSION, style=wx.TE_CENTRE)
+        self.expression_text.SetToolTip('Dice rolled for each score, e.g. 4d6kh3, 3d6, 2d6+6 or 4d6r1kh3')
+        self.e_page_sizer.Add(self.expression_text, 0, wx.ALIGN_CENTRE, 5)
+        self.e_page_sizer.AddSpacer(20)
+
     def create_dice_roller(self):
-        """Creates a grid sizer with a subtitle above, populates grid with placeholders (6)"""
+        """Creates a grid sizer with a subtitle above, populates grid with placeholders (4)"""
         subtitle = wx.StaticText(self, label='Your dice')
         subtitle.Font = self.CONSTANTS.SUB_FONT
         self.e_page_sizer.Add(subtitle, 0, wx.ALIGN_CENTRE, 5)
         self.e_page_sizer.AddSpacer(20)
-        self.dice_grid = wx.GridSizer(1, 4, 60, 80)
-        for _ in range(4):
+        self.dice_grid = wx.GridSizer(1, self.CONSTANTS.DICE_PER_ROLL, 60, 80)
+        self.add_dice_placeholders(self.CONSTANTS.DICE_PER_ROLL)
+        self.e_page_sizer.Add(self.dice_grid, 0, wx.ALIGN_CENTRE, 5)
+        self.e_page_sizer.AddSpacer(40)
+
+    def add_dice_placeholders(self, count):
+        """Adds count dice placeholders to dice_grid"""
+        for _ in range(count):
             placeholder = wx.StaticText(self, label="6", style=wx.ALIGN_CENTRE)
             placeholder.SetMinSize(wx.Size(30, 30))
             placeholder.Font = self.CONSTANTS.FEATURE_FONT
             self.dice_grid.Add(placeholder, 0, wx.ALIGN_CENTRE, 10)
-        self.e_page_sizer.Add(self.dice_grid, 0, wx.ALIGN_CENTRE, 5)
-        self.e_page_sizer.AddSpacer(40)
+
+    def resize_dice_grid(self, count):
+        """Rebuilds the dice placeholders when the expression rolls a different number of dice than 4"""
+        if count == self.dice_grid.GetItemCount():
+            return
+        self.dice_grid.Clear(delete_windows=True)
+        self.dice_grid.SetCols(count)
+        self.add_dice_placeholders(count)
+        self.Layout()
     
     def roll_button(self):
         """Creates the roll button and binds it to the event handler roll_dice"""
@@ -164,20 +251,14 @@ class Roll5ePage(wx.adv.WizardPageSimple):
     
     def roll_dice(self, event):
         """Calls initialise_dice if no dice scores have been rolled yet, updates dice_grid with roll values, sets background colour and calls update_scores up to 6 times"""
-        if not self.roll_flag:
-            self.initialise_dice()
+        if not self.roll_flag and not self.initialise_dice():
+            return
         if self.rolls < 6: # likely made redundant due to button being disabled after 6
-            select = 0
-            for i, item in enumerate(self.dice_grid.GetChildren()):
-                mini = min(self.dice_rolled[self.rolls])
-                roll = self.dice_rolled[self.rolls][i]
+            kept_flags = self.dice.kept_flags(self.dice_rolled[self.rolls])
+            for item, roll, kept in zip(self.dice_grid.GetChildren(), self.dice_rolled[self.rolls], kept_flags):
                 widget = item.GetWindow()
                 widget.SetLabel(str(roll))
-                if roll == mini and not select:
-                    select += 1
-                    widget.SetBackgroundColour(wx.Colour(wx.NullColour))
-                else:
-                    widget.SetBackgroundColour(wx.Colour(wx.GREEN))
+                widget.SetBackgroundColour(wx.Colour(wx.GREEN) if kept else wx.Colour(wx.NullColour))
             self.update_scores()
 
     def update_scores(self):
@@ -189,9 +270,17 @@ class Roll5ePage(wx.adv.WizardPageSimple):
             self.action_button.Disable()
     
     def initialise_dice(self):
-        """Calls roll_5e and sets instance variables to the return values to hold dice scores, flags itself as having run"""
-        self.score_totals, self.score_dice, self.dice_rolled = self.rollDice.roll_5e()
+        """Compiles the dice expression, calls roll_5e with it and sets instance variables to the return values to hold dice scores, flags itself as having run. Returns False and shows the error when the expression cannot be rolled"""
+        try:
+            self.dice = compile_expression(self.expression_text.GetValue())
+        except ValueError as error:
+            wx.MessageBox(str(error), 'Dice expression', wx.OK | wx.ICON_ERROR, self)
+            return False
+        self.expression_text.Disable()
+        self.resize_dice_grid(self.dice.dice_count)
+        self.score_totals, self.score_dice, self.dice_rolled = self.rollDice.roll_5e(self.dice.text)
         self.roll_flag = True
+        return True
 
 
 class AssignRollsPage(wx.adv.WizardPageSimple):
@@ -246,6 +335,23 @@ class AssignRollsPage(wx.adv.WizardPageSimple):
             self.a_remaining_grid.Add(text, 0, wx.ALIGN_CENTRE, 10)
         self.a_page_sizer.Add(self.a_remaining_grid, 0, wx.ALIGN_CENTRE)
 
+    def reset(self, score_totals):
+        """Reuses the page for a new set of rolls, refilling the existing choices and remaining scores rather than building new widgets"""
+        self.score_totals = score_totals
+        self.score_dict = {}
+        self.values_list = list(score_totals)
+        self.Freeze()
+        try:
+            for choice, roll in zip(self.choice_list, score_totals):
+                choice.Set(score_totals)
+                choice.Label = roll
+            for text, roll in zip(self.remaining_list, score_totals):
+                text.SetLabel(roll)
+                text.SetBackgroundColour(wx.Colour(wx.GREEN))
+        finally:
+            self.Thaw()
+        self.Layout()
+
     def format_remaining_scores(self, text):
         """Formats the text in the remaining grid, initialising their backgrounds at green"""
         text.Font = self.CONSTANTS.FEATURE_FONT
@@ -372,7 +478,8 @@ class ClassPage(wx.adv.WizardPageSimple):
         self.score_dict = {}
         self.character_dict = {}
         self.CONSTANTS = CONSTANTS
-        self.RaceClass = raceClass('Class_Race.txt', 1, 'Race\n')
+        self.RaceClass = load_rules()
+        self.graph = CharacterGraph(self.RaceClass.class_dict, self.RaceClass.race_dict)
         self.create_c_page()   
 
     def create_c_page(self):
@@ -381,17 +488,18 @@ class ClassPage(wx.adv.WizardPageSimple):
         self.GUI.create_title_subtitle(self.c_page_sizer, 'Now we can set your class and race', 'Your ability stats so far')
         self.create_ability_grid()
         self.create_choice_layout()
-        self.HalfElf = HalfElfElements(self, self.grid_window_list, self.c_page_sizer, self.CONSTANTS)
+        self.HalfElf = HalfElfElements(self, self.grid_model, self.c_page_sizer, self.CONSTANTS)
         self.SetSizer(self.c_page_sizer)
 
     def create_ability_grid(self):
-        """Creates grid sizer an populates with placeholders, populates grid_window_list with windows"""
+        """Creates grid sizer an populates with placeholders, populates grid_window_list with windows and creates the grid_model that draws them from graph"""
         self.c_grid = wx.GridSizer(3, 6, 30, 30)
         for _ in range(18):
             text = wx.StaticText(self, label='+0')
             text.Font = self.CONSTANTS.SUB_FONT
             self.c_grid.Add(text, 0, wx.ALIGN_CENTRE, 0)
             self.grid_window_list.append(text)
+        self.grid_model = ClassGridModel(self, self.grid_window_list, self.CONSTANTS, self.graph)
         self.c_page_sizer.Add(self.c_grid, 0, wx.ALIGN_CENTRE)
         self.c_page_sizer.AddSpacer(50)
 
@@ -405,10 +513,15 @@ class ClassPage(wx.adv.WizardPageSimple):
         self.c_page_sizer.AddSpacer(30)
 
     def create_class_choice(self):
-        """Creates the class choice widget and binds on_class_choice from GUI module"""
+        """Creates the class choice widget and binds on_class_choice"""
         self.class_choice = wx.Choice(self, choices = list(self.RaceClass.class_dict.keys()))
         self.c_choice_sizer.Add(self.class_choice, 0, wx.ALIGN_CENTRE)
-        self.class_choice.Bind(wx.EVT_CHOICE, lambda event, grid_list=self.grid_window_list[:6], class_dict=self.RaceClass.class_dict: self.GUI.on_class_choice(event, grid_list, class_dict))
+        self.class_choice.Bind(wx.EVT_CHOICE, self.on_class_choice)
+
+    def on_class_choice(self, event):
+        """Sets the class in graph and calls on_class_choice from GUI module to highlight its abilities"""
+        self.graph.set_class(event.GetString())
+        self.GUI.on_class_choice(event, self.grid_window_list[:6], self.RaceClass.class_dict)
 
     def create_race_choice(self):
         """Creates the race choice widget and binds on_race_choice"""
@@ -417,29 +530,56 @@ class ClassPage(wx.adv.WizardPageSimple):
         self.race_choice.Bind(wx.EVT_CHOICE, self.on_race_choice)
 
     def on_race_choice(self, event):
-        """Calls race_value_logic from GUI and checks for Half-Elf to run haelf module functionality"""
-        selection = event.GetString()
-        score_modifier = self.RaceClass.race_dict[selection]
-        self.ability_modified = list(score_modifier.keys())
-        self.GUI.race_value_logic(self.ability_modified, score_modifier, self.grid_window_list)
+        """Calls apply_race_choice with the chosen race"""
+        self.apply_race_choice(event.GetString())
+
+    def apply_race_choice(self, selection):
+        """Sets the race in grid_model, which redraws only the abilities whose bonus changed, and checks for Half-Elf to run haelf module functionality"""
+        self.ability_modified = list(self.RaceClass.race_dict[selection].keys())
+        self.grid_model.set_race(selection)
         if selection == 'Half-Elf':
             self.HalfElf.haelf_selection_on()
         elif self.HalfElf.haelf_show:
             self.HalfElf.haelf_show_hide(False)
 
+    def refresh_rules(self, rules):
+        """Called from MyWizard when the rules file is reloaded, refills the class and race choices and reapplies the picks that are still in the file, clearing the others"""
+        class_name = self.class_choice.GetStringSelection()
+        race = self.race_choice.GetStringSelection()
+        self.RaceClass = rules
+        self.graph.set_rules(rules.class_dict, rules.race_dict)
+        self.Freeze()
+        try:
+            self.class_choice.Set(list(rules.class_dict.keys()))
+            self.race_choice.Set(list(rules.race_dict.keys()))
+            if class_name in rules.class_dict:
+                self.class_choice.SetStringSelection(class_name)
+                self.GUI.highlight_abilities(self.grid_window_list[:6], rules.class_dict[class_name])
+            else:
+                self.graph.set_class(None)
+                self.GUI.highlight_abilities(self.grid_window_list[:6], [])
+            if race in rules.race_dict:
+                self.race_choice.SetStringSelection(race)
+                self.apply_race_choice(race)
+            else:
+                self.ability_modified = []
+                self.grid_model.set_race(None)
+                if self.HalfElf.haelf_show:
+                    self.HalfElf.haelf_show_hide(False)
+        finally:
+            self.Thaw()
+        self.Layout()
+
+    def show_scores(self, score_dict):
+        """Called from MyWizard.next_page_dict, hands the scores from the previous page to grid_model, which redraws only the changed cells"""
+        self.grid_model.set_scores(score_dict)
+
     def update_score_dict(self, event):
-        """Called from page change, vetoes if no modifier is altered (no race chosen), otherwise populates score_dict and character_dict"""
-        proceed = False
-        for mod in self.grid_window_list[self.CONSTANTS.MODIFIER_INDEX:]:
-            if mod.GetLabel() != '+0':
-                proceed = True
-                break
-        if proceed:
-            for i in range(6):
-                self.score_dict[self.grid_window_list[i].GetLabel()] = self.grid_window_list[i+self.CONSTANTS.SCORE_INDEX].GetLabel()
-            char_details = ['Class', 'Race']
-            for i, window in enumerate([self.class_choice, self.race_choice]):
-                self.character_dict[char_details[i]] = window.GetString(window.GetSelection())
+        """Called from page change, vetoes if no race is chosen, otherwise populates score_dict and character_dict from graph"""
+        if self.grid_model.has_race():
+            self.score_dict.update(self.grid_model.score_dict())
+            character_dict = self.graph.finalise()[0]
+            self.character_dict.update({key: value if value is not None else '' for key, value in character_dict.items()})
         else:
             event.Veto()
 
@@ -477,6 +617,10 @@ class FinalisePage(wx.adv.WizardPageSimple):
         self.f_page_sizer.Add(self.f_grid, 0, wx.ALIGN_CENTRE)
         self.f_page_sizer.AddSpacer(40)
 
+    def show_scores(self, score_dict):
+        """Called from MyWizard.next_page_dict, updates f_grid with the final ability names and scores"""
+        self.GUI.update_grid_data(score_dict, self.f_grid)
+
     def create_char_details(self):
         """Creates sizer and populates with place holders (1), populates char_detail_list"""
         self.char_sizer = wx.BoxSizer(wx.VERTICAL)
@@ -504,14 +648,19 @@ class FinalisePage(wx.adv.WizardPageSimple):
         self.f_page_sizer.Add(button, 0, wx.ALIGN_CENTRE)
 
     def on_confirm_button(self, event):
-        """Opens dialog to request (file) name, calls validate_name, sets modifier_dict values, sets file path, calls write_file to update the txt file with details, relays save complete and disables confirm button. If dialog cancelled, event is vetoed"""
+        """Opens dialog to request (file) name, calls validate_name, sets modifier_dict values, sets file path, calls write_file to update the txt file with details (or write_database when DND_DATABASE is set), relays save complete and disables confirm button. If dialog cancelled, event is vetoed"""
         dialog = wx.TextEntryDialog(self, 'Enter character name here:', 'Character Name')
         if dialog.ShowModal() == wx.ID_OK:
             character_name = dialog.GetValue()
             character_name = self.validate_name(character_name)
-            self.modifier_dict = {key : ((int(value)-10) // 2) for key, value in self.score_dict.items()}
-            file_path = f'/Users/homefolder/VSCode/DnD/Data/{character_name}.txt' # Could edit to allow choosing file path
-            self.write_file(file_path)
+            self.modifier_dict = self.GUI.RULES.modifiers(self.score_dict)
+            if DATABASE_PATH:
+                self.write_database(DATABASE_PATH, character_name)
+                file_path = DATABASE_PATH
+            else:
+                os.makedirs(OUTPUT_ROOT, exist_ok=True)
+                file_path = os.path.join(OUTPUT_ROOT, f'{character_name}.txt') # Set DND_OUTPUT_DIR to choose the folder
+                self.write_file(file_path)
             wx.MessageBox(f'Character data saved successfully to {file_path}', 'Data Saved', wx.OK)
             button = event.GetEventObject()
             button.Disable()
@@ -521,16 +670,13 @@ class FinalisePage(wx.adv.WizardPageSimple):
     def write_file(self, file_path):
         """Creates a txt file in the path and updates with values from character_dict, score_dict and modifier_dict, one dict key/value per line"""
         with open(file_path, 'w') as file:
-            file.write('Character Details\n')
-            for key, value in self.character_dict.items():
-                file.write(f'{key}: {value}\n')
-            file.write('\n Ability Scores\n')
-            for key, value in self.score_dict.items():
-                file.write(f'{key}: {value}\n')
-            file.write('\n Score Modifiers\n')
-            for key, value in self.modifier_dict.items():
-                file.write(f'{key}: {value}\n')
+            file.write(format_text(self.character_dict, self.score_dict, self.modifier_dict))
         
+    def write_database(self, database_path, character_name):
+        """Saves character_dict, score_dict and modifier_dict to the SQLite database at database_path, used instead of write_file when DND_DATABASE is set"""
+        with CharacterStore(database_path) as store:
+            store.save(self.character_dict, self.score_dict, self.modifier_dict, character_name)
+
     def validate_name(self, character_name):
         """Validates characters in given name to be a letter, ', or space, replaces spaces with underscores"""
         for letter in character_name:
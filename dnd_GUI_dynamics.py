@@ -1,13 +1,15 @@
-from random import randint
 import wx
 import wx.adv
+from dnd_rules import CharacterRules, RuleConstants
+from dnd_view_model import ClassGridModel
 
 
 class GUIElements():
     """A class that contains methods for dynamic elements on the main GUI"""
     def __init__(self, parent:wx.adv.WizardPageSimple=None):
         self.parent = parent
-        self.CONSTANTS = Constants()
+        self.CONSTANTS = Constants.shared()
+        self.RULES = CharacterRules(self.CONSTANTS)
         self.is_point_shown = 0
 
     def create_title_subtitle(self, sizer: wx.BoxSizer, title_label: str, sub_label: str) -> None:
@@ -23,11 +25,9 @@ class GUIElements():
         None
         """
         title = wx.StaticText(self.parent, label=title_label)
-        title_font = wx.Font(18, wx.FONTFAMILY_DEFAULT, wx.FONTSTYLE_NORMAL, wx.FONTWEIGHT_BOLD)
-        title.Font = title_font
+        title.Font = self.CONSTANTS.TITLE_FONT
         subtitle = wx.StaticText(self.parent, label=sub_label)
-        sub_font = wx.Font(15, wx.FONTFAMILY_DEFAULT, wx.FONTSTYLE_NORMAL, wx.FONTWEIGHT_NORMAL)
-        subtitle.Font = sub_font
+        subtitle.Font = self.CONSTANTS.SUB_FONT
         sizer.Add(title, 0, wx.ALIGN_TOP| wx.ALIGN_CENTRE, 10)
         sizer.AddSpacer(60)
         sizer.Add(subtitle, 0, wx.ALIGN_CENTRE | wx.BOTTOM, 5)
@@ -89,7 +89,7 @@ class GUIElements():
         ability_window = ability_windows[col_index]
         current_score = int(ability_window.GetLabel())
         new_score = spin_window.GetValue()
-        if new_score == current_score or new_score > current_score and (points_available == 0 or (points_available == 1 and current_score >= self.CONSTANTS.COST_THRESHOLD)):
+        if not self.RULES.spin_allowed(current_score, new_score, points_available):
             spin_window.SetValue(current_score)
             return points_available
         else:
@@ -98,7 +98,7 @@ class GUIElements():
             self.update_values(new_score, ability_window)
             self.update_points_available(remaining_text, points_available)
             self.update_cost(cost_list, col_index, new_score)
-            self.parent.Layout()
+            spin_window.GetParent().Layout()
             return points_available
 
     def update_values_logic(self, current_score: int, new_score: int) -> int:
@@ -112,18 +112,7 @@ class GUIElements():
         Returns:
         increment (int): used to update the points_available variable, also to check if a change should be made to the display values
         """
-        increment = 0
-        if new_score > current_score:
-            if current_score >= self.CONSTANTS.COST_THRESHOLD:
-                increment = - self.CONSTANTS.HIGH_COST
-            elif current_score < self.CONSTANTS.COST_THRESHOLD:
-                increment = - self.CONSTANTS.LOW_COST
-        else:
-            if current_score > self.CONSTANTS.COST_THRESHOLD:
-                increment = self.CONSTANTS.HIGH_COST
-            else:
-                increment = self.CONSTANTS.LOW_COST
-        return increment
+        return self.RULES.update_values_logic(current_score, new_score)
 
     def update_points_available(self, remaining_text: wx.StaticText, points_available: int) -> None:
         """
@@ -193,7 +182,7 @@ class GUIElements():
 
     def alter_colour_logic_loop(self, old_list: list) -> None:
         """
-        A for loop iterating over remaining_list that initialises the required variables for the conditionals that follow in the next helper and breaks when the conditionals are finished
+        Reads the labels and colours of remaining_list, asks CharacterRules.colour_changes which to turn green or red and applies them
         
         Args:
         old_list (list): previous values selected across wx.Choice elements, used to get a count of the item label in the previous selection
@@ -201,37 +190,18 @@ class GUIElements():
         Returns:
         None
         """
-        self.count_to_green = 0
-        self.count_to_red = 0
-        for item in self.remaining_list:
-            label = item.GetLabel()
-            colour = item.GetBackgroundColour()
-            old_count = old_list.count(label)
-            new_count = self.values_list.count(label)
-            self.alter_colour_logic_condition(old_count, new_count, label, item, colour)
-            if self.count_to_green == 1 and self.count_to_red == 1:
-                break
-        
-    def alter_colour_logic_condition(self, old_count: int, new_count: int, label: str, item: wx.StaticText, colour: wx.Colour) -> None:
-        """
-        The conditional section of the for loop in the previous method, using if statements, it checks whether the count of the iterated item is lower or higher than before and that none have been changed based on the same conditions
+        labels = [item.GetLabel() for item in self.remaining_list]
+        shown = [self.colour_name(item.GetBackgroundColour()) for item in self.remaining_list]
+        for index, colour in self.RULES.colour_changes(old_list, self.values_list, labels, shown, self.score_totals):
+            self.remaining_list[index].SetBackgroundColour(wx.GREEN if colour == 'green' else wx.RED)
 
-        Args:
-        old_count (int): count of the current item's label within the previous selection of wx.Choice objects, used for conditional comparison
-        new_count (int): count of the current item's label within the new selection of wx.Choice objects, used for conditional comparison
-        label (str): value shown by the iterated item, used for counting in self.score_totals in order to create comparison 
-        item (wx.StaticText): current iterated object, updated in background colour when conditionals met
-        colour (wx.Colour): current background colour of item, used for conditional to prevent changing a colour to the same colour as before
-
-        Returns:
-        None
-        """
-        if self.count_to_green == 0 and colour != wx.GREEN and old_count < new_count:
-            item.SetBackgroundColour(wx.GREEN)
-            self.count_to_green = 1
-        elif self.count_to_red == 0 and colour != wx.RED and old_count > new_count and new_count < self.score_totals.count(label):
-            item.SetBackgroundColour(wx.RED)
-            self.count_to_red = 1
+    def colour_name(self, colour: wx.Colour) -> str:
+        """Names a background colour for CharacterRules.colour_changes, 'green', 'red' or None for anything else"""
+        if colour == wx.GREEN:
+            return 'green'
+        if colour == wx.RED:
+            return 'red'
+        return None
 
     def update_grid_data(self, score_dict: dict, sizer: wx.GridSizer) -> None: # ClassPage
         """
@@ -264,50 +234,25 @@ class GUIElements():
         Returns:
         None
         """
-        selection = event.GetString()
-        class_abilities = class_dict[selection]
-        for ability in grid_list:
-            abi_label = ability.GetLabel()
-            if abi_label in class_abilities and ability.GetBackgroundColour() != wx.GREEN:
-                ability.SetBackgroundColour(wx.GREEN)
-            elif abi_label not in class_abilities and ability.GetBackgroundColour() == wx.GREEN:
-                ability.SetBackgroundColour(wx.NullColour)
-    
-    def race_value_logic(self, ability_modified: list, score_modifier: dict, grid_list: list) -> None:
-        """
-        Called after the race choice event is called, handles logic for updating the windows in grid_list with new information based on the choice value selected
-        
-        Args:
-        ability_modified (list): list of keys from score_modifier used to compare the str to the ability in ABILITY_NAMES to check if an action is required or not
-        score_modifier (dict): generated by extracting the value using the race choice event object's data as the key in race_dict, the keys match abilities in ability_modified to obtain the value information to update the windows
-        grid_list (list): contains windows in a grid to be updated by the update_window_label method
+        self.highlight_abilities(grid_list, class_dict[event.GetString()])
 
-        Returns:
-        None
+    def highlight_abilities(self, grid_list: list, class_abilities: list) -> None:
         """
-        for i, ability in enumerate(self.CONSTANTS.ABILITY_NAMES):
-            if ability in ability_modified:
-                new_score = str(int(self.score_dict[ability]) + score_modifier[ability])
-                modifier = '+' + str(score_modifier[ability])
-                self.update_window_label(grid_list, i, new_score, modifier)
-            elif grid_list[i + self.CONSTANTS.SCORE_INDEX].GetLabel() != self.score_dict[ability]:
-                self.update_window_label(grid_list, i, self.score_dict[ability], '+0')
+        Sets the background of the ability name windows green for the class abilities and clears the rest, only touching windows whose colour changes
 
-    def update_window_label(self, grid_list: list, i: int, score: str, modifier: str) -> None:
-        """
-        Updates the labels of the windows in grid_list to be in line with the new values provided by the race_value_logic method
-        
         Args:
-        grid_list (list): windows in a grid that are to have their labels updated based on indexing and updated to values from race_value_logic
-        i (int): iterable index from the enumerate call in the loop in race_value_logic, used to index which column the window is in
-        score (str): value to update the label for the selected score window indexed by SCORE_INDEX, created by race_value_logic
-        modifier (str): value to update the label for the selected score window indexed by MODIFIER_INDEX, created by race_value_logic
+        grid_list (list): wx.StaticText windows holding the ability names
+        class_abilities (list): abilities of the chosen class, empty to clear every highlight
 
         Returns:
         None
         """
-        grid_list[i + self.CONSTANTS.SCORE_INDEX].SetLabel(score)
-        grid_list[i + self.CONSTANTS.MODIFIER_INDEX].SetLabel(modifier)
+        for ability in grid_list:
+            abi_label = ability.GetLabel()
+            if abi_label in class_abilities and ability.GetBackgroundColour() != wx.GREEN:
+                ability.SetBackgroundColour(wx.GREEN)
+            elif abi_label not in class_abilities and ability.GetBackgroundColour() == wx.GREEN:
+                ability.SetBackgroundColour(wx.NullColour)
 
 
 class RollDice(): #Roll5ePage
@@ -317,37 +262,31 @@ class RollDice(): #Roll5ePage
         self.score_dice = []
         self.score_totals = []
 
-    def roll_5e(self) -> tuple:
+    def roll_5e(self, expression: str = None) -> tuple:
         """
-        Simulates rolling 4d6 6 times and removing the lowest, populates the Roll5ePage in the main GUI
-        
+        Simulates rolling 4d6 6 times and removing the lowest, or rolling another dice expression 6 times, populates the Roll5ePage in the main GUI
+
+        Args:
+        expression (str): dice expression such as 3d6 or 2d6+6, 4d6kh3 when not given
+
         Returns:
         self.score_totals (list): holds the sum of each list in self.score_dice, used to populate a grid sizer with the scores
         self.score_dice (list): 6 lists holding 3 ints each, generated by removing the lowest from self.dice_rolled, used to identify which rolls are kept from each iteration and to generate self.score_totals
         self.dice_rolled (list): 6 lists of 4 ints each, random numbers populate each list in order, used to populate dice rolled display and to generate self.score_dice by removing the min
         """
-        for roll in range(6):
-            rolls = [randint(1, 6) for _ in range(4)]
-            min_dice = min(rolls)
-            self.dice_rolled.append(rolls.copy())
-            rolls.remove(min_dice)
-            self.score_dice.append(rolls.copy())
-        self.total_dice()
+        score_totals, self.score_dice, self.dice_rolled = CharacterRules().roll_5e(expression=expression)
+        self.score_totals = [str(total) for total in score_totals]
         return self.score_totals, self.score_dice, self.dice_rolled
     
-    def total_dice(self) -> None: # Can probably move into roll_5e
-        """Sums the dice from each list within self.score_dice, appends each total to self.score_totals used in the roll_5e method"""
-        for rolls in self.score_dice:
-            self.score_totals.append(str(sum(rolls)))
 
 
 class HalfElfElements():
     """Handles the elements required when the Half-Elf race is selected on ClassPage's race choice widget"""
-    def __init__(self, parent: wx.adv.WizardPageSimple, grid_window_list: list, c_page_sizer: wx.BoxSizer, constants_class: 'Constants') -> None:
+    def __init__(self, parent: wx.adv.WizardPageSimple, grid_model: 'ClassGridModel', c_page_sizer: wx.BoxSizer, constants_class: 'Constants') -> None:
         self.haelf_flag = 1
         self.haelf_show = 0
         self.parent = parent
-        self.grid_window_list = grid_window_list
+        self.grid_model = grid_model
         self.c_page_sizer = c_page_sizer
         self.CONSTANTS = constants_class
 
@@ -413,7 +352,7 @@ class HalfElfElements():
         
     def on_halfelf_choice(self, event: wx.Event) -> None:
         """
-        Event handler for the created choice widgets that contains logic to decide which values to update by indexing ABILITY_NAMES and the index of the event object in haelf_choice using the event object
+        Event handler for the created choice widgets, updates haelf_select at the index of the event object in haelf_choice and hands the picks to grid_model, which redraws only the abilities whose bonus moved
         
         Args:
         event (wx.Event): event object automatically generated by the Half-Elf choice widgets, used to get the current selection for indexing updates
@@ -423,49 +362,25 @@ class HalfElfElements():
         selection = event.GetString()
         choice_index = self.haelf_choice.index(event.GetEventObject())
         if self.haelf_select[choice_index] != selection:
-            index = self.CONSTANTS.ABILITY_NAMES.index(self.haelf_select[choice_index])
-            self.haelf_update_values(index, - 1)
             self.haelf_select[choice_index] = selection 
-            index = self.CONSTANTS.ABILITY_NAMES.index(selection)
-            self.haelf_update_values(index, 1)
             self.ability_modified = ['Charisma'] + self.haelf_select 
+            self.grid_model.set_haelf_select(self.haelf_select)
+
+class Constants(RuleConstants):
+    """List of constants used in the main GUI, the rules constants come from RuleConstants"""
+    _shared = None
 
-    def haelf_update_values(self, index: int, value_mod: int) -> None:
-        """
-        Update the values of windows in grid_window_list based on indices from on_halfelf_choice and values calculated in method
-        
-        Args:
-        index (int): index taken from on_halfelf_choice, used to determine the column to update
-        value_mod (int): +/- 1 based on whether the window's value is to be lowered when deselected or increased when selected in the choice widget
-        
-        Returns:
-        None
-        """
-        mod_window = self.grid_window_list[index + self.CONSTANTS.MODIFIER_INDEX]
-        score_window = self.grid_window_list[index + self.CONSTANTS.SCORE_INDEX]
-        for i, window in enumerate([mod_window, score_window]):
-            current = int(window.GetLabel())
-            new = str(current + value_mod)
-            if i == 0:
-                mod_update = '+' + new
-                mod_window.SetLabel(mod_update)
-            else:
-                score_update = new
-                score_window.SetLabel(score_update)
-
-class Constants():
-    """List of constants used in the main GUI"""
     def __init__(self):
-        self.POINTS_AVAILABLE_MAX = 27
-        self.COST_THRESHOLD = 13
-        self.MAX_POINTS = 15
-        self.MIN_POINTS = 8
-        self.HIGH_COST = 2
-        self.LOW_COST = 1
-        self.SCORE_INDEX = 6
-        self.MODIFIER_INDEX = 12
-        self.ABILITY_NAMES = ['Strength', 'Dexterity', 'Constitution', 'Intelligence', 'Wisdom', 'Charisma']
+        super().__init__()
+        self.TITLE_FONT = wx.Font(18, wx.FONTFAMILY_DEFAULT, wx.FONTSTYLE_NORMAL, wx.FONTWEIGHT_BOLD)
         self.FEATURE_FONT = wx.Font(20, wx.FONTFAMILY_DEFAULT, wx.FONTSTYLE_MAX, wx.FONTWEIGHT_BOLD)
         self.SUB_FONT = wx.Font(15, wx.FONTFAMILY_DEFAULT, wx.FONTSTYLE_NORMAL, wx.FONTWEIGHT_NORMAL)
 
+    @classmethod
+    def shared(cls) -> 'Constants':
+        """The one Constants instance used by the wizard and GUIElements, so its fonts are only created once. Needs the wx.App to exist"""
+        if cls._shared is None:
+            cls._shared = cls()
+        return cls._shared
+
 
@@ -0,0 +1,156 @@
+from functools import lru_cache
+from dnd_rules import CharacterRules
+
+BEST_ORDER_CACHE = 4096
+
+
+class RollAssigner():
+    """Assigns rolled totals to abilities the way a player would on AssignRollsPage, giving the class's primary abilities the best modifiers after race bonuses"""
+    def __init__(self, class_dict: dict, race_dict: dict, rules: CharacterRules = None):
+        self.class_dict = class_dict
+        self.race_dict = race_dict
+        self.RULES = rules if rules is not None else CharacterRules()
+        self.CONSTANTS = self.RULES.CONSTANTS
+        size = len(self.CONSTANTS.ABILITY_NAMES)
+        self.full = (1 << size) - 1
+        self.masks = sorted(range(self.full), key=lambda mask: bin(mask).count('1'), reverse=True)
+        self.ability_of = [bin(mask).count('1') for mask in range(self.full + 1)]
+        self.best_order = lru_cache(maxsize=BEST_ORDER_CACHE)(self.solve_order)
+
+    def tables(self, class_name: str, race: str, haelf_select: tuple = None) -> tuple:
+        """Race bonus and primary flag of each ability, in ABILITY_NAMES order, race None gives no bonus"""
+        abilities = self.CONSTANTS.ABILITY_NAMES
+        bonus = self.RULES.race_bonus(self.race_dict, race, haelf_select) if race is not None else {}
+        return [bonus.get(ability, 0) for ability in abilities], [int(ability in self.class_dict[class_name]) for ability in abilities]
+
+    def solve_order(self, rolls: tuple, class_name: str, race: str, haelf_select: tuple = None, minimums: tuple = None) -> tuple:
+        """
+        Finds the best assignment of a sorted set of rolls with a dynamic programme over the subsets of rolls already used, 64 states instead of 720 permutations. Call it as best_order, the same function behind a per instance LRU cache of the BEST_ORDER_CACHE most recent roll sets, class and race, so a long lived assigner stays bounded and goes away with its instance
+
+        The best assignment has the highest sum of primary ability modifiers, then the highest sum of all modifiers, ties give earlier abilities the higher rolls
+
+        Args:
+        rolls (tuple): rolled totals as ints in ascending order, the cache key along with the other arguments
+        class_name (str): key of class_dict
+        race (str): key of race_dict, or None for no race bonus
+        haelf_select (tuple): the Half-Elf picks, only used for Half-Elf
+        minimums (tuple): lowest roll each ability may get, in ABILITY_NAMES order, None for no limits
+
+        Returns:
+        tuple: the roll given to each ability, in ABILITY_NAMES order
+        """
+        if len(rolls) != len(self.CONSTANTS.ABILITY_NAMES):
+            raise ValueError(f'Need {len(self.CONSTANTS.ABILITY_NAMES)} rolls, got {list(rolls)}')
+        bonuses, primary = self.tables(class_name, race, haelf_select)
+        minimums = minimums if minimums is not None else (0,) * len(rolls)
+        full = self.full
+        best = [None] * (full + 1)
+        best[full] = (0, 0)
+        choice = [0] * full
+        for mask in self.masks:
+            ability = self.ability_of[mask]
+            for index in range(len(rolls) - 1, -1, -1):
+                if mask >> index & 1 or rolls[index] < minimums[ability] or best[mask | 1 << index] is None:
+                    continue
+                modifier = (rolls[index] + bonuses[ability] - 10) // 2
+                primary_sum, total_sum = best[mask | 1 << index]
+                value = (primary_sum + modifier * primary[ability], total_sum + modifier)
+                if best[mask] is None or value > best[mask]:
+                    best[mask] = value
+                    choice[mask] = index
+        if best[0] is None:
+            raise ValueError(f'Rolls {list(rolls)} cannot cover the minimums {list(minimums)}')
+        order = []
+        mask = 0
+        while mask != full:
+            order.append(rolls[choice[mask]])
+            mask |= 1 << choice[mask]
+        return tuple(order)
+
+    def assign(self, score_totals: list, class_name: str, race: str, haelf_select: list = None, minimums: list = None) -> dict:
+        """
+        Creates the score_dict AssignRollsPage would give for the best assignment
+
+        Args:
+        score_totals (list): rolled totals as str or int, in any order
+        class_name (str): key of class_dict
+        race (str): key of race_dict
+        haelf_select (list): the Half-Elf picks, only used for Half-Elf
+        minimums (list): lowest roll each ability may get, in ABILITY_NAMES order, e.g. from ConditionalRoller.minimum_list, raising ValueError when the rolls cannot cover them
+
+        Returns:
+        dict: ability names as keys and int base scores, before race bonuses, as values
+        """
+        rolls = tuple(sorted(int(total) for total in score_totals))
+        picks = tuple(haelf_select) if haelf_select is not None else None
+        limits = tuple(minimums) if minimums is not None else None
+        return self.RULES.assign_rolls(score_totals, self.best_order(rolls, class_name, race, picks, limits))
+
+    def assign_batch(self, rolls, class_name: str, race: str, haelf_select: list = None):
+        """
+        Assigns many sets of rolls for one class and race, running solve_sorted once on the distinct sorted sets, rows are packed into one int64 key each so finding the distinct sets is a 1-D unique
+
+        Args:
+        rolls (numpy.ndarray): shape (count, 6), one set of totals per row, e.g. from BatchRoller.roll_totals_batch
+        class_name (str): key of class_dict
+        race (str): key of race_dict
+        haelf_select (list): the Half-Elf picks, only used for Half-Elf
+
+        Returns:
+        numpy.ndarray: shape (count, 6) and the dtype of rolls, base scores in ABILITY_NAMES order
+        """
+        import numpy as np
+        ordered = np.sort(rolls, axis=1)
+        bits = 8 * ordered.dtype.itemsize
+        if bits * ordered.shape[1] <= 64:
+            keys = ((ordered.astype(np.int64) & ((1 << bits) - 1)) << np.arange(0, bits * ordered.shape[1], bits, dtype=np.int64)).sum(axis=1)
+            _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+            unique = ordered[first]
+        else:
+            unique, inverse = np.unique(ordered, axis=0, return_inverse=True)
+        return self.solve_sorted(unique, class_name, race, haelf_select)[inverse.reshape(-1)]
+
+    def solve_sorted(self, unique, class_name: str, race: str, haelf_select: list = None):
+        """
+        Runs the solve_order programme on many sets of rolls at once as numpy arrays
+
+        Args:
+        unique (numpy.ndarray): shape (count, 6), each row sorted ascending
+        class_name (str): key of class_dict
+        race (str): key of race_dict, or None for no race bonus
+        haelf_select (list): the Half-Elf picks, only used for Half-Elf
+
+        Returns:
+        numpy.ndarray: shape (count, 6) and the dtype of unique, base scores in ABILITY_NAMES order
+        """
+        import numpy as np
+        picks = tuple(haelf_select) if haelf_select is not None else None
+        bonuses, primary = self.tables(class_name, race, picks)
+        values = unique.astype(np.int32)
+        size = values.shape[1]
+        full = self.full
+        primary_best = np.zeros((full + 1, len(values)), dtype=np.int32)
+        total_best = np.zeros((full + 1, len(values)), dtype=np.int32)
+        choice = np.zeros((full, len(values)), dtype=np.int8)
+        for mask in self.masks:
+            ability = self.ability_of[mask]
+            found = False
+            for index in range(size - 1, -1, -1):
+                if mask >> index & 1:
+                    continue
+                modifier = (values[:, index] + bonuses[ability] - 10) // 2
+                primary_sum = primary_best[mask | 1 << index] + modifier * primary[ability]
+                total_sum = total_best[mask | 1 << index] + modifier
+                better = (primary_sum > primary_best[mask]) | ((primary_sum == primary_best[mask]) & (total_sum > total_best[mask])) if found else True
+                primary_best[mask] = np.where(better, primary_sum, primary_best[mask])
+                total_best[mask] = np.where(better, total_sum, total_best[mask])
+                choice[mask] = np.where(better, index, choice[mask])
+                found = True
+        solved = np.empty_like(unique)
+        rows = np.arange(len(unique))
+        mask = np.zeros(len(unique), dtype=np.int64)
+        for ability in range(size):
+            index = choice[mask, rows]
+            solved[:, ability] = unique[rows, index]
+            mask |= 1 << index.astype(np.int64)
+        return solved
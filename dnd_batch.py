@@ -0,0 +1,287 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dnd_assign import RollAssigner
+from dnd_conditional import ConditionalRoller
+from dnd_dice import compile_expression
+from dnd_graph import CharacterGraph
+from dnd_export import FORMATS, CharacterExporter
+from dnd_rules import CharacterRules
+from dnd_rules_cache import RULES_FILE, load_rules
+from dnd_storage import CharacterStore
+from dnd_table import SCORE_MAX, SCORE_MIN, CharacterTable
+
+METHODS = ['roll', 'point-buy']
+ASSIGNMENTS = ['rolled', 'optimal']
+
+
+class BatchGenerator():
+    """Generates complete characters without the wizard, the same steps the pages take from method choice to modifiers"""
+    def __init__(self, class_dict: dict, race_dict: dict, rules: CharacterRules = None, point_buys: list = None, assign: str = 'rolled', dice: str = None, minimum: int = None):
+        self.class_dict = class_dict
+        self.race_dict = race_dict
+        self.RULES = rules if rules is not None else CharacterRules()
+        self.CONSTANTS = self.RULES.CONSTANTS
+        self.class_names = list(class_dict.keys())
+        self.race_names = list(race_dict.keys())
+        self.point_buys = point_buys
+        if assign not in ASSIGNMENTS:
+            raise ValueError(f'Unknown assignment {assign}, expected one of {ASSIGNMENTS}')
+        self.assign = assign
+        self.dice = compile_expression(dice).text if dice else None
+        if minimum is not None and self.dice is not None:
+            raise ValueError('minimum only works with the 4d6kh3 tables, not with a dice expression')
+        self.minimum = minimum
+        self.conditional = ConditionalRoller(self.CONSTANTS)
+        self.graph = CharacterGraph(class_dict, race_dict, self.RULES)
+        self.assigner = RollAssigner(class_dict, race_dict, self.RULES)
+
+    def chunk_rng(self, seed: int, chunk: int) -> random.Random:
+        """
+        Creates the random stream for one chunk, seeded from the run seed and chunk number so results do not depend on which worker runs the chunk
+
+        Args:
+        seed (int): seed of the whole run
+        chunk (int): chunk number
+
+        Returns:
+        random.Random: independent generator for the chunk
+        """
+        return random.Random(f'{seed}-{chunk}')
+
+    def point_buy_choices(self) -> list:
+        """Lists every allocation that spends all the points, built once per process"""
+        if self.point_buys is None:
+            from dnd_point_buy_index import PointBuyIndex
+            self.point_buys = PointBuyIndex(self.RULES).find(spent=self.CONSTANTS.POINTS_AVAILABLE_MAX)
+        return self.point_buys
+
+    def base_scores(self, method: str, rng: random.Random) -> dict:
+        """
+        Creates the score_dict before race bonuses, rolls of the dice expression are assigned to abilities in the order rolled, generate_character reassigns them when assign is optimal
+
+        Args:
+        method (str): 'roll' or 'point-buy'
+        rng (random.Random): generator for the character
+
+        Returns:
+        dict: ability names as keys and int scores as values
+        """
+        if method == 'roll':
+            score_totals = self.RULES.roll_5e(rng, self.dice)[0]
+            return self.RULES.assign_rolls(score_totals, score_totals)
+        if method == 'point-buy':
+            return dict(zip(self.CONSTANTS.ABILITY_NAMES, rng.choice(self.point_buy_choices())))
+        raise ValueError(f'Unknown method {method}, expected one of {METHODS}')
+
+    def half_elf_picks(self, rng: random.Random) -> list:
+        """Picks two different abilities other than Charisma for a Half-Elf"""
+        return rng.sample([ability for ability in self.CONSTANTS.ABILITY_NAMES if ability != 'Charisma'], len(self.CONSTANTS.HALF_ELF_DEFAULT))
+
+    def finish(self, score_dict: dict, class_name: str, race: str, haelf_select: list = None) -> tuple:
+        """Runs base scores, class and race through the CharacterGraph ClassPage uses, giving what CharacterRules.finalise gives"""
+        self.graph.set_scores(score_dict)
+        self.graph.set_class(class_name)
+        self.graph.set_race(race, haelf_select)
+        return self.graph.finalise()
+
+    def generate_character(self, method: str, rng: random.Random) -> dict:
+        """
+        Generates one complete character
+
+        Args:
+        method (str): 'roll', 'point-buy' or 'mixed' to pick one at random
+        rng (random.Random): generator for the character
+
+        Returns:
+        dict: 'method', 'character', 'scores' and 'modifiers' keys, the last three holding what FinalisePage.write_file saves
+        """
+        if method == 'mixed':
+            method = rng.choice(METHODS)
+        if method == 'roll' and self.minimum is not None:
+            return self.generate_qualified(rng)
+        score_dict = self.base_scores(method, rng)
+        class_name = rng.choice(self.class_names)
+        race = rng.choice(self.race_names)
+        haelf_select = self.half_elf_picks(rng) if race == self.CONSTANTS.HALF_ELF else None
+        if method == 'roll' and self.assign == 'optimal':
+            score_dict = self.assigner.assign(list(score_dict.values()), class_name, race, haelf_select)
+        character_dict, score_dict, modifier_dict = self.finish(score_dict, class_name, race, haelf_select)
+        return {'method': method, 'character': character_dict, 'scores': score_dict, 'modifiers': modifier_dict}
+
+    def generate_qualified(self, rng: random.Random) -> dict:
+        """
+        Generates one rolled character whose class abilities are all at least minimum before race bonuses, drawn with ConditionalRoller instead of rerolling until one qualifies
+
+        Args:
+        rng (random.Random): generator for the character
+
+        Returns:
+        dict: as generate_character gives, the class abilities hold the qualifying rolls, assigned with RollAssigner within the minimums when assign is optimal
+        """
+        class_name = rng.choice(self.class_names)
+        race = rng.choice(self.race_names)
+        haelf_select = self.half_elf_picks(rng) if race == self.CONSTANTS.HALF_ELF else None
+        minimums = self.conditional.class_minimums(self.class_dict[class_name], self.minimum)
+        score_totals = self.conditional.sample_totals(minimums, rng)
+        if self.assign == 'optimal':
+            score_dict = self.assigner.assign(score_totals, class_name, race, haelf_select, self.conditional.minimum_list(minimums))
+        else:
+            score_dict = self.conditional.assign(score_totals, minimums)
+        character_dict, score_dict, modifier_dict = self.finish(score_dict, class_name, race, haelf_select)
+        return {'method': 'roll', 'character': character_dict, 'scores': score_dict, 'modifiers': modifier_dict}
+
+    def generate_chunk(self, method: str, seed: int, chunk: int, count: int) -> list:
+        """
+        Generates the characters of one chunk
+
+        Args:
+        method (str): passed to generate_character
+        seed (int): seed of the whole run
+        chunk (int): chunk number, selects the random stream
+        count (int): characters in the chunk
+
+        Returns:
+        list: character dicts from generate_character
+        """
+        rng = self.chunk_rng(seed, chunk)
+        return [self.generate_character(method, rng) for _ in range(count)]
+
+
+_worker_generator = None
+
+
+def _init_worker(class_dict: dict, race_dict: dict, point_buys: list, assign: str = 'rolled', dice: str = None, minimum: int = None) -> None:
+    """Process pool initialiser, builds one BatchGenerator per worker process"""
+    global _worker_generator
+    _worker_generator = BatchGenerator(class_dict, race_dict, point_buys=point_buys, assign=assign, dice=dice, minimum=minimum)
+
+
+def _run_chunk(job: tuple) -> list:
+    """Process pool task, generates one chunk with the worker's BatchGenerator"""
+    return _worker_generator.generate_chunk(*job)
+
+
+def chunk_jobs(count: int, chunk_size: int, method: str, seed: int) -> list:
+    """
+    Splits a run into chunk jobs, the split only depends on count and chunk_size so the output is the same for any worker count
+
+    Args:
+    count (int): characters in the run
+    chunk_size (int): characters per chunk
+    method (str): generation method
+    seed (int): seed of the run
+
+    Returns:
+    list: (method, seed, chunk, chunk_count) tuples
+    """
+    return [(method, seed, chunk, min(chunk_size, count - start)) for chunk, start in enumerate(range(0, count, chunk_size))]
+
+
+def generate(count: int, method: str = 'mixed', seed: int = 0, workers: int = None, chunk_size: int = 10000, rules_file: str = RULES_FILE, assign: str = 'rolled', dice: str = None, minimum: int = None):
+    """
+    Generates count characters across a process pool, yielding chunks of character dicts in chunk order
+
+    Args:
+    count (int): characters to generate
+    method (str): 'roll', 'point-buy' or 'mixed'
+    seed (int): seed of the run
+    workers (int): worker processes, defaults to the CPU count, 1 runs in this process
+    chunk_size (int): characters per chunk
+    rules_file (str): class and race data file
+    assign (str): 'rolled' keeps rolls in the order rolled, 'optimal' assigns them with RollAssigner for the chosen class and race
+    dice (str): dice expression rolled for each score, 4d6kh3 when not given
+    minimum (int): when given, rolled characters have every class ability at least this before race bonuses
+
+    Yields:
+    list: character dicts from BatchGenerator.generate_character
+    """
+    race_class = load_rules(rules_file)
+    generator = BatchGenerator(race_class.class_dict, race_class.race_dict, assign=assign, dice=dice, minimum=minimum)
+    point_buys = generator.point_buy_choices() if method != 'roll' else None
+    jobs = chunk_jobs(count, chunk_size, method, seed)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        for job in jobs:
+            yield generator.generate_chunk(*job)
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(race_class.class_dict, race_class.race_dict, point_buys, assign, dice, minimum)) as executor:
+        yield from executor.map(_run_chunk, jobs)
+
+
+def dice_argument(text: str) -> str:
+    """Checks a --dice expression while parsing the command line, so a typo is reported before any worker starts"""
+    try:
+        return compile_expression(text).text
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error))
+
+
+def parse_args(argv: list = None) -> argparse.Namespace:
+    """Parses the command line arguments of the batch generator"""
+    parser = argparse.ArgumentParser(description='Generate characters in bulk without the wizard')
+    parser.add_argument('-n', '--count', type=int, default=1000, help='number of characters to generate')
+    parser.add_argument('-m', '--method', choices=METHODS + ['mixed'], default='mixed', help='ability score method')
+    parser.add_argument('-a', '--assign', choices=ASSIGNMENTS, default='rolled', help='rolled keeps rolls in rolled order, optimal gives the class its best modifiers')
+    parser.add_argument('-d', '--dice', type=dice_argument, default=None, help='dice expression rolled for each score, e.g. 3d6, 4d6r1kh3 or 2d6+6, 4d6kh3 by default')
+    parser.add_argument('--minimum', type=int, default=None, help='rolled characters get every class ability at least this before race bonuses, e.g. 13 for multiclass prerequisites')
+    parser.add_argument('-s', '--seed', type=int, default=0, help='seed of the run, the output is the same for any worker count')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='worker processes, defaults to the CPU count')
+    parser.add_argument('--chunk-size', type=int, default=10000, help='characters per chunk')
+    parser.add_argument('--rules', default=RULES_FILE, help='class and race data file')
+    parser.add_argument('-o', '--output', default='-', help='JSON lines output file, - for stdout, ignored with --output-dir')
+    parser.add_argument('--output-dir', default=None, help='write sharded files to this folder through CharacterExporter')
+    parser.add_argument('--format', choices=list(FORMATS), default='jsonl', help='shard format with --output-dir')
+    parser.add_argument('--shard-mb', type=int, default=256, help='rotate shards after this many megabytes with --output-dir')
+    parser.add_argument('--gzip', action='store_true', help='gzip shards with --output-dir')
+    parser.add_argument('--database', default=None, help='save to this SQLite database through CharacterStore instead of files')
+    parser.add_argument('--table', default=None, help='save to a new memory mapped CharacterTable at this path instead of files')
+    args = parser.parse_args(argv)
+    if args.minimum is not None and args.dice is not None:
+        parser.error('--minimum only works with the default 4d6kh3 dice')
+    if args.table and args.dice is not None:
+        dice = compile_expression(args.dice)
+        bonuses = [bonus for race in load_rules(args.rules).race_dict.values() for bonus in race.values()] + [0, 1]
+        if dice.maximum is None or dice.minimum + min(bonuses) < SCORE_MIN or dice.maximum + max(bonuses) > SCORE_MAX:
+            parser.error(f'--table holds scores from {SCORE_MIN} to {SCORE_MAX}, {args.dice} with race bonuses can roll outside that')
+    return args
+
+
+def main(argv: list = None) -> None:
+    """Runs the batch generator from the command line and reports throughput on stderr"""
+    args = parse_args(argv)
+    start = time.perf_counter()
+    written = 0
+    chunks = generate(args.count, args.method, args.seed, args.workers, args.chunk_size, args.rules, args.assign, args.dice, args.minimum)
+    if args.database:
+        with CharacterStore(args.database) as store:
+            for chunk in chunks:
+                written += store.save_many(chunk)
+    elif args.table:
+        race_class = load_rules(args.rules)
+        with CharacterTable.create(args.table, race_class.class_dict, race_class.race_dict) as table:
+            for chunk in chunks:
+                written += table.append_records(chunk, args.seed)
+    elif args.output_dir:
+        with CharacterExporter(args.output_dir, args.format, max_bytes=args.shard_mb * 1024 * 1024, compress=args.gzip) as exporter:
+            for chunk in chunks:
+                written += exporter.write_many(chunk)
+    else:
+        output = sys.stdout if args.output == '-' else open(args.output, 'w')
+        try:
+            for chunk in chunks:
+                output.write(''.join(json.dumps(character) + '\n' for character in chunk))
+                written += len(chunk)
+        finally:
+            if output is not sys.stdout:
+                output.close()
+    elapsed = time.perf_counter() - start
+    print(f'Generated {written} characters in {elapsed:.2f}s ({written / elapsed if elapsed else 0:.0f} characters/s)', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+import numpy as np
+from dnd_dice import compile_expression
+from dnd_rules import RuleConstants
+
+
+class BatchRoller():
+    """Rolls 4d6 and removes the lowest, or rolls another dice expression, for many characters at once, with numpy arrays in place of RollDice's lists"""
+    def __init__(self, seed: int = None, constants: RuleConstants = None, expression: str = None):
+        self.CONSTANTS = constants if constants is not None else RuleConstants()
+        self.rng = np.random.default_rng(seed)
+        self.dice = compile_expression(expression or self.CONSTANTS.ROLL_EXPRESSION)
+
+    def roll_5e_batch(self, count: int) -> tuple:
+        """
+        Rolls count characters in one vectorized pass, the same shapes RollDice.roll_5e gives for one character
+
+        Args:
+        count (int): number of characters to roll
+
+        Returns:
+        score_totals (np.ndarray): int8 of shape (count, 6), the total of each roll, a wider type for expressions that need one
+        score_dice (np.ndarray): int8 of shape (count, 6, 3), the dice kept after removing the lowest, in rolled order
+        dice_rolled (np.ndarray): int8 of shape (count, 6, 4), the dice in the order they were rolled
+        """
+        return self.dice.roll_batch(self.rng, (count, self.CONSTANTS.ROLLS_PER_CHARACTER))
+
+    def roll_totals_batch(self, count: int) -> np.ndarray:
+        """
+        Rolls count characters and keeps only the totals, skipping the kept dice array
+
+        Args:
+        count (int): number of characters to roll
+
+        Returns:
+        np.ndarray: int8 of shape (count, 6), a wider type for expressions that need one
+        """
+        return self.dice.sample(self.rng, (count, self.CONSTANTS.ROLLS_PER_CHARACTER))
+
+    def iter_batches(self, total: int, chunk_size: int = 1_000_000, totals_only: bool = False):
+        """
+        Yields roll batches of at most chunk_size characters until total characters have been rolled
+
+        Args:
+        total (int): number of characters to roll overall
+        chunk_size (int): largest batch held in memory at once
+        totals_only (bool): True to yield roll_totals_batch arrays instead of roll_5e_batch tuples
+
+        Yields:
+        tuple or np.ndarray: one batch per chunk
+        """
+        roll = self.roll_totals_batch if totals_only else self.roll_5e_batch
+        remaining = total
+        while remaining > 0:
+            count = min(chunk_size, remaining)
+            yield roll(count)
+            remaining -= count
@@ -0,0 +1,141 @@
+import sys
+from array import array
+from dnd_rules import RuleConstants
+
+
+class CharacterCodes():
+    """Interns class and race names as small int codes, so a Character holds two ints where the dicts hold two strings"""
+    def __init__(self, class_names=(), race_names=()):
+        self.class_names = []
+        self.class_codes = {}
+        self.race_names = []
+        self.race_codes = {}
+        for name in class_names:
+            self.class_code(name)
+        for name in race_names:
+            self.race_code(name)
+
+    @classmethod
+    def from_rules(cls, class_dict: dict, race_dict: dict) -> 'CharacterCodes':
+        """Codes numbered in rules file order, from initRaceClass or load_rules dicts"""
+        return cls(class_dict, race_dict)
+
+    def code(self, name: str, names: list, codes: dict) -> int:
+        """Code of name in one table, adding name when it is new, -1 for None"""
+        if name is None:
+            return -1
+        code = codes.get(name)
+        if code is None:
+            name = sys.intern(name)
+            code = codes[name] = len(names)
+            names.append(name)
+        return code
+
+    def class_code(self, name: str) -> int:
+        """Code of a class name, adding it when new"""
+        return self.code(name, self.class_names, self.class_codes)
+
+    def race_code(self, name: str) -> int:
+        """Code of a race name, adding it when new"""
+        return self.code(name, self.race_names, self.race_codes)
+
+    def class_name(self, code: int) -> str:
+        """Class name of a code, None for -1"""
+        return self.class_names[code] if code >= 0 else None
+
+    def race_name(self, code: int) -> str:
+        """Race name of a code, None for -1"""
+        return self.race_names[code] if code >= 0 else None
+
+
+class Character():
+    """
+    One character as int scores and class/race codes, about an eighth of the memory of the character_dict, score_dict and modifier_dict it replaces
+
+    scores are held as bytes in ABILITY_NAMES order, so indexing gives ints and modifiers are worked out when asked for. Scores outside 0 to 255, which dice expressions such as 1d20-5 or 1d300 can roll, are held in a signed int array instead
+    """
+    __slots__ = ('scores', 'class_code', 'race_code', 'method', 'name')
+    CONSTANTS = RuleConstants()
+
+    def __init__(self, scores, class_code: int = -1, race_code: int = -1, method: str = None, name: str = None):
+        if len(scores) != len(self.CONSTANTS.ABILITY_NAMES):
+            raise ValueError(f'Character needs {len(self.CONSTANTS.ABILITY_NAMES)} scores, got {list(scores)}')
+        scores = [int(score) for score in scores]
+        self.scores = bytes(scores) if all(0 <= score <= 255 for score in scores) else array('i', scores)
+        self.class_code = class_code
+        self.race_code = race_code
+        self.method = sys.intern(method) if method is not None else None
+        self.name = name
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Character):
+            return NotImplemented
+        return all(getattr(self, slot) == getattr(other, slot) for slot in self.__slots__)
+
+    def __repr__(self) -> str:
+        return f'Character({list(self.scores)}, {self.class_code}, {self.race_code}, {self.method!r}, {self.name!r})'
+
+    @classmethod
+    def from_dicts(cls, character_dict: dict, score_dict: dict, codes: CharacterCodes, method: str = None, name: str = None) -> 'Character':
+        """
+        Creates a Character from the dicts the wizard pages pass along
+
+        Args:
+        character_dict (dict): 'Class' and 'Race' keys, either may be missing
+        score_dict (dict): ability names as keys, scores as str or int values
+        codes (CharacterCodes): table the class and race are interned in
+        method (str): generation method, optional
+        name (str): character name, optional
+
+        Returns:
+        Character: the compact character
+        """
+        scores = [int(score_dict[ability]) for ability in cls.CONSTANTS.ABILITY_NAMES]
+        return cls(scores, codes.class_code(character_dict.get('Class')), codes.race_code(character_dict.get('Race')), method, name)
+
+    @classmethod
+    def from_record(cls, record: dict, codes: CharacterCodes) -> 'Character':
+        """Creates a Character from the batch generator's dict form, with 'character' and 'scores' keys and optional 'method' and 'name'"""
+        return cls.from_dicts(record['character'], record['scores'], codes, record.get('method'), record.get('name'))
+
+    def modifiers(self) -> tuple:
+        """Ability modifiers as ints, in ABILITY_NAMES order"""
+        return tuple((score - 10) // 2 for score in self.scores)
+
+    def score_dict(self, as_str: bool = False) -> dict:
+        """Ability names as keys and scores as values, as str when as_str is True like the wizard pages use"""
+        return {ability: str(score) if as_str else score for ability, score in zip(self.CONSTANTS.ABILITY_NAMES, self.scores)}
+
+    def modifier_dict(self) -> dict:
+        """Ability names as keys and int modifiers as values"""
+        return dict(zip(self.CONSTANTS.ABILITY_NAMES, self.modifiers()))
+
+    def character_dict(self, codes: CharacterCodes) -> dict:
+        """'Class' and 'Race' keys as write_file saves them, leaving out a missing class or race"""
+        character_dict = {}
+        if self.class_code >= 0:
+            character_dict['Class'] = codes.class_name(self.class_code)
+        if self.race_code >= 0:
+            character_dict['Race'] = codes.race_name(self.race_code)
+        return character_dict
+
+    def to_dicts(self, codes: CharacterCodes) -> tuple:
+        """
+        The three dicts FinalisePage.write_file saves
+
+        Args:
+        codes (CharacterCodes): table the class and race codes came from
+
+        Returns:
+        character_dict (dict): 'Class' and 'Race' keys
+        score_dict (dict): int scores
+        modifier_dict (dict): int modifiers
+        """
+        return self.character_dict(codes), self.score_dict(), self.modifier_dict()
+
+    def to_record(self, codes: CharacterCodes) -> dict:
+        """The batch generator's dict form, which CharacterExporter.write_many and CharacterStore.save_many take"""
+        record = {'method': self.method, 'character': self.character_dict(codes), 'scores': self.score_dict(), 'modifiers': self.modifier_dict()}
+        if self.name is not None:
+            record['name'] = self.name
+        return record
@@ -0,0 +1,213 @@
+import random
+from bisect import bisect_right
+from itertools import accumulate, combinations_with_replacement, product
+from math import factorial, prod
+from dnd_probability import cached_table
+from dnd_rules import RuleConstants
+
+
+class ConditionalRoller():
+    """
+    Rolls characters whose 4d6 drop lowest scores meet minimums, drawing straight from the distribution rejection sampling gives instead of rerolling until one passes
+
+    Every table holds whole number outcome counts, so picks are exact: a score's weight is its count out of 6^4 dice outcomes, and a sorted set of six scores weighs the number of ordered ways to roll it times its scores' counts. Minimums can apply to the scores in rolled order, where each score is drawn from its own cut down table, or to whichever scores the player assigns, where the sorted set is drawn from the sets that can cover the minimums and then put in a random rolled order. Tables are built once per instance and handed out read only
+    """
+    def __init__(self, constants: RuleConstants = None):
+        self.CONSTANTS = constants if constants is not None else RuleConstants()
+        self.rolls = self.CONSTANTS.ROLLS_PER_CHARACTER
+        self.tables = {}
+
+    @cached_table
+    def dice_table(self) -> dict:
+        """
+        Every ordered roll of the dice grouped by score, each equally likely, so a uniform pick from one group gives the dice for that score
+
+        Returns:
+        dict: score as keys and a tuple of dice tuples, in rolled order, as values, ascending score order
+        """
+        table = {}
+        for dice in product(range(1, self.CONSTANTS.DICE_SIDES + 1), repeat=self.CONSTANTS.DICE_PER_ROLL):
+            table.setdefault(sum(dice) - min(dice), []).append(dice)
+        return {score: tuple(table[score]) for score in sorted(table)}
+
+    @cached_table
+    def score_counts(self) -> dict:
+        """Score as keys and the number of dice outcomes giving it as values"""
+        return {score: len(dice) for score, dice in self.dice_table().items()}
+
+    @cached_table
+    def score_table(self, minimum: int) -> tuple:
+        """
+        Scores of at least minimum with their running outcome counts, for a bisect pick
+
+        Returns:
+        scores (tuple): ascending
+        cumulative (tuple): running count total, the last entry being the number of outcomes
+        """
+        counts = {score: count for score, count in self.score_counts().items() if score >= minimum}
+        if not counts:
+            raise ValueError(f'No roll reaches {minimum}')
+        return tuple(counts), tuple(accumulate(counts.values()))
+
+    @cached_table
+    def multiset_table(self, requirement: tuple) -> tuple:
+        """
+        Sorted sets of scores that can cover a requirement, with their running outcome counts
+
+        Args:
+        requirement (tuple): the minimums sorted highest first, a set covers it when its own scores sorted highest first are each at least the minimum in the same place
+
+        Returns:
+        multisets (tuple): tuples of scores sorted highest first
+        cumulative (tuple): running count total, the last entry being the number of ordered outcomes
+        """
+        counts = self.score_counts()
+        ordering = factorial(self.rolls)
+        multisets, weights = [], []
+        for scores in combinations_with_replacement(sorted(counts, reverse=True), self.rolls):
+            if all(score >= minimum for score, minimum in zip(scores, requirement)):
+                multisets.append(scores)
+                weights.append(ordering // prod(factorial(scores.count(score)) for score in set(scores)) * prod(counts[score] for score in scores))
+        if not multisets:
+            raise ValueError(f'No roll can cover the minimums {list(requirement)}')
+        return tuple(multisets), tuple(accumulate(weights))
+
+    def minimum_list(self, minimums) -> list:
+        """
+        Minimums in ABILITY_NAMES order
+
+        Args:
+        minimums (dict or list): ability names as keys and minimum scores as values, missing abilities having none, or 6 ints in ABILITY_NAMES order
+
+        Returns:
+        list: 6 ints, 0 for no minimum
+        """
+        if isinstance(minimums, dict):
+            unknown = [ability for ability in minimums if ability not in self.CONSTANTS.ABILITY_NAMES]
+            if unknown:
+                raise ValueError(f'Unknown abilities {unknown}')
+            return [minimums.get(ability, 0) for ability in self.CONSTANTS.ABILITY_NAMES]
+        if len(minimums) != self.rolls:
+            raise ValueError(f'Need {self.rolls} minimums, got {list(minimums)}')
+        return list(minimums)
+
+    def requirement(self, minimums) -> tuple:
+        """The minimums sorted highest first, the key of multiset_table"""
+        return tuple(sorted(self.minimum_list(minimums), reverse=True))
+
+    def class_minimums(self, class_abilities: list, minimum: int = 13) -> dict:
+        """Minimums for a class's prerequisites, e.g. Strength and Charisma 13 for a Paladin from its class_dict value"""
+        return {ability: minimum for ability in class_abilities}
+
+    def probability(self, minimums, assignable: bool = True) -> float:
+        """Chance a plain roll meets the minimums, 1 / probability is how many rolls rejection sampling needs on average"""
+        outcomes = sum(self.score_counts().values()) ** self.rolls
+        if assignable:
+            return self.multiset_table(self.requirement(minimums))[1][-1] / outcomes
+        return prod(self.score_table(minimum)[1][-1] for minimum in self.minimum_list(minimums)) / outcomes
+
+    def pick(self, values: tuple, cumulative: tuple, rng) -> object:
+        """Picks one of values with weights given as a running total, using a whole number draw so the pick is exact"""
+        return values[bisect_right(cumulative, rng.randrange(cumulative[-1]))]
+
+    def sample_totals(self, minimums, rng: random.Random = None, assignable: bool = True) -> list:
+        """
+        Rolls one set of 6 scores meeting the minimums, in rolled order
+
+        Args:
+        minimums (dict or list): see minimum_list
+        rng (random.Random): optional seeded generator, the random module is used when not given
+        assignable (bool): True when the scores only need to cover the minimums once assigned, False when each score in rolled order must meet its ability's minimum
+
+        Returns:
+        list: 6 ints
+        """
+        rng = rng if rng is not None else random
+        if not assignable:
+            return [self.pick(*self.score_table(minimum), rng) for minimum in self.minimum_list(minimums)]
+        score_totals = list(self.pick(*self.multiset_table(self.requirement(minimums)), rng))
+        rng.shuffle(score_totals)
+        return score_totals
+
+    def roll_dice(self, score: int, rng: random.Random = None) -> list:
+        """Dice in rolled order for a score, picked uniformly from the outcomes that give it"""
+        rng = rng if rng is not None else random
+        outcomes = self.dice_table()[score]
+        return list(outcomes[rng.randrange(len(outcomes))])
+
+    def roll_5e(self, minimums, rng: random.Random = None, assignable: bool = True) -> tuple:
+        """
+        Rolls one character meeting the minimums, in the shapes CharacterRules.roll_5e gives
+
+        Returns:
+        score_totals (list): 6 ints meeting the minimums
+        score_dice (list): 6 lists of 3 ints, the dice kept from each roll
+        dice_rolled (list): 6 lists of 4 ints, the dice in the order they were rolled
+        """
+        rng = rng if rng is not None else random
+        score_totals = self.sample_totals(minimums, rng, assignable)
+        dice_rolled, score_dice = [], []
+        for score in score_totals:
+            rolls = self.roll_dice(score, rng)
+            dice_rolled.append(rolls.copy())
+            rolls.remove(min(rolls))
+            score_dice.append(rolls)
+        return score_totals, score_dice, dice_rolled
+
+    def assign(self, score_totals: list, minimums) -> dict:
+        """
+        Creates a score_dict that meets the minimums, the highest rolls go to the abilities with the highest minimums and the rest keep their rolled order
+
+        Args:
+        score_totals (list): 6 scores that can cover the minimums, from sample_totals
+        minimums (dict or list): see minimum_list
+
+        Returns:
+        dict: ability names as keys and int scores as values
+        """
+        minimum_list = self.minimum_list(minimums)
+        abilities = self.CONSTANTS.ABILITY_NAMES
+        required = sorted((index for index, minimum in enumerate(minimum_list) if minimum > 0), key=lambda index: -minimum_list[index])
+        order = sorted(range(len(score_totals)), key=lambda index: -score_totals[index])
+        score_dict = {}
+        for ability_index, roll_index in zip(required, order):
+            if score_totals[roll_index] < minimum_list[ability_index]:
+                raise ValueError(f'Scores {score_totals} cannot cover the minimums {minimum_list}')
+            score_dict[abilities[ability_index]] = score_totals[roll_index]
+        rest = iter(score_totals[index] for index in sorted(order[len(required):]))
+        return {ability: score_dict[ability] if ability in score_dict else next(rest) for ability in abilities}
+
+    def sample_batch(self, count: int, minimums, rng=None, assignable: bool = True):
+        """
+        Rolls count sets of scores meeting the minimums at once, in rolled order
+
+        Args:
+        count (int): sets to roll
+        minimums (dict or list): see minimum_list
+        rng (numpy.random.Generator): generator to draw from, a fresh one when not given
+        assignable (bool): as for sample_totals
+
+        Returns:
+        numpy.ndarray: int8 of shape (count, 6)
+        """
+        import numpy as np
+        rng = rng if rng is not None else np.random.default_rng()
+        if not assignable:
+            columns = []
+            for minimum in self.minimum_list(minimums):
+                scores, cumulative = self.score_table(minimum)
+                columns.append(np.array(scores, dtype=np.int8)[np.searchsorted(cumulative, rng.integers(0, cumulative[-1], size=count), side='right')])
+            return np.stack(columns, axis=1) if count else np.zeros((0, self.rolls), dtype=np.int8)
+        multisets, cumulative = self.multiset_arrays(self.requirement(minimums))
+        picked = multisets[np.searchsorted(cumulative, rng.integers(0, cumulative[-1], size=count, dtype=np.int64), side='right')]
+        return rng.permuted(picked, axis=1)
+
+    @cached_table
+    def multiset_arrays(self, requirement: tuple) -> tuple:
+        """multiset_table as read only numpy arrays, int8 sets and int64 running counts, which hold the 6^24 outcomes of six rolls"""
+        import numpy as np
+        multisets, cumulative = self.multiset_table(requirement)
+        arrays = np.array(multisets, dtype=np.int8), np.array(cumulative, dtype=np.int64)
+        for array in arrays:
+            array.flags.writeable = False
+        return arrays
@@ -0,0 +1,313 @@
+import random
+import re
+from functools import lru_cache
+
+MAX_EXPLOSIONS = 100
+MAX_DICE = 1000
+MAX_SIDES = 1000
+DICE_PATTERN = re.compile(r'([+-]?)(\d*)d(\d+)')
+CONSTANT_PATTERN = re.compile(r'([+-]?)(\d+)')
+MODIFIER_PATTERN = re.compile(r'(kh|kl|k|dh|dl|d)(\d+)|(ro|r)(<=|>=|<|>|=)?(\d+)|!(<=|>=|<|>|=)?(\d*)')
+COMPARISONS = {
+    '=': lambda face, value: face == value,
+    '<': lambda face, value: face < value,
+    '>': lambda face, value: face > value,
+    '<=': lambda face, value: face <= value,
+    '>=': lambda face, value: face >= value,
+}
+
+
+class DiceTerm():
+    """
+    One NdS term of an expression with its modifiers, rolled in the order reroll, explode, then keep or drop
+
+    Rerolling with r repeats until the die shows a face outside the set, so it is a draw from the other faces. ro rerolls once and keeps the second roll. An exploding die rolls again on a face in its set and adds the rolls together, at most MAX_EXPLOSIONS times, so it still counts as one die for keep and drop
+    """
+    def __init__(self, count: int, sides: int, sign: int = 1):
+        self.count = count
+        self.sides = sides
+        self.sign = sign
+        self.keep = count
+        self.keep_highest = True
+        self.reroll = ()
+        self.reroll_once = False
+        self.explode = ()
+
+    def faces(self, comparison: str, value: int) -> tuple:
+        """Faces of the die that match a comparison such as <3"""
+        return tuple(face for face in range(1, self.sides + 1) if COMPARISONS[comparison](face, value))
+
+    def add_modifier(self, match: re.Match, text: str) -> None:
+        """Applies one kh3, dl1, r1, ro<3 or !>5 style modifier, raising ValueError for one that cannot be rolled"""
+        select, amount, reroll, reroll_comparison, reroll_value, explode_comparison, explode_value = match.groups()
+        if select:
+            if self.keep != self.count:
+                raise ValueError(f'Only one keep or drop is allowed per dice term in {text}')
+            amount = int(amount)
+            if amount > self.count:
+                raise ValueError(f'Cannot keep or drop {amount} of {self.count} dice in {text}')
+            self.keep = amount if select[0] == 'k' else self.count - amount
+            self.keep_highest = select in ('k', 'kh', 'dl', 'd')
+        elif reroll:
+            faces = self.faces(reroll_comparison or '=', int(reroll_value))
+            if len(faces) == self.sides:
+                raise ValueError(f'Rerolling every face of a d{self.sides} never stops in {text}')
+            self.reroll = faces
+            self.reroll_once = reroll == 'ro'
+        else:
+            faces = self.faces(explode_comparison or '=', int(explode_value)) if explode_value else (self.sides,)
+            if len(faces) == self.sides:
+                raise ValueError(f'Exploding on every face of a d{self.sides} never stops in {text}')
+            self.explode = faces
+
+    def allowed(self) -> tuple:
+        """Faces a die can end on after rerolling until it is outside the reroll set"""
+        return tuple(face for face in range(1, self.sides + 1) if face not in self.reroll)
+
+    def bounds(self) -> tuple:
+        """Lowest and highest total of the term, highest is None when it explodes"""
+        faces = self.allowed() if self.reroll and not self.reroll_once else range(1, self.sides + 1)
+        low, high = self.keep * min(faces), None if self.explode else self.keep * max(faces)
+        if self.sign < 0:
+            return -high if high is not None else None, -low
+        return low, high
+
+    def roll_die(self, rng) -> int:
+        """Rolls one die with its reroll and explode modifiers"""
+        if self.reroll and not self.reroll_once:
+            allowed = self.allowed()
+            face = allowed[rng.randrange(len(allowed))] if len(allowed) < self.sides else rng.randint(1, self.sides)
+        else:
+            face = rng.randint(1, self.sides)
+            if self.reroll_once and face in self.reroll:
+                face = rng.randint(1, self.sides)
+        total = face
+        for _ in range(MAX_EXPLOSIONS):
+            if face not in self.explode:
+                break
+            face = rng.randint(1, self.sides)
+            total += face
+        return total
+
+    def kept_indexes(self, rolled: list) -> list:
+        """Indexes of the kept dice in rolled order, of equal dice the earliest are dropped first"""
+        if self.keep == self.count:
+            return list(range(self.count))
+        order = sorted(range(self.count), key=lambda index: rolled[index] if self.keep_highest else -rolled[index])
+        return sorted(order[self.count - self.keep:])
+
+    def roll(self, rng) -> tuple:
+        """
+        Rolls the term once
+
+        Returns:
+        total (int): signed sum of the kept dice
+        kept (list): kept dice in rolled order
+        rolled (list): every die in rolled order
+        """
+        if self.reroll or self.explode:
+            rolled = [self.roll_die(rng) for _ in range(self.count)]
+        else:
+            randint, sides = rng.randint, self.sides
+            rolled = [randint(1, sides) for _ in range(self.count)]
+        if self.count - self.keep == 1:
+            kept = rolled.copy()
+            kept.remove(min(kept) if self.keep_highest else max(kept))
+        elif self.keep == self.count:
+            kept = rolled.copy()
+        else:
+            kept = [rolled[index] for index in self.kept_indexes(rolled)]
+        return self.sign * sum(kept), kept, rolled
+
+    def roll_array(self, rng, size: tuple):
+        """
+        Rolls the term for every position of size at once
+
+        Args:
+        rng (numpy.random.Generator): generator to draw from
+        size (tuple): leading shape, the dice go on a last axis of length count
+
+        Returns:
+        numpy.ndarray: every die, shape size + (count,), int8 while the faces fit
+        """
+        import numpy as np
+        shape = tuple(size) + (self.count,)
+        dtype = np.int8 if self.sides <= 127 and not self.explode else np.int32
+        if self.reroll and not self.reroll_once:
+            allowed = np.array(self.allowed(), dtype=dtype)
+            dice = allowed[rng.integers(0, len(allowed), size=shape)]
+        else:
+            dice = rng.integers(1, self.sides + 1, size=shape, dtype=dtype)
+            if self.reroll_once:
+                again = np.isin(dice, self.reroll)
+                dice[again] = rng.integers(1, self.sides + 1, size=int(again.sum()), dtype=dtype)
+        if self.explode:
+            live = np.isin(dice, self.explode)
+            for _ in range(MAX_EXPLOSIONS):
+                if not live.any():
+                    break
+                extra = rng.integers(1, self.sides + 1, size=int(live.sum()), dtype=dtype)
+                dice[live] += extra
+                live[live] = np.isin(extra, self.explode)
+        return dice
+
+    def keep_mask(self, dice):
+        """Boolean mask of the kept dice of roll_array, the numpy form of kept_indexes"""
+        import numpy as np
+        mask = np.ones(dice.shape, dtype=bool)
+        if self.keep != self.count:
+            order = np.argsort(dice if self.keep_highest else -dice, axis=-1, kind='stable')
+            np.put_along_axis(mask, order[..., :self.count - self.keep], False, axis=-1)
+        return mask
+
+    def total_array(self, dice):
+        """Signed sum of the kept dice of roll_array, dropping one die with min or max and more with a sort"""
+        import numpy as np
+        total = dice.sum(axis=-1, dtype=np.int32)
+        dropped = self.count - self.keep
+        if dropped == 1:
+            total -= dice.min(axis=-1) if self.keep_highest else dice.max(axis=-1)
+        elif dropped:
+            ordered = np.sort(dice, axis=-1)
+            total = ordered[..., dropped:].sum(axis=-1, dtype=np.int32) if self.keep_highest else ordered[..., :self.keep].sum(axis=-1, dtype=np.int32)
+        return self.sign * total
+
+
+class DiceExpression():
+    """
+    A compiled dice expression such as 4d6kh3, 3d6, 2d6+6, 1d20r1 or 3d6!, a sum of dice terms and whole numbers
+
+    Modifiers after NdS: kh/kl/k keep the highest or lowest n dice, dh/dl/d drop them, r rerolls a face (r<3 for a range) until it stops coming up, ro rerolls once, ! explodes on the highest face (!>5 for a range). An expression rolls at most MAX_DICE dice of at most MAX_SIDES sides and adds at most MAX_DICE * MAX_SIDES, so a request cannot ask for a roll that takes minutes. Build them with compile_expression so each expression is parsed once per process
+    """
+    def __init__(self, text: str):
+        self.text = text
+        self.terms = []
+        self.constant = 0
+        self.parse(text.replace(' ', '').lower())
+        self.dice_count = sum(term.count for term in self.terms)
+        self.kept_count = sum(term.keep for term in self.terms)
+        bounds = [term.bounds() for term in self.terms]
+        self.minimum = self.constant + sum(low for low, _ in bounds)
+        self.maximum = None if any(high is None for _, high in bounds) else self.constant + sum(high for _, high in bounds)
+
+    def __repr__(self) -> str:
+        return f'DiceExpression({self.text!r})'
+
+    def parse(self, text: str) -> None:
+        """Splits text into dice terms and whole numbers, raising ValueError where it does not follow the syntax"""
+        if not text:
+            raise ValueError('Empty dice expression')
+        position = 0
+        while position < len(text):
+            if position and text[position] not in '+-':
+                raise ValueError(f'Expected + or - at {position} in dice expression {self.text}')
+            match = DICE_PATTERN.match(text, position)
+            if match:
+                sign, count, sides = match.groups()
+                term = DiceTerm(int(count or 1), int(sides), -1 if sign == '-' else 1)
+                if term.count < 1 or term.sides < 1:
+                    raise ValueError(f'Dice need a count and sides of at least 1 in {self.text}')
+                if term.sides > MAX_SIDES or term.count + sum(other.count for other in self.terms) > MAX_DICE:
+                    raise ValueError(f'Dice expressions are limited to {MAX_DICE} dice of at most {MAX_SIDES} sides in {self.text}')
+                position = match.end()
+                while (modifier := MODIFIER_PATTERN.match(text, position)):
+                    term.add_modifier(modifier, self.text)
+                    position = modifier.end()
+                self.terms.append(term)
+                continue
+            match = CONSTANT_PATTERN.match(text, position)
+            if not match:
+                raise ValueError(f'Cannot read dice expression {self.text} from {text[position:]}')
+            self.constant += int(match.group(2)) * (-1 if match.group(1) == '-' else 1)
+            position = match.end()
+            if abs(self.constant) > MAX_DICE * MAX_SIDES:
+                raise ValueError(f'Dice expressions are limited to whole numbers of at most {MAX_DICE * MAX_SIDES} in {self.text}')
+
+    def roll(self, rng: random.Random = None) -> tuple:
+        """
+        Rolls the expression once, plain dice make the same rng.randint calls as a hand-written loop so seeded results do not change
+
+        Args:
+        rng (random.Random): optional seeded generator, the random module is used when not given
+
+        Returns:
+        total (int): the result
+        kept (list): kept dice of every term, in rolled order
+        rolled (list): every die of every term, in rolled order
+        """
+        rng = rng if rng is not None else random
+        if len(self.terms) == 1 and not self.constant:
+            return self.terms[0].roll(rng)
+        total, kept, rolled = self.constant, [], []
+        for term in self.terms:
+            term_total, term_kept, term_rolled = term.roll(rng)
+            total += term_total
+            kept += term_kept
+            rolled += term_rolled
+        return total, kept, rolled
+
+    def kept_flags(self, rolled: list) -> list:
+        """Whether each die of a roll's rolled list was kept, for showing which dice count"""
+        flags, start = [], 0
+        for term in self.terms:
+            kept = set(term.kept_indexes(rolled[start:start + term.count]))
+            flags += [index in kept for index in range(term.count)]
+            start += term.count
+        return flags
+
+    def dtype(self):
+        """Smallest numpy integer type that holds every total, int8 for 4d6kh3"""
+        import numpy as np
+        if self.maximum is not None and -128 <= self.minimum and self.maximum <= 127:
+            return np.int8
+        if self.maximum is not None and -32768 <= self.minimum and self.maximum <= 32767:
+            return np.int16
+        return np.int32
+
+    def sample(self, rng, size):
+        """
+        Rolls totals only for every position of size, skipping the kept dice arrays
+
+        Args:
+        rng (numpy.random.Generator): generator to draw from
+        size (int or tuple): shape of the result, e.g. (count, 6) for count characters
+
+        Returns:
+        numpy.ndarray: totals of the dtype dtype gives
+        """
+        import numpy as np
+        size = (size,) if isinstance(size, int) else tuple(size)
+        total = np.full(size, self.constant, dtype=np.int32)
+        for term in self.terms:
+            total += term.total_array(term.roll_array(rng, size))
+        return total.astype(self.dtype())
+
+    def roll_batch(self, rng, size) -> tuple:
+        """
+        Rolls every position of size at once, the array form of roll
+
+        Args:
+        rng (numpy.random.Generator): generator to draw from
+        size (int or tuple): leading shape of the results
+
+        Returns:
+        totals (np.ndarray): shape size, the dtype dtype gives
+        kept (np.ndarray): shape size + (kept_count,), kept dice in rolled order
+        rolled (np.ndarray): shape size + (dice_count,), every die in rolled order
+        """
+        import numpy as np
+        size = (size,) if isinstance(size, int) else tuple(size)
+        total = np.full(size, self.constant, dtype=np.int32)
+        kept, rolled = [], []
+        for term in self.terms:
+            dice = term.roll_array(rng, size)
+            total += term.total_array(dice)
+            kept.append(dice[term.keep_mask(dice)].reshape(size + (term.keep,)))
+            rolled.append(dice)
+        return total.astype(self.dtype()), np.concatenate(kept, axis=-1) if kept else np.zeros(size + (0,), dtype=np.int8), np.concatenate(rolled, axis=-1) if rolled else np.zeros(size + (0,), dtype=np.int8)
+
+
+@lru_cache(maxsize=256)
+def compile_expression(text: str) -> DiceExpression:
+    """Parses a dice expression once, later calls with the same text get the same DiceExpression"""
+    return DiceExpression(text)
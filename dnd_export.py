@@ -0,0 +1,149 @@
+import csv
+import gzip
+import io
+import json
+import os
+from dnd_rules import RuleConstants
+
+OUTPUT_ROOT = os.environ.get('DND_OUTPUT_DIR', os.path.join(os.path.expanduser('~'), 'VSCode', 'DnD', 'Data'))
+FORMATS = {'jsonl': '.jsonl', 'csv': '.csv', 'txt': '.txt'}
+
+
+def format_text(character_dict: dict, score_dict: dict, modifier_dict: dict) -> str:
+    """
+    Lays out one character the way FinalisePage.write_file always has
+
+    Args:
+    character_dict (dict): 'Class' and 'Race' keys, any other keys are written in the same section
+    score_dict (dict): ability names as keys and scores as values
+    modifier_dict (dict): ability names as keys and modifiers as values
+
+    Returns:
+    str: the text of one character sheet
+    """
+    lines = ['Character Details\n']
+    lines.extend(f'{key}: {value}\n' for key, value in character_dict.items())
+    lines.append('\n Ability Scores\n')
+    lines.extend(f'{key}: {value}\n' for key, value in score_dict.items())
+    lines.append('\n Score Modifiers\n')
+    lines.extend(f'{key}: {value}\n' for key, value in modifier_dict.items())
+    return ''.join(lines)
+
+
+class CharacterExporter():
+    """Streams many characters into sharded JSON lines, CSV or text files through one buffered writer, rotating shards by size. Refuses, with FileExistsError, an output_root that already holds shards with the same prefix and format, so two runs never mix"""
+    def __init__(self, output_root: str = OUTPUT_ROOT, file_format: str = 'jsonl', prefix: str = 'characters', max_bytes: int = 256 * 1024 * 1024, compress: bool = False, buffer_size: int = 1024 * 1024, constants: RuleConstants = None):
+        if file_format not in FORMATS:
+            raise ValueError(f'Unknown format {file_format}, expected one of {list(FORMATS)}')
+        self.CONSTANTS = constants if constants is not None else RuleConstants()
+        self.output_root = output_root
+        self.file_format = file_format
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self.buffer_size = buffer_size
+        self.shard_index = -1
+        self.shard_bytes = 0
+        self.shard_paths = []
+        self.written = 0
+        self.file = None
+        self.raw_file = None
+        os.makedirs(output_root, exist_ok=True)
+        existing = sorted(name for name in os.listdir(output_root) if name.startswith(f'{prefix}-') and FORMATS[file_format] in name)
+        if existing:
+            raise FileExistsError(f'{output_root} already holds {prefix} shards such as {existing[0]}, use another folder or prefix so runs are not mixed')
+
+    def __enter__(self) -> 'CharacterExporter':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def header(self) -> list:
+        """Column names for CSV shards"""
+        abilities = self.CONSTANTS.ABILITY_NAMES
+        return ['Name', 'Method', 'Class', 'Race'] + abilities + [f'{ability} Modifier' for ability in abilities]
+
+    def open_shard(self) -> None:
+        """Closes the current shard and opens the next, writing the CSV header when needed, a shard is never opened over an existing file"""
+        self.close()
+        self.shard_index += 1
+        path = os.path.join(self.output_root, f'{self.prefix}-{self.shard_index:05d}{FORMATS[self.file_format]}')
+        if self.compress:
+            path += '.gz'
+            self.raw_file = gzip.open(path, 'xb', compresslevel=6)
+        else:
+            self.raw_file = open(path, 'xb', buffering=0)
+        self.file = io.BufferedWriter(self.raw_file, buffer_size=self.buffer_size)
+        self.shard_paths.append(path)
+        self.shard_bytes = 0
+        if self.file_format == 'csv':
+            self.write_bytes(self.csv_line(self.header()))
+
+    def csv_line(self, row: list) -> bytes:
+        """Encodes one CSV row"""
+        text = io.StringIO()
+        csv.writer(text, lineterminator='\n').writerow(row)
+        return text.getvalue().encode()
+
+    def encode(self, character_dict: dict, score_dict: dict, modifier_dict: dict, name: str = None, method: str = None) -> bytes:
+        """
+        Encodes one character in the exporter's format
+
+        Args:
+        character_dict (dict): 'Class' and 'Race' keys
+        score_dict (dict): ability names as keys and scores as values
+        modifier_dict (dict): ability names as keys and modifiers as values
+        name (str): character name, optional
+        method (str): generation method, optional
+
+        Returns:
+        bytes: the encoded record
+        """
+        if self.file_format == 'jsonl':
+            record = {'name': name, 'method': method, 'character': character_dict, 'scores': score_dict, 'modifiers': modifier_dict}
+            return (json.dumps(record) + '\n').encode()
+        if self.file_format == 'csv':
+            abilities = self.CONSTANTS.ABILITY_NAMES
+            row = [name or '', method or '', character_dict.get('Class', ''), character_dict.get('Race', '')]
+            row += [score_dict[ability] for ability in abilities] + [modifier_dict[ability] for ability in abilities]
+            return self.csv_line(row)
+        details = {'Name': name, **character_dict} if name else character_dict
+        return (format_text(details, score_dict, modifier_dict) + '\n').encode()
+
+    def write_bytes(self, data: bytes) -> None:
+        """Writes to the current shard and counts its uncompressed size"""
+        self.file.write(data)
+        self.shard_bytes += len(data)
+
+    def write(self, character_dict: dict, score_dict: dict, modifier_dict: dict, name: str = None, method: str = None) -> None:
+        """Writes one character, starting a new shard first when the current one has reached max_bytes, see encode for the arguments"""
+        if self.file is None or self.shard_bytes >= self.max_bytes:
+            self.open_shard()
+        self.write_bytes(self.encode(character_dict, score_dict, modifier_dict, name, method))
+        self.written += 1
+
+    def write_many(self, characters) -> int:
+        """
+        Writes characters in the batch generator's dict form
+
+        Args:
+        characters (iterable): dicts with 'character', 'scores' and 'modifiers' keys and optional 'name' and 'method'
+
+        Returns:
+        int: number of characters written
+        """
+        count = 0
+        for character in characters:
+            self.write(character['character'], character['scores'], character['modifiers'], character.get('name'), character.get('method'))
+            count += 1
+        return count
+
+    def close(self) -> None:
+        """Flushes and closes the current shard"""
+        if self.file is not None:
+            self.file.close()
+            if not self.raw_file.closed:
+                self.raw_file.close()
+            self.file = None
+            self.raw_file = None
@@ -0,0 +1,179 @@
+from operator import add
+from dnd_rules import CharacterRules
+
+
+class DependencyGraph():
+    """
+    Named values derived from inputs, recomputed only when something they depend on has changed
+
+    Setting an input flags its dependents dirty. update walks the derived values once in the order they were added, which is a dependency order, recomputing the dirty ones, and a value that comes out the same as before stops there instead of flagging its own dependents. take_changes reports what changed since it was last called, down to the positions of a tuple value, so a view can redraw just those
+    """
+    def __init__(self):
+        self.inputs = {}
+        self.dependents = {}
+        self.values = {}
+        self.order = []
+        self.dirty = set()
+        self.before = {}
+        self.recomputed = 0
+
+    def add_input(self, name, value=None) -> None:
+        """Adds a value that is set from outside with set"""
+        self.dependents[name] = []
+        self.values[name] = value
+
+    def add(self, name, function, inputs: tuple) -> None:
+        """
+        Adds a derived value, computed straight away
+
+        Args:
+        name (str): key of the value
+        function (callable): takes the values of inputs in order
+        inputs (tuple): names added before this one
+        """
+        self.dependents[name] = []
+        for source in inputs:
+            self.dependents[source].append(name)
+        self.inputs[name] = tuple(inputs)
+        self.order.append((name, function, self.inputs[name], self.dependents[name]))
+        self.values[name] = function(*(self.values[source] for source in inputs))
+
+    def set(self, name, value) -> bool:
+        """Sets an input and flags its dependents, returning False and flagging nothing when the value is the same"""
+        if name in self.inputs:
+            raise ValueError(f'{name} is derived, only inputs can be set')
+        old = self.values[name]
+        if old == value:
+            return False
+        self.before.setdefault(name, old)
+        self.values[name] = value
+        self.dirty.update(self.dependents[name])
+        return True
+
+    def update(self) -> None:
+        """Recomputes the dirty values, dependencies first, a value flagged while walking is always later in the order"""
+        if not self.dirty:
+            return
+        values, dirty, before = self.values, self.dirty, self.before
+        for name, function, inputs, dependents in self.order:
+            if name not in dirty:
+                continue
+            dirty.discard(name)
+            value = function(values[inputs[0]]) if len(inputs) == 1 else function(*[values[source] for source in inputs])
+            self.recomputed += 1
+            old = values[name]
+            if value != old:
+                before.setdefault(name, old)
+                values[name] = value
+                dirty.update(dependents)
+            if not dirty:
+                break
+
+    def get(self, name):
+        """Current value of name, bringing dirty values up to date first"""
+        if self.dirty:
+            self.update()
+        return self.values[name]
+
+    def take_changes(self) -> dict:
+        """
+        What changed since the last call, after bringing dirty values up to date
+
+        Returns:
+        dict: names as keys, values are the changed positions for tuples of the same length as before and None for any other value, a value that changed back is left out
+        """
+        self.update()
+        changes = {}
+        for name, old in self.before.items():
+            new = self.values[name]
+            if new == old:
+                continue
+            if isinstance(old, tuple) and isinstance(new, tuple) and len(old) == len(new):
+                changes[name] = [index for index, (was, now) in enumerate(zip(old, new)) if was != now]
+            else:
+                changes[name] = None
+        self.before = {}
+        return changes
+
+
+class CharacterGraph(DependencyGraph):
+    """
+    ClassPage's derived values as a DependencyGraph: base scores, then race bonuses with the Half-Elf picks, then race adjusted scores, then modifiers, which finalise turns into the dicts FinalisePage.write_file saves
+
+    Each per ability stage is one tuple in ABILITY_NAMES order, so take_changes names the abilities a race or Half-Elf change moved and ClassGridModel redraws only those. Keeping a tuple per stage rather than a value per ability keeps BatchGenerator, which runs the same graph without wx, about as fast as calling CharacterRules.finalise. The rules dicts are inputs too, so a reloaded rules file flows through the same way
+    """
+    def __init__(self, class_dict: dict, race_dict: dict, rules: CharacterRules = None):
+        super().__init__()
+        self.RULES = rules if rules is not None else CharacterRules()
+        self.CONSTANTS = self.RULES.CONSTANTS
+        self.abilities = tuple(self.CONSTANTS.ABILITY_NAMES)
+        for name, value in (('class_dict', class_dict), ('race_dict', race_dict), ('class', None), ('race', None), ('haelf_select', None), ('base', None)):
+            self.add_input(name, value)
+        self.bonus_cache = {}
+        self.primary_cache = {}
+        self.add('bonuses', self.race_bonuses, ('race_dict', 'race', 'haelf_select'))
+        self.add('scores', lambda base, bonuses: tuple(map(add, base, bonuses)) if base is not None else None, ('base', 'bonuses'))
+        self.add('modifiers', lambda scores: tuple([(score - 10) // 2 for score in scores]) if scores is not None else None, ('scores',))
+        self.add('primary', self.primary_flags, ('class_dict', 'class'))
+
+    def race_bonuses(self, race_dict: dict, race: str, haelf_select: tuple) -> tuple:
+        """CharacterRules.race_bonus as a tuple in ABILITY_NAMES order, no bonus while no race is chosen or when the race left the rules file, remembered per race and picks until the rules change"""
+        key = (race, haelf_select)
+        bonuses = self.bonus_cache.get(key)
+        if bonuses is None:
+            if race in race_dict:
+                bonus = self.RULES.race_bonus(race_dict, race, haelf_select)
+                bonuses = tuple([bonus.get(ability, 0) for ability in self.abilities])
+            else:
+                bonuses = (0,) * len(self.abilities)
+            self.bonus_cache[key] = bonuses
+        return bonuses
+
+    def primary_flags(self, class_dict: dict, class_name: str) -> tuple:
+        """Whether each ability is one of the class's, for the ClassPage highlight, remembered per class until the rules change"""
+        flags = self.primary_cache.get(class_name)
+        if flags is None:
+            class_abilities = class_dict.get(class_name, ())
+            flags = self.primary_cache[class_name] = tuple([ability in class_abilities for ability in self.abilities])
+        return flags
+
+    def ability_dict(self, name: str) -> dict:
+        """Ability names as keys for a per ability tuple such as 'scores', empty before scores are set"""
+        values = self.get(name)
+        return dict(zip(self.abilities, values)) if values is not None else {}
+
+    def set_rules(self, class_dict: dict, race_dict: dict) -> None:
+        """Swaps in reloaded rules, only what depends on a changed bonus or class is recomputed past that point"""
+        self.bonus_cache = {}
+        self.primary_cache = {}
+        self.set('class_dict', class_dict)
+        self.set('race_dict', race_dict)
+
+    def set_scores(self, score_dict: dict) -> None:
+        """Sets the base scores before race bonuses, as str or int"""
+        self.set('base', tuple([int(score_dict[ability]) for ability in self.abilities]))
+
+    def set_class(self, class_name: str) -> None:
+        """Sets the chosen class"""
+        self.set('class', class_name)
+
+    def set_race(self, race: str, haelf_select: list = None) -> None:
+        """Sets the chosen race and, for Half-Elf, the picks, the race file's defaults when not given"""
+        self.set('race', race)
+        self.set_haelf_select(haelf_select)
+
+    def set_haelf_select(self, haelf_select: list) -> None:
+        """Sets the two Half-Elf picks, only used while the race is Half-Elf"""
+        self.set('haelf_select', tuple(haelf_select) if haelf_select is not None else None)
+
+    def finalise(self) -> tuple:
+        """
+        The three dicts FinalisePage.write_file saves, as CharacterRules.finalise gives them
+
+        Returns:
+        character_dict (dict): 'Class' and 'Race' keys
+        score_dict (dict): race adjusted int scores
+        modifier_dict (dict): int modifiers of the adjusted scores
+        """
+        self.update()
+        return {'Class': self.values['class'], 'Race': self.values['race']}, self.ability_dict('scores'), self.ability_dict('modifiers')
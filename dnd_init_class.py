@@ -1,6 +1,6 @@
 class initRaceClass():
-    def __init__(self, file_path: str, lines_to_skip: int, split_point: str):
-        self.txt_data = self.process_txt(file_path, lines_to_skip)
+    def __init__(self, file_path: str, lines_to_skip: int, split_point: str, txt_data: list = None):
+        self.txt_data = self.process_txt(file_path, lines_to_skip) if txt_data is None else txt_data[lines_to_skip:]
         self.class_section, self.race_section = self.create_sections(self.txt_data, split_point)
         self.class_dict, self.race_dict = self.create_dictionaries(self.class_section, self.race_section)
 
@@ -58,9 +58,21 @@ class initRaceClass():
         class_dict = {}
         for line in class_data:  
             if line.strip():      
-                class_name, *abilities = map(str.strip, line.split('|'))      
+                class_name, abilities = self.parse_class_line(line)
                 class_dict[class_name] = abilities
         return class_dict
+
+    def parse_class_line(self, line):
+        """Parses one non-blank class line.
+
+        Args:
+            line (str): Line such as 'Fighter | Strength | Dexterity'.
+
+        Returns:
+            tuple: The class name and its list of abilities.
+        """
+        class_name, *abilities = map(str.strip, line.split('|'))
+        return class_name, abilities
     
     def process_races(self, race_data):
         """Processes the race data and returns the race dictionary.
@@ -74,12 +86,24 @@ class initRaceClass():
         race_dict = {}
         for line in race_data:
             if line.strip():
-                parts = line.split('|')
-                race_name = parts[0].strip()
-                ability_pairs = {}
-                for i in range(1, len(parts), 2):
-                    ability = parts[i].strip()
-                    point_buff = int(parts[i+1].strip())
-                    ability_pairs[ability] = point_buff
+                race_name, ability_pairs = self.parse_race_line(line)
                 race_dict[race_name] = ability_pairs
-        return race_dict
\ No newline at end of file
+        return race_dict
+
+    def parse_race_line(self, line):
+        """Parses one non-blank race line.
+
+        Args:
+            line (str): Line such as 'Half-Orc | Strength | 2 | Constitution | 1'.
+
+        Returns:
+            tuple: The race name and a dict of abilities and their point buff.
+        """
+        parts = line.split('|')
+        race_name = parts[0].strip()
+        ability_pairs = {}
+        for i in range(1, len(parts), 2):
+            ability = parts[i].strip()
+            point_buff = int(parts[i+1].strip())
+            ability_pairs[ability] = point_buff
+        return race_name, ability_pairs
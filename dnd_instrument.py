@@ -0,0 +1,204 @@
+import atexit
+import functools
+import importlib
+import json
+import os
+import sys
+import time
+
+INSTRUMENT_OUTPUT = os.environ.get('DND_INSTRUMENT')
+HANDLERS = [
+    ('dnd_GUID', 'MyWizard', 'on_next_page'),
+    ('dnd_GUID', 'MyWizard', 'on_move_from_eeeee'),
+    ('dnd_GUID', 'MyWizard', 'next_page_dict'),
+    ('dnd_GUID', 'MyWizard', 'update_char_details'),
+    ('dnd_GUID', 'Roll5ePage', 'roll_dice'),
+    ('dnd_GUID', 'AssignRollsPage', 'on_choice_made'),
+    ('dnd_GUID', 'AssignRollsPage', 'on_page_change'),
+    ('dnd_GUID', 'PointsBuyPage', 'on_spin'),
+    ('dnd_GUID', 'PointsBuyPage', 'on_reset'),
+    ('dnd_GUID', 'PointsBuyPage', 'on_page_change'),
+    ('dnd_GUID', 'ClassPage', 'on_race_choice'),
+    ('dnd_GUID', 'ClassPage', 'update_score_dict'),
+    ('dnd_GUID', 'FinalisePage', 'on_confirm_button'),
+    ('dnd_GUI_dynamics', 'GUIElements', 'on_class_choice'),
+    ('dnd_GUI_dynamics', 'HalfElfElements', 'on_halfelf_choice'),
+]
+WIDGET_CALLS = ['SetLabel', 'SetBackgroundColour', 'Layout']
+WIDGET_CLASSES = ['Window', 'Control', 'StaticText', 'Button', 'Choice', 'SpinButton', 'Panel', 'TopLevelWindow', 'Dialog']
+BUCKETS_MS = [2 ** power for power in range(-4, 13)]
+
+
+def count_windows() -> dict:
+    """
+    Counts the live wx windows, walking every top level window and its children
+
+    Returns:
+    dict: class names as keys and the number of live windows of that class as values, most first
+    """
+    import wx
+    counts = {}
+    windows = list(wx.GetTopLevelWindows())
+    while windows:
+        window = windows.pop()
+        name = type(window).__name__
+        counts[name] = counts.get(name, 0) + 1
+        windows.extend(window.GetChildren())
+    return dict(sorted(counts.items(), key=lambda item: item[1], reverse=True))
+
+
+class HandlerStats():
+    """Latency histogram and widget call counts for one handler"""
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+        self.widget_calls = dict.fromkeys(WIDGET_CALLS, 0)
+
+    def add(self, elapsed_ms: float) -> None:
+        """Records one handler run"""
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        for index, bound in enumerate(BUCKETS_MS):
+            if elapsed_ms <= bound:
+                self.buckets[index] += 1
+                return
+        self.buckets[-1] += 1
+
+    def percentile(self, fraction: float) -> float:
+        """Upper bound in ms of the histogram bucket holding the given fraction of runs"""
+        target = fraction * self.count
+        running = 0
+        for index, count in enumerate(self.buckets):
+            running += count
+            if running >= target and count:
+                return min(BUCKETS_MS[index], self.max_ms) if index < len(BUCKETS_MS) else self.max_ms
+        return 0.0
+
+    def as_dict(self) -> dict:
+        """Summary for the JSON export"""
+        labels = [f'<={bound}ms' for bound in BUCKETS_MS] + [f'>{BUCKETS_MS[-1]}ms']
+        return {
+            'count': self.count,
+            'mean_ms': self.total_ms / self.count if self.count else 0.0,
+            'p50_ms': self.percentile(0.5),
+            'p95_ms': self.percentile(0.95),
+            'max_ms': self.max_ms,
+            'histogram': {label: count for label, count in zip(labels, self.buckets) if count},
+            'widget_calls': dict(self.widget_calls),
+        }
+
+
+class Instrumentation():
+    """Opt-in timing of the wizard's event handlers, counting the widget updates each one makes. Install before MyWizard is created so Bind picks up the timed methods"""
+    def __init__(self, output_path: str = None):
+        self.output_path = output_path
+        self.stats = {}
+        self.active = []
+        self.patched = []
+        self.handlers = {}
+        self.live = {'windows': {}, 'handlers': {}}
+        self.peak_windows = 0
+
+    def install(self) -> 'Instrumentation':
+        """Wraps every handler in HANDLERS and the widget calls in WIDGET_CALLS, and registers the export on exit"""
+        for module_name, class_name, method_name in HANDLERS:
+            cls = getattr(importlib.import_module(module_name), class_name)
+            self.patch(cls, method_name, self.time_handler(f'{class_name}.{method_name}', getattr(cls, method_name)))
+        import wx
+        for class_name in WIDGET_CLASSES:
+            cls = getattr(wx, class_name, None)
+            for call in WIDGET_CALLS:
+                if cls is not None and call in cls.__dict__:
+                    self.patch(cls, call, self.count_call(call, cls.__dict__[call]))
+        self.patch(wx.EvtHandler, 'Bind', self.count_binding(1, wx.EvtHandler.__dict__['Bind']))
+        self.patch(wx.EvtHandler, 'Unbind', self.count_binding(-1, wx.EvtHandler.__dict__['Unbind']))
+        atexit.register(self.export)
+        return self
+
+    def uninstall(self) -> None:
+        """Puts back every patched method"""
+        for cls, name, original in reversed(self.patched):
+            setattr(cls, name, original)
+        self.patched = []
+
+    def patch(self, cls: type, name: str, replacement) -> None:
+        """Replaces a class attribute, remembering the original for uninstall"""
+        self.patched.append((cls, name, cls.__dict__[name]))
+        setattr(cls, name, replacement)
+
+    def time_handler(self, name: str, handler):
+        """Wraps a handler so its run time and widget calls are recorded under name"""
+        stats = self.stats.setdefault(name, HandlerStats())
+
+        @functools.wraps(handler)
+        def timed(*args, **kwargs):
+            self.active.append(stats)
+            start = time.perf_counter()
+            try:
+                return handler(*args, **kwargs)
+            finally:
+                stats.add((time.perf_counter() - start) * 1000)
+                self.active.pop()
+                if not self.active:
+                    self.snapshot_live()
+        return timed
+
+    def count_call(self, call: str, method):
+        """Wraps a widget method so each call counts towards every handler running at the time"""
+        @functools.wraps(method)
+        def counted(*args, **kwargs):
+            for stats in self.active:
+                stats.widget_calls[call] += 1
+            return method(*args, **kwargs)
+        return counted
+
+    def count_binding(self, step: int, method):
+        """Wraps EvtHandler.Bind or Unbind so the handlers bound to each class of window are counted, step is 1 for Bind and -1 for Unbind"""
+        @functools.wraps(method)
+        def counted(handler_self, *args, **kwargs):
+            name = type(handler_self).__name__
+            self.handlers[name] = self.handlers.get(name, 0) + step
+            return method(handler_self, *args, **kwargs)
+        return counted
+
+    def snapshot_live(self) -> dict:
+        """Records the live window counts and bound handler counts after a handler finishes, keeping the highest window total seen"""
+        windows = count_windows()
+        self.peak_windows = max(self.peak_windows, sum(windows.values()))
+        self.live = {'windows': windows, 'handlers': {name: count for name, count in self.handlers.items() if count}}
+        return self.live
+
+    def live_summary(self) -> dict:
+        """The last live snapshot with the window peak, windows destroyed with their handlers still count as bound"""
+        return {'peak_windows': self.peak_windows, **self.live}
+
+    def summary(self) -> dict:
+        """Stats of every handler that ran, slowest mean first"""
+        ran = {name: stats.as_dict() for name, stats in self.stats.items() if stats.count}
+        return dict(sorted(ran.items(), key=lambda item: item[1]['mean_ms'], reverse=True))
+
+    def export(self) -> None:
+        """Writes the handler summary and live counts as JSON to output_path, or prints tables to stderr when output_path is '-' or not set"""
+        summary = self.summary()
+        live = self.live_summary()
+        if self.output_path and self.output_path != '-':
+            with open(self.output_path, 'w') as file:
+                json.dump({'handlers': summary, 'live': live}, file, indent=2)
+            return
+        print(f'{"handler":<40}{"count":>7}{"mean ms":>10}{"p95 ms":>9}{"max ms":>10}{"SetLabel":>10}{"SetBgColour":>13}{"Layout":>8}', file=sys.stderr)
+        for name, stats in summary.items():
+            calls = stats['widget_calls']
+            print(f'{name:<40}{stats["count"]:>7}{stats["mean_ms"]:>10.2f}{stats["p95_ms"]:>9.2f}{stats["max_ms"]:>10.2f}{calls["SetLabel"]:>10}{calls["SetBackgroundColour"]:>13}{calls["Layout"]:>8}', file=sys.stderr)
+        print(f'live windows {sum(live["windows"].values())} (peak {live["peak_windows"]}), bound handlers {sum(live["handlers"].values())}', file=sys.stderr)
+        for name, count in live['windows'].items():
+            print(f'{name:<40}{count:>7} windows{live["handlers"].get(name, 0):>10} handlers', file=sys.stderr)
+
+
+def install_from_environment() -> Instrumentation:
+    """Installs instrumentation when DND_INSTRUMENT is set, to a JSON file path or '-' for a table on stderr"""
+    if INSTRUMENT_OUTPUT:
+        return Instrumentation(INSTRUMENT_OUTPUT).install()
+    return None
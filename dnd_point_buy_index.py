@@ -0,0 +1,157 @@
+from array import array
+from itertools import product
+from dnd_rules import CharacterRules
+
+
+class PointBuyIndex():
+    """Every legal points buy allocation enumerated once, with bitset lookups for bulk validation and build queries"""
+    def __init__(self, rules: CharacterRules = None):
+        self.RULES = rules if rules is not None else CharacterRules()
+        self.CONSTANTS = self.RULES.CONSTANTS
+        self.abilities = len(self.CONSTANTS.ABILITY_NAMES)
+        self.span = self.CONSTANTS.MAX_POINTS - self.CONSTANTS.MIN_POINTS + 1
+        self.scores = array('b')
+        self.spent = array('b')
+        self.positions = array('l', [-1]) * self.span ** self.abilities
+        self.build_index()
+        self.build_bitsets()
+
+    def build_index(self) -> None:
+        """Enumerates every allocation that spends no more than POINTS_AVAILABLE_MAX, filling the flat scores and spent arrays and the packed key to row positions table"""
+        score_range = range(self.CONSTANTS.MIN_POINTS, self.CONSTANTS.MAX_POINTS + 1)
+        cost = {score: self.RULES.point_cost(score) for score in score_range}
+        budget = self.CONSTANTS.POINTS_AVAILABLE_MAX
+        for allocation in product(score_range, repeat=self.abilities):
+            spent = sum(cost[score] for score in allocation)
+            if spent <= budget:
+                self.positions[self.pack(allocation)] = len(self.spent)
+                self.scores.extend(allocation)
+                self.spent.append(spent)
+
+    def build_bitsets(self) -> None:
+        """Builds the lookup bitsets, one bit per row: rows by exact spend, and rows by ability with a score of at least / at most each value"""
+        score_rows = [[[] for _ in range(self.span)] for _ in range(self.abilities)]
+        spent_rows = [[] for _ in range(self.CONSTANTS.POINTS_AVAILABLE_MAX + 1)]
+        for row in range(len(self.spent)):
+            spent_rows[self.spent[row]].append(row)
+            for ability in range(self.abilities):
+                score_rows[ability][self.scores[row * self.abilities + ability] - self.CONSTANTS.MIN_POINTS].append(row)
+        score_bits = [[self.bits_from_rows(rows) for rows in ability_rows] for ability_rows in score_rows]
+        spent_bits = [self.bits_from_rows(rows) for rows in spent_rows]
+        self.all_rows = (1 << len(self.spent)) - 1
+        self.spent_bits = spent_bits
+        self.at_least_bits = []
+        self.at_most_bits = []
+        for ability_bits in score_bits:
+            at_least, at_most = [0] * self.span, [0] * self.span
+            running = 0
+            for offset in reversed(range(self.span)):
+                running |= ability_bits[offset]
+                at_least[offset] = running
+            running = 0
+            for offset in range(self.span):
+                running |= ability_bits[offset]
+                at_most[offset] = running
+            self.at_least_bits.append(at_least)
+            self.at_most_bits.append(at_most)
+
+    def bits_from_rows(self, rows: list) -> int:
+        """Packs a list of row numbers into a bitset in one pass"""
+        digits = bytearray(b'0') * len(self.spent)
+        for row in rows:
+            digits[-1 - row] = ord('1')
+        return int(digits, 2) if digits else 0
+
+    def __len__(self) -> int:
+        return len(self.spent)
+
+    def pack(self, allocation) -> int:
+        """Packs a 6 score allocation into a single int key for the positions table"""
+        key = 0
+        for score in allocation:
+            key = key * self.span + int(score) - self.CONSTANTS.MIN_POINTS
+        return key
+
+    def row(self, allocation) -> int:
+        """
+        Finds the row of an allocation
+
+        Args:
+        allocation (list): one score per ability, in ABILITY_NAMES order
+
+        Returns:
+        int: row number, or -1 if the allocation is not legal
+        """
+        if len(allocation) != self.abilities:
+            return -1
+        for score in allocation:
+            if not self.CONSTANTS.MIN_POINTS <= int(score) <= self.CONSTANTS.MAX_POINTS:
+                return -1
+        return self.positions[self.pack(allocation)]
+
+    def is_legal(self, allocation, require_all_spent: bool = True) -> bool:
+        """Checks an allocation with a table lookup, matching CharacterRules.is_valid_point_buy"""
+        row = self.row(allocation)
+        if row < 0:
+            return False
+        return self.spent[row] == self.CONSTANTS.POINTS_AVAILABLE_MAX if require_all_spent else True
+
+    def allocation(self, row: int) -> tuple:
+        """Gives the scores stored in a row"""
+        start = row * self.abilities
+        return tuple(self.scores[start:start + self.abilities])
+
+    def query_bits(self, minimums: dict = None, maximums: dict = None, spent: int = None) -> int:
+        """
+        Combines the precomputed bitsets for a query
+
+        Args:
+        minimums (dict): ability names as keys and lowest allowed score as values
+        maximums (dict): ability names as keys and highest allowed score as values
+        spent (int): exact points spent, or None for any
+
+        Returns:
+        int: bitset of the matching rows
+        """
+        bits = self.all_rows
+        if spent is not None:
+            bits &= self.spent_bits[spent] if 0 <= spent < len(self.spent_bits) else 0
+        for ability, score in (minimums or {}).items():
+            offset = score - self.CONSTANTS.MIN_POINTS
+            if offset >= self.span:
+                return 0
+            if offset > 0:
+                bits &= self.at_least_bits[self.CONSTANTS.ABILITY_NAMES.index(ability)][offset]
+        for ability, score in (maximums or {}).items():
+            offset = score - self.CONSTANTS.MIN_POINTS
+            if offset < 0:
+                return 0
+            if offset < self.span - 1:
+                bits &= self.at_most_bits[self.CONSTANTS.ABILITY_NAMES.index(ability)][offset]
+        return bits
+
+    def rows(self, bits: int) -> list:
+        """Turns a bitset into a list of row numbers"""
+        return [row for row, bit in enumerate(bin(bits)[:1:-1]) if bit == '1']
+
+    def count(self, minimums: dict = None, maximums: dict = None, spent: int = None) -> int:
+        """Number of allocations matching a query, see query_bits for the arguments"""
+        return self.query_bits(minimums, maximums, spent).bit_count()
+
+    def find(self, minimums: dict = None, maximums: dict = None, spent: int = None) -> list:
+        """
+        Lists the allocations matching a query, e.g. find({'Strength': 15, 'Constitution': 14}, spent=27)
+
+        Args:
+        minimums (dict): ability names as keys and lowest allowed score as values
+        maximums (dict): ability names as keys and highest allowed score as values
+        spent (int): exact points spent, or None for any
+
+        Returns:
+        list: tuples of scores in ABILITY_NAMES order
+        """
+        return [self.allocation(row) for row in self.rows(self.query_bits(minimums, maximums, spent))]
+
+    def find_dicts(self, minimums: dict = None, maximums: dict = None, spent: int = None) -> list:
+        """Same as find, giving score_dict style dicts"""
+        return [dict(zip(self.CONSTANTS.ABILITY_NAMES, allocation)) for allocation in self.find(minimums, maximums, spent)]
@@ -0,0 +1,260 @@
+from fractions import Fraction
+from functools import wraps
+from itertools import combinations_with_replacement, product
+from math import comb, factorial, prod
+from types import MappingProxyType
+from dnd_rules import RuleConstants
+
+
+def cached_table(method):
+    """
+    Caches a table method in its instance's tables dict, keyed on the method and its arguments, so the tables go with the instance rather than living for the whole process
+
+    A dict result is handed out as a read only MappingProxyType, so a caller changing it cannot corrupt later queries
+    """
+    @wraps(method)
+    def cached(self, *args, **kwargs):
+        key = (method.__name__, args, tuple(sorted(kwargs.items())))
+        if key not in self.tables:
+            table = method(self, *args, **kwargs)
+            self.tables[key] = MappingProxyType(table) if isinstance(table, dict) else table
+        return self.tables[key]
+    return cached
+
+
+class RollProbability():
+    """Exact probability tables for rolled ability scores, every table is built once per instance and cached so repeat queries are lookups, the tables are read only mappings"""
+    def __init__(self, constants: RuleConstants = None):
+        self.CONSTANTS = constants if constants is not None else RuleConstants()
+        self.rolls = self.CONSTANTS.ROLLS_PER_CHARACTER
+        self.tables = {}
+
+    @cached_table
+    def score_pmf(self) -> dict:
+        """
+        Distribution of a single 4d6 drop lowest score, found by counting every ordered outcome of the dice
+
+        Returns:
+        dict: score as keys and Fraction probability as values, in ascending score order
+        """
+        counts = {}
+        faces = range(1, self.CONSTANTS.DICE_SIDES + 1)
+        for dice in product(faces, repeat=self.CONSTANTS.DICE_PER_ROLL):
+            total = sum(dice) - min(dice)
+            counts[total] = counts.get(total, 0) + 1
+        outcomes = self.CONSTANTS.DICE_SIDES ** self.CONSTANTS.DICE_PER_ROLL
+        return {score: Fraction(counts[score], outcomes) for score in sorted(counts)}
+
+    @cached_table
+    def score_sf(self) -> dict:
+        """
+        Survival function of a single score, P(score >= x)
+
+        Returns:
+        dict: score as keys and Fraction probability as values
+        """
+        survival = {}
+        running = Fraction(0)
+        for score, probability in reversed(self.score_pmf().items()):
+            running += probability
+            survival[score] = running
+        return dict(reversed(survival.items()))
+
+    def prob_score_at_least(self, threshold: int) -> Fraction:
+        """Probability a single score is threshold or higher"""
+        survival = self.score_sf()
+        if threshold <= min(survival):
+            return Fraction(1)
+        return survival.get(threshold, Fraction(0))
+
+    @cached_table
+    def prob_at_least(self, threshold: int, count: int = 1) -> Fraction:
+        """
+        Probability that at least count of the 6 scores are threshold or higher, e.g. at least one 16+
+
+        Args:
+        threshold (int): lowest score that counts
+        count (int): how many scores must reach threshold
+
+        Returns:
+        Fraction: exact probability
+        """
+        p = self.prob_score_at_least(threshold)
+        return sum((comb(self.rolls, j) * p ** j * (1 - p) ** (self.rolls - j) for j in range(count, self.rolls + 1)), Fraction(0))
+
+    @cached_table
+    def sorted_array_pmf(self) -> dict:
+        """
+        Distribution of the 6 rolled scores sorted highest first, using the multinomial count of each multiset
+
+        Returns:
+        dict: tuple of 6 scores (descending) as keys and Fraction probability as values
+        """
+        pmf = self.score_pmf()
+        ordering = factorial(self.rolls)
+        array_pmf = {}
+        for scores in combinations_with_replacement(sorted(pmf, reverse=True), self.rolls):
+            repeats = prod(factorial(scores.count(score)) for score in set(scores))
+            array_pmf[scores] = ordering // repeats * prod(pmf[score] for score in scores)
+        return array_pmf
+
+    @cached_table
+    def order_statistic_pmf(self, rank: int) -> dict:
+        """
+        Distribution of the rank-th highest of the 6 scores, rank 1 being the best roll
+
+        Args:
+        rank (int): 1 to 6
+
+        Returns:
+        dict: score as keys and Fraction probability as values
+        """
+        if not 1 <= rank <= self.rolls:
+            raise ValueError(f'rank must be between 1 and {self.rolls}, got {rank}')
+        pmf = {}
+        previous_cdf = Fraction(0)
+        for score in self.score_pmf():
+            above = self.prob_score_at_least(score + 1)
+            cdf = sum((comb(self.rolls, j) * above ** j * (1 - above) ** (self.rolls - j) for j in range(rank)), Fraction(0))
+            if cdf != previous_cdf:
+                pmf[score] = cdf - previous_cdf
+            previous_cdf = cdf
+        return pmf
+
+    @cached_table
+    def top_scores_pmf(self, count: int) -> dict:
+        """
+        Joint distribution of the count highest scores, marginalised from sorted_array_pmf
+
+        Args:
+        count (int): how many of the best scores to keep
+
+        Returns:
+        dict: tuple of count scores (descending) as keys and Fraction probability as values
+        """
+        joint = {}
+        for scores, probability in self.sorted_array_pmf().items():
+            key = scores[:count]
+            joint[key] = joint.get(key, 0) + probability
+        return joint
+
+    def modifier(self, score: int) -> int:
+        """Ability modifier for a score, matching CharacterRules.modifiers"""
+        return (score - 10) // 2
+
+    @cached_table
+    def modifier_pmf(self) -> dict:
+        """
+        Distribution of the modifier of a single score
+
+        Returns:
+        dict: modifier as keys and Fraction probability as values
+        """
+        return self.map_pmf(self.score_pmf(), self.modifier)
+
+    @cached_table
+    def modifier_sum_pmf(self, rolls: int = None) -> dict:
+        """
+        Distribution of the total of the modifiers over rolls scores, convolving the cached table for one fewer roll
+
+        Args:
+        rolls (int): number of scores, defaults to all 6
+
+        Returns:
+        dict: modifier total as keys and Fraction probability as values
+        """
+        rolls = self.rolls if rolls is None else rolls
+        if rolls == 0:
+            return {0: Fraction(1)}
+        return self.convolve(self.modifier_sum_pmf(rolls - 1), self.modifier_pmf())
+
+    @cached_table
+    def score_sum_pmf(self, rolls: int = None) -> dict:
+        """
+        Distribution of the total of rolls scores
+
+        Args:
+        rolls (int): number of scores, defaults to all 6
+
+        Returns:
+        dict: score total as keys and Fraction probability as values
+        """
+        rolls = self.rolls if rolls is None else rolls
+        if rolls == 0:
+            return {0: Fraction(1)}
+        return self.convolve(self.score_sum_pmf(rolls - 1), self.score_pmf())
+
+    def class_primary_pmf(self, class_abilities: list) -> dict:
+        """
+        Distribution of each primary ability's score when the best rolls go to a class's primaries in class_dict order
+
+        Args:
+        class_abilities (list): value of class_dict for the class, e.g. ['Strength', 'Charisma'] for Paladin
+
+        Returns:
+        dict: ability names as keys and the score pmf dict as values
+        """
+        return {ability: self.order_statistic_pmf(rank) for rank, ability in enumerate(class_abilities, start=1)}
+
+    @cached_table
+    def primary_modifier_sum_pmf(self, primaries: int) -> dict:
+        """
+        Distribution of the modifier total over a class's primaries when they take the best rolls
+
+        Args:
+        primaries (int): number of primary abilities, len of the class_dict value
+
+        Returns:
+        dict: modifier total as keys and Fraction probability as values
+        """
+        return self.map_pmf(self.top_scores_pmf(primaries), lambda scores: sum(self.modifier(score) for score in scores))
+
+    def class_pmfs(self, class_dict: dict) -> dict:
+        """
+        Primary score distributions for every class in class_dict
+
+        Args:
+        class_dict (dict): class data from initRaceClass
+
+        Returns:
+        dict: class names as keys and class_primary_pmf results as values
+        """
+        return {class_name: self.class_primary_pmf(abilities) for class_name, abilities in class_dict.items()}
+
+    def map_pmf(self, pmf: dict, function) -> dict:
+        """
+        Distribution of function applied to a variable with distribution pmf
+
+        Args:
+        pmf (dict): values as keys and probabilities as values
+        function (callable): applied to each value
+
+        Returns:
+        dict: mapped values as keys, sorted, and summed probabilities as values
+        """
+        mapped = {}
+        for value, probability in pmf.items():
+            key = function(value)
+            mapped[key] = mapped.get(key, 0) + probability
+        return dict(sorted(mapped.items()))
+
+    def convolve(self, first: dict, second: dict) -> dict:
+        """
+        Distribution of the sum of two independent variables
+
+        Args:
+        first (dict): pmf of the first variable
+        second (dict): pmf of the second variable
+
+        Returns:
+        dict: sums as keys, sorted, and probabilities as values
+        """
+        total = {}
+        for a, p in first.items():
+            for b, q in second.items():
+                total[a + b] = total.get(a + b, 0) + p * q
+        return dict(sorted(total.items()))
+
+    def to_float(self, pmf: dict) -> dict:
+        """Converts the Fraction probabilities of a pmf to floats for display"""
+        return {value: float(probability) for value, probability in pmf.items()}
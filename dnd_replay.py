@@ -0,0 +1,510 @@
+import argparse
+import atexit
+import cProfile
+import functools
+import importlib
+import io
+import json
+import os
+import pstats
+import random
+import sys
+import time
+from dnd_dice import compile_expression
+from dnd_rules import CharacterRules
+from dnd_rules_cache import RULES_FILE, load_rules
+from dnd_session import WizardSession
+
+RECORD_OUTPUT = os.environ.get('DND_RECORD')
+RECORDED = [
+    ('dnd_GUID', 'MyWizard', 'on_next_page', 'record_landing'),
+    ('dnd_GUID', 'MyWizard', 'on_move_from_eeeee', 'record_eeeee'),
+    ('dnd_GUID', 'MyWizard', 'on_before_page_changed', 'record_page_change'),
+    ('dnd_GUID', 'Roll5ePage', 'roll_dice', 'record_roll'),
+    ('dnd_GUID', 'AssignRollsPage', 'on_choice_made', 'record_assign'),
+    ('dnd_GUID', 'PointsBuyPage', 'on_spin', 'record_spin'),
+    ('dnd_GUID', 'PointsBuyPage', 'on_reset', 'record_reset'),
+    ('dnd_GUID', 'ClassPage', 'on_class_choice', 'record_class'),
+    ('dnd_GUID', 'ClassPage', 'on_race_choice', 'record_race'),
+    ('dnd_GUI_dynamics', 'HalfElfElements', 'on_halfelf_choice', 'record_haelf'),
+    ('dnd_GUID', 'FinalisePage', 'on_confirm_button', 'record_confirm'),
+]
+CHECKED = {'next': 'allowed', 'back': 'allowed', 'spin': 'points'}
+
+
+def page_name(wizard, page) -> str:
+    """Name MyWizard keeps page under, the names WizardSession uses"""
+    for name in ('l_page', 'eeeee_page', 'a_page', 'pb_page'):
+        if getattr(wizard, name, None) is page:
+            return name
+    for name, base_page in wizard.base_pages.items():
+        if base_page is page:
+            return name
+    return None
+
+
+class SessionRecorder():
+    """Opt-in recording of the wizard's events, one JSON line per session holding the events in the form WizardSession.apply takes. Install before MyWizard is created so Bind picks up the recording methods"""
+    def __init__(self, output_path: str):
+        self.output_path = output_path
+        self.events = []
+        self.patched = []
+        self.start = 0.0
+
+    def install(self) -> 'SessionRecorder':
+        """Wraps every handler in RECORDED and registers the write on exit"""
+        for module_name, class_name, method_name, recorder_name in RECORDED:
+            cls = getattr(importlib.import_module(module_name), class_name)
+            self.patch(cls, method_name, self.wrap(getattr(self, recorder_name), cls.__dict__[method_name]))
+        atexit.register(self.write)
+        return self
+
+    def uninstall(self) -> None:
+        """Puts back every patched method"""
+        for cls, name, original in reversed(self.patched):
+            setattr(cls, name, original)
+        self.patched = []
+
+    def patch(self, cls: type, name: str, replacement) -> None:
+        """Replaces a class attribute, remembering the original for uninstall"""
+        self.patched.append((cls, name, cls.__dict__[name]))
+        setattr(cls, name, replacement)
+
+    def wrap(self, recorder, handler):
+        """Wraps a handler so recorder runs it and records what it did"""
+        @functools.wraps(handler)
+        def recorded(*args):
+            return recorder(handler, *args)
+        return recorded
+
+    def add(self, event: dict) -> None:
+        """Adds one event with its time since the session started"""
+        if not self.events:
+            self.start = time.perf_counter()
+        event['t'] = round(time.perf_counter() - self.start, 3)
+        self.events.append(event)
+
+    def record_landing(self, handler, wizard, event) -> None:
+        """LandingPage's choice is only read on Next, so it is recorded then, followed by the page change"""
+        self.add({'event': 'method', 'choice': wizard.l_page.type_choose.GetSelection()})
+        handler(wizard, event)
+        self.add({'event': 'next', 'page': 'l_page', 'allowed': event.IsAllowed()})
+
+    def record_eeeee(self, handler, wizard, event) -> None:
+        handler(wizard, event)
+        self.add({'event': 'next' if event.GetDirection() else 'back', 'page': 'eeeee_page', 'allowed': event.IsAllowed()})
+
+    def record_page_change(self, handler, wizard, event, page, page_handler) -> None:
+        handler(wizard, event, page, page_handler)
+        self.add({'event': 'next' if event.GetDirection() else 'back', 'page': page_name(wizard, page), 'allowed': event.IsAllowed()})
+
+    def record_roll(self, handler, page, event) -> None:
+        """Only presses that show a roll are recorded, the first with every total and die so a replay sees the same scores"""
+        rolls = page.rolls
+        handler(page, event)
+        if page.rolls == rolls:
+            return
+        entry = {'event': 'roll'}
+        if not rolls:
+            entry.update(expression=page.dice.text, totals=[int(total) for total in page.score_totals], dice=page.dice_rolled)
+        self.add(entry)
+
+    def record_assign(self, handler, page, event) -> None:
+        choice = event.GetEventObject()
+        entry = {'event': 'assign', 'index': page.choice_list.index(choice), 'value': choice.GetString(choice.GetSelection())}
+        handler(page, event)
+        self.add(entry)
+
+    def record_spin(self, handler, page, event) -> None:
+        """The spin button's value is read before on_spin, which puts it back when the step is not allowed"""
+        spin_window = event.GetEventObject()
+        entry = {'event': 'spin', 'index': page.spin_buttons.index(spin_window), 'value': spin_window.GetValue()}
+        handler(page, event)
+        entry['points'] = page.points_available
+        self.add(entry)
+
+    def record_reset(self, handler, page, event) -> None:
+        handler(page, event)
+        self.add({'event': 'reset'})
+
+    def record_class(self, handler, page, event) -> None:
+        handler(page, event)
+        self.add({'event': 'class', 'value': event.GetString()})
+
+    def record_race(self, handler, page, event) -> None:
+        handler(page, event)
+        self.add({'event': 'race', 'value': event.GetString()})
+
+    def record_haelf(self, handler, elements, event) -> None:
+        entry = {'event': 'haelf', 'index': elements.haelf_choice.index(event.GetEventObject()), 'value': event.GetString()}
+        handler(elements, event)
+        self.add(entry)
+
+    def record_confirm(self, handler, page, event) -> None:
+        handler(page, event)
+        self.add({'event': 'confirm', 'saved': not event.GetEventObject().IsEnabled()})
+
+    def write(self) -> None:
+        """Appends the session to output_path as one JSON line, nothing is written for a session with no events"""
+        if self.events:
+            with open(self.output_path, 'a') as file:
+                file.write(json.dumps({'events': self.events}) + '\n')
+            self.events = []
+
+
+def install_from_environment() -> SessionRecorder:
+    """Installs a SessionRecorder when DND_RECORD is set to a JSON lines file path"""
+    if RECORD_OUTPUT:
+        return SessionRecorder(RECORD_OUTPUT).install()
+    return None
+
+
+def read_sessions(file_path: str) -> list:
+    """Reads the sessions a SessionRecorder wrote, one list of events per session"""
+    with open(file_path) as file:
+        return [json.loads(line)['events'] for line in file if line.strip()]
+
+
+def write_sessions(file_path: str, sessions: list) -> None:
+    """Writes sessions in the SessionRecorder format"""
+    with open(file_path, 'w') as file:
+        for events in sessions:
+            file.write(json.dumps({'events': events}) + '\n')
+
+
+def synthetic_session(rng: random.Random, rules=None, character_rules: CharacterRules = None) -> list:
+    """
+    Makes up one realistic session by playing the wizard headless: an early Next now and then, points buy spins that overshoot and step back, up to six rolls, assignments that are sometimes changed, a second class or race pick and Half-Elf picks
+
+    Args:
+    rng (random.Random): seeded generator, the same seed gives the same session
+    rules (CachedRules): class and race data, load_rules() when not given
+    character_rules (CharacterRules): rules shared across sessions
+
+    Returns:
+    list: events in the SessionRecorder format
+    """
+    session = WizardSession(rules, character_rules, rng)
+    constants = session.CONSTANTS
+    events = []
+
+    def run(event: dict):
+        if event['event'] in ('next', 'back'):
+            event['page'] = session.page
+        result = session.apply(event)
+        if event['event'] in ('next', 'back'):
+            event['allowed'] = result
+        elif event['event'] == 'spin':
+            event['points'] = session.points_available
+        elif event['event'] == 'roll' and 'totals' not in event and session.rolls == 1:
+            event.update(expression=session.expression, totals=[int(total) for total in session.score_totals], dice=session.dice_rolled)
+        events.append(event)
+        return result
+
+    if rng.random() < 0.1:
+        run({'event': 'next'})
+    run({'event': 'method', 'choice': rng.choice([1, 2])})
+    run({'event': 'next'})
+    if session.page == 'pb_page':
+        for _ in range(10000):
+            if not session.points_available:
+                break
+            if rng.random() < 0.02:
+                run({'event': 'reset'})
+            elif rng.random() < 0.03:
+                run({'event': 'next'})
+            else:
+                index = rng.randrange(len(constants.ABILITY_NAMES))
+                value = session.pb_scores[index] + (1 if rng.random() < 0.8 else -1)
+                if constants.MIN_POINTS <= value <= constants.MAX_POINTS:
+                    run({'event': 'spin', 'index': index, 'value': value})
+        run({'event': 'next'})
+    else:
+        for _ in range(rng.randint(1, constants.ROLLS_PER_CHARACTER)):
+            run({'event': 'roll'})
+        run({'event': 'next'})
+        wanted = rng.sample(session.assign_totals, len(session.assign_totals))
+        for index in rng.sample(range(len(wanted)), len(wanted)):
+            if rng.random() < 0.1:
+                run({'event': 'assign', 'index': index, 'value': rng.choice(session.assign_totals)})
+                if rng.random() < 0.5 and sorted(session.values_list) != sorted(session.assign_totals):
+                    run({'event': 'next'})
+            if session.values_list[index] != wanted[index]:
+                run({'event': 'assign', 'index': index, 'value': wanted[index]})
+        run({'event': 'next'})
+    class_names = list(session.RaceClass.class_dict)
+    race_names = list(session.RaceClass.race_dict)
+    for _ in range(1 + (rng.random() < 0.2)):
+        run({'event': 'class', 'value': rng.choice(class_names)})
+    if rng.random() < 0.1:
+        run({'event': 'next'})
+    for _ in range(1 + (rng.random() < 0.3)):
+        run({'event': 'race', 'value': rng.choice(race_names)})
+    if session.graph.get('race') == constants.HALF_ELF:
+        for _ in range(rng.randint(0, 3)):
+            run({'event': 'haelf', 'index': rng.randrange(len(constants.HALF_ELF_DEFAULT)), 'value': rng.choice(constants.ABILITY_NAMES)})
+    run({'event': 'next'})
+    if rng.random() < 0.1:
+        run({'event': 'back'})
+        run({'event': 'next'})
+    run({'event': 'confirm', 'saved': True})
+    return events
+
+
+class ReplayStats():
+    """Counts and run time of every event type across replayed sessions, with the events whose result differed from the recording"""
+    def __init__(self):
+        self.sessions = 0
+        self.events = 0
+        self.elapsed = 0.0
+        self.counts = {}
+        self.seconds = {}
+        self.mismatches = []
+
+    def add(self, name: str, seconds: float) -> None:
+        """Records one event run"""
+        self.counts[name] = self.counts.get(name, 0) + 1
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+
+    def as_dict(self) -> dict:
+        """Summary for the JSON export, slowest event type first"""
+        handlers = {name: {'count': count, 'mean_us': self.seconds[name] / count * 1e6, 'total_ms': self.seconds[name] * 1000} for name, count in self.counts.items()}
+        return {
+            'sessions': self.sessions,
+            'events': self.events,
+            'elapsed_s': self.elapsed,
+            'sessions_per_s': self.sessions / self.elapsed if self.elapsed else 0.0,
+            'events_per_s': self.events / self.elapsed if self.elapsed else 0.0,
+            'handlers': dict(sorted(handlers.items(), key=lambda item: item[1]['mean_us'], reverse=True)),
+            'mismatches': len(self.mismatches),
+        }
+
+    def report(self) -> str:
+        """Formats the summary as a table"""
+        summary = self.as_dict()
+        lines = [f'Replayed {summary["sessions"]} sessions, {summary["events"]} events in {summary["elapsed_s"]:.2f}s ({summary["sessions_per_s"]:.0f} sessions/s, {summary["events_per_s"]:.0f} events/s), {summary["mismatches"]} mismatches']
+        lines.append(f'{"event":<12}{"count":>10}{"mean us":>10}{"total ms":>11}')
+        for name, stats in summary['handlers'].items():
+            lines.append(f'{name:<12}{stats["count"]:>10}{stats["mean_us"]:>10.2f}{stats["total_ms"]:>11.1f}')
+        return '\n'.join(lines)
+
+
+def replay_session(events: list, rules=None, character_rules: CharacterRules = None, stats: ReplayStats = None) -> WizardSession:
+    """
+    Replays one session headless, checking each page change and spin against what the wizard did when it was recorded
+
+    Args:
+    events (list): events in the SessionRecorder format
+    rules (CachedRules): class and race data, load_rules() when not given
+    character_rules (CharacterRules): rules shared across sessions
+    stats (ReplayStats): collects timings and mismatches when given
+
+    Returns:
+    WizardSession: the session after the last event
+    """
+    session = WizardSession(rules, character_rules)
+    clock = time.perf_counter
+    for position, event in enumerate(events):
+        start = clock()
+        result = session.apply(event)
+        if stats is None:
+            continue
+        stats.add(event['event'], clock() - start)
+        checked = CHECKED.get(event['event'])
+        if checked in event:
+            actual = session.points_available if checked == 'points' else result
+            if actual != event[checked]:
+                stats.mismatches.append((stats.sessions, position, event, actual))
+    if stats is not None:
+        stats.sessions += 1
+        stats.events += len(events)
+    return session
+
+
+def replay_sessions(sessions: list, repeat: int = 1, rules=None) -> ReplayStats:
+    """Replays every session headless repeat times, returning the timings"""
+    rules = rules if rules is not None else load_rules()
+    character_rules = CharacterRules()
+    stats = ReplayStats()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for events in sessions:
+            replay_session(events, rules, character_rules, stats)
+    stats.elapsed = time.perf_counter() - start
+    return stats
+
+
+class RecordedRolls():
+    """Stands in for Roll5ePage.rollDice during a wx replay so the page shows the recorded rolls"""
+    def __init__(self, totals: list, dice: list):
+        self.totals = totals
+        self.dice = dice
+
+    def roll_5e(self, expression: str = None) -> tuple:
+        """The recorded rolls in the shapes RollDice.roll_5e gives"""
+        flags = compile_expression(expression).kept_flags
+        score_dice = [[die for die, kept in zip(rolled, flags(rolled)) if kept] for rolled in self.dice]
+        return [str(total) for total in self.totals], score_dice, [list(rolled) for rolled in self.dice]
+
+
+class WxReplayer():
+    """
+    Replays sessions through the real wizard pages by setting each widget and sending it the event a click would, for a load test or profile of the wx side under a virtual display such as xvfb-run. Set DND_INSTRUMENT as well to time every handler
+
+    Confirm is the exception: its name dialog is modal, so only the modifiers are worked out, as on_confirm_button would before saving
+    """
+    def __init__(self, stats: ReplayStats = None):
+        import wx
+        self.wx = wx
+        self.app = wx.App()
+        self.stats = stats if stats is not None else ReplayStats()
+
+    def run(self, sessions: list) -> ReplayStats:
+        """Replays each session in a new MyWizard, returning the timings"""
+        from dnd_GUID import MyWizard
+        from dnd_instrument import install_from_environment as install_instrumentation
+        install_instrumentation()
+        start = time.perf_counter()
+        for events in sessions:
+            wizard = MyWizard()
+            self.wx.CallAfter(self.replay, wizard, events)
+            wizard.RunWizard(wizard.l_page)
+            wizard.Destroy()
+        self.stats.elapsed = time.perf_counter() - start
+        return self.stats
+
+    def replay(self, wizard, events: list) -> None:
+        """Sends every event to the wizard, then closes it"""
+        try:
+            for position, event in enumerate(events):
+                start = time.perf_counter()
+                result = getattr(self, f'send_{event["event"]}')(wizard, event)
+                self.wx.SafeYield()
+                self.stats.add(event['event'], time.perf_counter() - start)
+                if 'allowed' in event and result != event['allowed']:
+                    self.stats.mismatches.append((self.stats.sessions, position, event, result))
+            self.stats.sessions += 1
+            self.stats.events += len(events)
+        finally:
+            wizard.EndModal(self.wx.ID_CANCEL)
+
+    def send(self, window, event_type, **values) -> None:
+        """Sends window a command event of event_type, as a click or choice would"""
+        event = self.wx.CommandEvent(event_type, window.GetId())
+        event.SetEventObject(window)
+        if 'string' in values:
+            event.SetString(values['string'])
+            event.SetInt(window.GetSelection())
+        window.GetEventHandler().ProcessEvent(event)
+
+    def send_choice(self, choice, value: str) -> None:
+        choice.SetStringSelection(value)
+        self.send(choice, self.wx.wxEVT_CHOICE, string=value)
+
+    def send_method(self, wizard, event: dict) -> None:
+        wizard.l_page.type_choose.SetSelection(event['choice'])
+
+    def send_page_button(self, wizard, button_id: int) -> bool:
+        """Presses Next or Back, True when the wizard moved to another page"""
+        page = wizard.GetCurrentPage()
+        self.send(wizard.FindWindow(button_id), self.wx.wxEVT_BUTTON)
+        return wizard.GetCurrentPage() is not page
+
+    def send_next(self, wizard, event: dict) -> bool:
+        if not wizard.HasNextPage(wizard.GetCurrentPage()):
+            return True
+        return self.send_page_button(wizard, self.wx.ID_FORWARD)
+
+    def send_back(self, wizard, event: dict) -> bool:
+        return self.send_page_button(wizard, self.wx.ID_BACKWARD)
+
+    def send_spin(self, wizard, event: dict) -> None:
+        spinner = wizard.pb_page.spin_buttons[event['index']]
+        spinner.SetValue(event['value'])
+        spin_event = self.wx.SpinEvent(self.wx.wxEVT_SPIN, spinner.GetId())
+        spin_event.SetEventObject(spinner)
+        spin_event.SetPosition(event['value'])
+        spinner.GetEventHandler().ProcessEvent(spin_event)
+
+    def send_reset(self, wizard, event: dict) -> None:
+        wizard.pb_page.on_reset(None)
+
+    def send_roll(self, wizard, event: dict) -> None:
+        page = wizard.eeeee_page
+        if 'totals' in event and not page.roll_flag:
+            page.expression_text.SetValue(event['expression'])
+            page.rollDice = RecordedRolls(event['totals'], event['dice'])
+        self.send(page.action_button, self.wx.wxEVT_BUTTON)
+
+    def send_assign(self, wizard, event: dict) -> None:
+        self.send_choice(wizard.a_page.choice_list[event['index']], event['value'])
+
+    def send_class(self, wizard, event: dict) -> None:
+        self.send_choice(wizard.c_page.class_choice, event['value'])
+
+    def send_race(self, wizard, event: dict) -> None:
+        self.send_choice(wizard.c_page.race_choice, event['value'])
+
+    def send_haelf(self, wizard, event: dict) -> None:
+        self.send_choice(wizard.c_page.HalfElf.haelf_choice[event['index']], event['value'])
+
+    def send_confirm(self, wizard, event: dict) -> None:
+        wizard.f_page.modifier_dict = wizard.f_page.GUI.RULES.modifiers(wizard.f_page.score_dict)
+
+
+def profile_replay(sessions: list, repeat: int, rows: int, rules=None) -> tuple:
+    """Replays the sessions under cProfile, returning the timings and the top rows by cumulative time"""
+    profiler = cProfile.Profile()
+    profiler.enable()
+    stats = replay_sessions(sessions, repeat, rules)
+    profiler.disable()
+    output = io.StringIO()
+    pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(rows)
+    return stats, output.getvalue()
+
+
+def parse_args(argv: list = None) -> argparse.Namespace:
+    """Parses the command line arguments of the replay tool"""
+    parser = argparse.ArgumentParser(description='Replay recorded or synthetic wizard sessions headless, or through the wx pages, and report handler timings')
+    parser.add_argument('sessions', nargs='?', default=None, help='JSON lines file written with DND_RECORD set')
+    parser.add_argument('--synthetic', type=int, default=0, help='add this many made up sessions')
+    parser.add_argument('-s', '--seed', type=int, default=0, help='seed of the made up sessions')
+    parser.add_argument('-r', '--repeat', type=int, default=1, help='replay every session this many times')
+    parser.add_argument('--rules', default=RULES_FILE, help='class and race data file')
+    parser.add_argument('--save', default=None, help='write the sessions, made up ones included, to this JSON lines file')
+    parser.add_argument('--profile', type=int, nargs='?', const=25, default=None, help='profile the headless replay with cProfile and print this many rows')
+    parser.add_argument('--wx', action='store_true', help='replay through the real wizard pages, needs a display such as xvfb-run')
+    parser.add_argument('-o', '--output', default=None, help='write the timing summary as JSON to this file')
+    args = parser.parse_args(argv)
+    if args.sessions is None and not args.synthetic:
+        parser.error('give a sessions file or --synthetic')
+    return args
+
+
+def main(argv: list = None) -> None:
+    """Runs the replay from the command line and reports the timings on stderr"""
+    args = parse_args(argv)
+    rules = load_rules(args.rules)
+    sessions = read_sessions(args.sessions) if args.sessions else []
+    rng = random.Random(args.seed)
+    character_rules = CharacterRules()
+    sessions += [synthetic_session(rng, rules, character_rules) for _ in range(args.synthetic)]
+    if args.save:
+        write_sessions(args.save, sessions)
+    if args.wx:
+        stats = WxReplayer().run(sessions * args.repeat)
+    elif args.profile is not None:
+        stats, profile = profile_replay(sessions, args.repeat, args.profile, rules)
+        print(profile, file=sys.stderr)
+    else:
+        stats = replay_sessions(sessions, args.repeat, rules)
+    print(stats.report(), file=sys.stderr)
+    for session_index, position, event, actual in stats.mismatches[:10]:
+        print(f'session {session_index} event {position} {event} replayed as {actual}', file=sys.stderr)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(stats.as_dict(), file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,261 @@
+import random
+from dnd_dice import compile_expression
+
+
+class RuleConstants():
+    """Rules constants shared by the GUI and headless generation, holds no wx objects"""
+    def __init__(self):
+        self.POINTS_AVAILABLE_MAX = 27
+        self.COST_THRESHOLD = 13
+        self.MAX_POINTS = 15
+        self.MIN_POINTS = 8
+        self.HIGH_COST = 2
+        self.LOW_COST = 1
+        self.SCORE_INDEX = 6
+        self.MODIFIER_INDEX = 12
+        self.ABILITY_NAMES = ['Strength', 'Dexterity', 'Constitution', 'Intelligence', 'Wisdom', 'Charisma']
+        self.DICE_PER_ROLL = 4
+        self.DICE_SIDES = 6
+        self.ROLLS_PER_CHARACTER = 6
+        self.ROLL_EXPRESSION = f'{self.DICE_PER_ROLL}d{self.DICE_SIDES}kh{self.DICE_PER_ROLL - 1}'
+        self.HALF_ELF = 'Half-Elf'
+        self.HALF_ELF_DEFAULT = ['Strength'] * 2
+
+
+class CharacterRules():
+    """The character creation rules with no GUI attached, used by the wizard pages and by batch generation"""
+    def __init__(self, constants: RuleConstants = None):
+        self.CONSTANTS = constants if constants is not None else RuleConstants()
+
+    def roll_5e(self, rng: random.Random = None, expression: str = None) -> tuple:
+        """
+        Simulates rolling 4d6 6 times and removing the lowest die from each roll, or rolling another dice expression 6 times
+
+        Args:
+        rng (random.Random): optional seeded generator, the random module is used when not given
+        expression (str): dice expression such as 3d6 or 4d6r1kh3, ROLL_EXPRESSION when not given
+
+        Returns:
+        score_totals (list): 6 ints, the total of each roll
+        score_dice (list): 6 lists of 3 ints, the dice kept from each roll
+        dice_rolled (list): 6 lists of 4 ints, the dice in the order they were rolled
+        """
+        dice = compile_expression(expression or self.CONSTANTS.ROLL_EXPRESSION)
+        dice_rolled, score_dice, score_totals = [], [], []
+        for _ in range(self.CONSTANTS.ROLLS_PER_CHARACTER):
+            total, kept, rolled = dice.roll(rng)
+            dice_rolled.append(rolled)
+            score_dice.append(kept)
+            score_totals.append(total)
+        return score_totals, score_dice, dice_rolled
+
+    def update_values_logic(self, current_score: int, new_score: int) -> int:
+        """
+        Gives the change to points available when a points buy score moves one step from current_score to new_score
+
+        Args:
+        current_score (int): score before the change
+        new_score (int): score after the change
+
+        Returns:
+        increment (int): negative when points are spent, positive when they are refunded
+        """
+        if new_score > current_score:
+            if current_score >= self.CONSTANTS.COST_THRESHOLD:
+                return - self.CONSTANTS.HIGH_COST
+            return - self.CONSTANTS.LOW_COST
+        if current_score > self.CONSTANTS.COST_THRESHOLD:
+            return self.CONSTANTS.HIGH_COST
+        return self.CONSTANTS.LOW_COST
+
+    def spin_allowed(self, current_score: int, new_score: int, points_available: int) -> bool:
+        """
+        Checks whether a points buy score may move from current_score to new_score with the points left
+
+        Args:
+        current_score (int): score before the change
+        new_score (int): requested score
+        points_available (int): points not yet spent
+
+        Returns:
+        bool: False when the score is unchanged or the increase cannot be afforded
+        """
+        if new_score == current_score:
+            return False
+        if new_score > current_score:
+            return points_available >= -self.update_values_logic(current_score, new_score)
+        return True
+
+    def point_cost(self, score: int) -> int:
+        """
+        Total points buy cost of raising a score from MIN_POINTS to score
+
+        Args:
+        score (int): score between MIN_POINTS and MAX_POINTS
+
+        Returns:
+        int: points spent on the score
+        """
+        if not self.CONSTANTS.MIN_POINTS <= score <= self.CONSTANTS.MAX_POINTS:
+            raise ValueError(f'Points buy score {score} outside {self.CONSTANTS.MIN_POINTS}-{self.CONSTANTS.MAX_POINTS}')
+        cost = 0
+        for current in range(self.CONSTANTS.MIN_POINTS, score):
+            cost -= self.update_values_logic(current, current + 1)
+        return cost
+
+    def points_spent(self, scores: list) -> int:
+        """Sums the points buy cost of each score in scores"""
+        return sum(self.point_cost(int(score)) for score in scores)
+
+    def points_remaining(self, scores: list) -> int:
+        """Gives the points_available counter the PointsBuyPage would show for scores"""
+        return self.CONSTANTS.POINTS_AVAILABLE_MAX - self.points_spent(scores)
+
+    def is_valid_point_buy(self, scores: list, require_all_spent: bool = True) -> bool:
+        """
+        Checks a full set of points buy scores against the rules
+
+        Args:
+        scores (list): one score per ability, in ABILITY_NAMES order
+        require_all_spent (bool): True to require every point spent, as the PointsBuyPage does before moving on
+
+        Returns:
+        bool: True when the scores are legal
+        """
+        if len(scores) != len(self.CONSTANTS.ABILITY_NAMES):
+            return False
+        try:
+            remaining = self.points_remaining(scores)
+        except ValueError:
+            return False
+        return remaining == 0 if require_all_spent else remaining >= 0
+
+    def point_buy_dict(self, scores: list) -> dict:
+        """
+        Creates the score_dict for a points buy, raising ValueError if the scores are not legal
+
+        Args:
+        scores (list): one score per ability, in ABILITY_NAMES order
+
+        Returns:
+        dict: ability names as keys and int scores as values
+        """
+        if not self.is_valid_point_buy(scores):
+            raise ValueError(f'Illegal points buy allocation: {scores}')
+        return dict(zip(self.CONSTANTS.ABILITY_NAMES, (int(score) for score in scores)))
+
+    def assign_rolls(self, score_totals: list, values_list: list) -> dict:
+        """
+        Creates the score_dict from rolled totals assigned to abilities, as the AssignRollsPage does
+
+        Args:
+        score_totals (list): the rolled totals
+        values_list (list): the total chosen for each ability, in ABILITY_NAMES order
+
+        Returns:
+        dict: ability names as keys and int scores as values
+        """
+        if sorted(int(value) for value in values_list) != sorted(int(total) for total in score_totals):
+            raise ValueError(f'{values_list} is not an assignment of {score_totals}')
+        return dict(zip(self.CONSTANTS.ABILITY_NAMES, (int(value) for value in values_list)))
+
+    def colour_changes(self, old_list: list, values_list: list, labels: list, colours: list, score_totals: list) -> list:
+        """
+        Decides which remaining score to turn green and which to turn red after an AssignRollsPage choice, at most one of each
+
+        Args:
+        old_list (list): totals chosen across the abilities before the choice
+        values_list (list): totals chosen across the abilities after the choice
+        labels (list): total shown by each remaining score
+        colours (list): 'green', 'red' or None for the current background of each remaining score
+        score_totals (list): the rolled totals
+
+        Returns:
+        list: (index, colour) pairs for the remaining scores to change
+        """
+        changes = []
+        to_green = to_red = False
+        for index, label in enumerate(labels):
+            old_count = old_list.count(label)
+            new_count = values_list.count(label)
+            if not to_green and colours[index] != 'green' and old_count < new_count:
+                changes.append((index, 'green'))
+                to_green = True
+            elif not to_red and colours[index] != 'red' and old_count > new_count and new_count < score_totals.count(label):
+                changes.append((index, 'red'))
+                to_red = True
+            if to_green and to_red:
+                break
+        return changes
+
+    def race_bonus(self, race_dict: dict, race: str, haelf_select: list = None) -> dict:
+        """
+        Gives the ability bonuses for a race, replacing the Half-Elf default picks with haelf_select
+
+        Args:
+        race_dict (dict): race data from initRaceClass
+        race (str): key of race_dict
+        haelf_select (list): the two abilities picked for Half-Elf, defaults to HALF_ELF_DEFAULT
+
+        Returns:
+        dict: ability names as keys and the bonus as values, abilities without a bonus are left out
+        """
+        bonus = dict(race_dict[race])
+        if race == self.CONSTANTS.HALF_ELF and haelf_select is not None:
+            picks = list(haelf_select)
+            if len(picks) != len(self.CONSTANTS.HALF_ELF_DEFAULT):
+                raise ValueError(f'Half-Elf needs {len(self.CONSTANTS.HALF_ELF_DEFAULT)} picks, got {picks}')
+            for ability in picks:
+                if ability not in self.CONSTANTS.ABILITY_NAMES:
+                    raise ValueError(f'Unknown ability {ability}')
+            for ability in self.CONSTANTS.HALF_ELF_DEFAULT:
+                bonus[ability] = bonus.get(ability, 0) - 1
+            for ability in picks:
+                bonus[ability] = bonus.get(ability, 0) + 1
+            bonus = {ability: value for ability, value in bonus.items() if value}
+        return bonus
+
+    def apply_race(self, score_dict: dict, bonus: dict) -> dict:
+        """
+        Adds race bonuses to the scores
+
+        Args:
+        score_dict (dict): ability names as keys, scores as str or int values
+        bonus (dict): from race_bonus
+
+        Returns:
+        dict: ability names as keys and int scores as values
+        """
+        return {ability: int(score) + bonus.get(ability, 0) for ability, score in score_dict.items()}
+
+    def modifiers(self, score_dict: dict) -> dict:
+        """
+        Calculates the ability modifier for each score
+
+        Args:
+        score_dict (dict): ability names as keys, scores as str or int values
+
+        Returns:
+        dict: ability names as keys and int modifiers as values
+        """
+        return {key: (int(value) - 10) // 2 for key, value in score_dict.items()}
+
+    def finalise(self, score_dict: dict, class_name: str, race: str, race_dict: dict, haelf_select: list = None) -> tuple:
+        """
+        Produces the three dicts FinalisePage.write_file saves, from base scores, a class and a race
+
+        Args:
+        score_dict (dict): base scores before race bonuses
+        class_name (str): chosen class
+        race (str): key of race_dict
+        race_dict (dict): race data from initRaceClass
+        haelf_select (list): the Half-Elf picks, only used for Half-Elf
+
+        Returns:
+        character_dict (dict): 'Class' and 'Race' keys
+        score_dict (dict): race adjusted int scores
+        modifier_dict (dict): int modifiers of the adjusted scores
+        """
+        final_scores = self.apply_race(score_dict, self.race_bonus(race_dict, race, haelf_select))
+        character_dict = {'Class': class_name, 'Race': race}
+        return character_dict, final_scores, self.modifiers(final_scores)
@@ -0,0 +1,131 @@
+import hashlib
+import io
+import os
+import pickle
+import tempfile
+import threading
+from dnd_init_class import initRaceClass as raceClass
+
+RULES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Class_Race.txt')
+CACHE_DIR = os.environ.get('DND_RULES_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'dnd_rules'))
+SNAPSHOT_VERSION = 1
+
+
+def read_lines(content: bytes) -> list:
+    """Splits a rules file's bytes into lines the way initRaceClass reads it in text mode, so CRLF endings become \\n and 'Race\\n' is found"""
+    return io.TextIOWrapper(io.BytesIO(content)).readlines()
+
+
+class CachedRules():
+    """Parsed class and race data with the file details it was parsed from, used in place of an initRaceClass instance"""
+    def __init__(self, file_path: str, mtime_ns: int, size: int, digest: str, class_dict: dict, race_dict: dict):
+        self.file_path = file_path
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.digest = digest
+        self.class_dict = class_dict
+        self.race_dict = race_dict
+
+
+class RulesCache():
+    """Process-wide cache of parsed rules files, keyed by path and checked against the file's mtime, size and hash, with a pickled snapshot on disk for warm starts"""
+    def __init__(self, cache_dir: str = CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.memory = {}
+        self.lock = threading.Lock()
+
+    def load(self, file_path: str = RULES_FILE, lines_to_skip: int = 1, split_point: str = 'Race\n') -> CachedRules:
+        """
+        Gives the parsed rules for file_path, parsing the text only when neither the memory cache nor the disk snapshot matches the file
+
+        Args:
+        file_path (str): rules file, relative paths are taken from the current directory
+        lines_to_skip (int): passed to initRaceClass
+        split_point (str): passed to initRaceClass
+
+        Returns:
+        CachedRules: holding class_dict and race_dict
+        """
+        file_path = os.path.abspath(file_path)
+        key = (file_path, lines_to_skip, split_point)
+        stat = os.stat(file_path)
+        with self.lock:
+            rules = self.memory.get(key)
+            if rules is not None and (rules.mtime_ns, rules.size) == (stat.st_mtime_ns, stat.st_size):
+                return rules
+            snapshot_path = self.snapshot_path(key)
+            snapshot = self.read_snapshot(snapshot_path)
+            if snapshot is None or (snapshot.mtime_ns, snapshot.size) != (stat.st_mtime_ns, stat.st_size):
+                rules = self.parse(file_path, stat, lines_to_skip, split_point, snapshot)
+                self.write_snapshot(snapshot_path, rules)
+            else:
+                rules = snapshot
+            self.memory[key] = rules
+            return rules
+
+    def parse(self, file_path: str, stat: os.stat_result, lines_to_skip: int, split_point: str, snapshot: CachedRules = None) -> CachedRules:
+        """
+        Reads the rules file, reusing the old snapshot's dicts when only the mtime changed and the content hash still matches
+
+        Args:
+        file_path (str): absolute path of the rules file
+        stat (os.stat_result): stat taken before reading
+        lines_to_skip (int): passed to initRaceClass
+        split_point (str): passed to initRaceClass
+        snapshot (CachedRules): previous snapshot, if any
+
+        Returns:
+        CachedRules: parsed rules
+        """
+        with open(file_path, 'rb') as file:
+            content = file.read()
+        digest = hashlib.sha256(content).hexdigest()
+        if snapshot is not None and snapshot.digest == digest:
+            return CachedRules(file_path, stat.st_mtime_ns, stat.st_size, digest, snapshot.class_dict, snapshot.race_dict)
+        race_class = raceClass(file_path, lines_to_skip, split_point, read_lines(content))
+        return CachedRules(file_path, stat.st_mtime_ns, stat.st_size, digest, race_class.class_dict, race_class.race_dict)
+
+    def store(self, rules: CachedRules, lines_to_skip: int = 1, split_point: str = 'Race\n') -> None:
+        """Puts rules parsed elsewhere, such as by RulesWatcher, into the memory cache and the disk snapshot so later loads do not parse the file again"""
+        key = (rules.file_path, lines_to_skip, split_point)
+        with self.lock:
+            self.memory[key] = rules
+            self.write_snapshot(self.snapshot_path(key), rules)
+
+    def snapshot_path(self, key: tuple) -> str:
+        """Gives the snapshot file for a cache key"""
+        name = hashlib.sha1(repr(key).encode()).hexdigest()
+        return os.path.join(self.cache_dir, f'{name}.pickle')
+
+    def read_snapshot(self, snapshot_path: str) -> CachedRules:
+        """Loads a snapshot, giving None if it is missing, unreadable or from another snapshot version"""
+        try:
+            with open(snapshot_path, 'rb') as file:
+                version, rules = pickle.load(file)
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError, TypeError, AttributeError):
+            return None
+        return rules if version == SNAPSHOT_VERSION else None
+
+    def write_snapshot(self, snapshot_path: str, rules: CachedRules) -> None:
+        """Writes a snapshot atomically, a cache directory that cannot be written only costs the warm start"""
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            handle, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            with os.fdopen(handle, 'wb') as file:
+                pickle.dump((SNAPSHOT_VERSION, rules), file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, snapshot_path)
+        except OSError:
+            pass
+
+    def clear(self) -> None:
+        """Empties the memory cache, snapshots on disk are kept"""
+        with self.lock:
+            self.memory.clear()
+
+
+RULES_CACHE = RulesCache()
+
+
+def load_rules(file_path: str = RULES_FILE, lines_to_skip: int = 1, split_point: str = 'Race\n') -> CachedRules:
+    """Loads rules through the process-wide RULES_CACHE"""
+    return RULES_CACHE.load(file_path, lines_to_skip, split_point)
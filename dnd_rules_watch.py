@@ -0,0 +1,165 @@
+import hashlib
+import os
+import sys
+import threading
+from dnd_init_class import initRaceClass as raceClass
+from dnd_rules_cache import RULES_CACHE, RULES_FILE, CachedRules, RulesCache, read_lines
+
+WATCH_INTERVAL = float(os.environ.get('DND_RULES_WATCH_INTERVAL', 1.0))
+
+
+class RulesWatcher():
+    """
+    Polls a rules file's mtime and size and reloads it when they change, parsing only the class and race lines not seen before
+
+    The new class_dict and race_dict are swapped in together as one CachedRules, so a reader holding rules never sees one dict from before an edit and one from after
+    """
+    def __init__(self, file_path: str = RULES_FILE, interval: float = WATCH_INTERVAL, cache: RulesCache = RULES_CACHE, lines_to_skip: int = 1, split_point: str = 'Race\n'):
+        self.file_path = os.path.abspath(file_path)
+        self.interval = interval
+        self.cache = cache
+        self.lines_to_skip = lines_to_skip
+        self.split_point = split_point
+        self.rules = cache.load(self.file_path, lines_to_skip, split_point)
+        self.signature = (self.rules.mtime_ns, self.rules.size)
+        self.parser = raceClass(self.file_path, 0, split_point, [split_point])
+        self.parsed = {}
+        self.subscribers = []
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def subscribe(self, callback) -> None:
+        """Calls callback(rules, changes) after each reload, on the watcher thread"""
+        with self.lock:
+            self.subscribers.append(callback)
+
+    def unsubscribe(self, callback) -> None:
+        """Stops calling callback"""
+        with self.lock:
+            if callback in self.subscribers:
+                self.subscribers.remove(callback)
+
+    def start(self) -> 'RulesWatcher':
+        """Starts polling on a daemon thread, doing nothing if already started"""
+        if self.thread is None:
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self.run, name='RulesWatcher', daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stops polling and waits for the thread"""
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def run(self) -> None:
+        """Fills the line cache from the loaded file, then polls every interval seconds until stopped, a failed reload is reported and the old rules are kept"""
+        try:
+            with open(self.file_path, 'rb') as file:
+                self.parse_lines(read_lines(file.read()))
+        except (OSError, ValueError, IndexError):
+            self.parsed = {}
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as error:
+                print(f'Rules watcher: {error!r}', file=sys.stderr)
+
+    def poll(self) -> dict:
+        """
+        Checks the file once and reloads it if its mtime or size changed
+
+        Returns:
+        dict: the changes from compare plus 'lines_parsed', or None when nothing was reloaded
+        """
+        try:
+            stat = os.stat(self.file_path)
+        except OSError:
+            return None
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if signature == self.signature:
+            return None
+        self.signature = signature
+        with open(self.file_path, 'rb') as file:
+            content = file.read()
+        digest = hashlib.sha256(content).hexdigest()
+        old = self.rules
+        if digest == old.digest:
+            self.rules = CachedRules(self.file_path, stat.st_mtime_ns, stat.st_size, digest, old.class_dict, old.race_dict)
+            self.cache.store(self.rules, self.lines_to_skip, self.split_point)
+            return None
+        try:
+            class_dict, race_dict, lines_parsed = self.parse_lines(read_lines(content))
+        except (ValueError, IndexError) as error:
+            print(f'Rules file {self.file_path} not reloaded, keeping the previous rules: {error}', file=sys.stderr)
+            return None
+        self.rules = CachedRules(self.file_path, stat.st_mtime_ns, stat.st_size, digest, class_dict, race_dict)
+        self.cache.store(self.rules, self.lines_to_skip, self.split_point)
+        changes = {'classes': self.compare(old.class_dict, class_dict), 'races': self.compare(old.race_dict, race_dict), 'lines_parsed': lines_parsed}
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for callback in subscribers:
+            callback(self.rules, changes)
+        return changes
+
+    def parse_lines(self, lines: list) -> tuple:
+        """
+        Builds class_dict and race_dict from the file's lines, parsing a line only when the same text was not in the same section last time
+
+        Args:
+        lines (list): every line of the file, with line endings
+
+        Returns:
+        class_dict (dict): as initRaceClass gives
+        race_dict (dict): as initRaceClass gives
+        lines_parsed (int): lines that had to be parsed
+        """
+        body = lines[self.lines_to_skip:]
+        divider = body.index(self.split_point)
+        class_dict, race_dict = {}, {}
+        parsed = {}
+        lines_parsed = 0
+        for section, section_lines, target in (('class', body[:divider], class_dict), ('race', body[divider + 1:], race_dict)):
+            for line in section_lines:
+                if not line.strip():
+                    continue
+                key = (section, line)
+                entry = self.parsed.get(key)
+                if entry is None:
+                    entry = self.parser.parse_class_line(line) if section == 'class' else self.parser.parse_race_line(line)
+                    lines_parsed += 1
+                parsed[key] = entry
+                target[entry[0]] = entry[1]
+        self.parsed = parsed
+        return class_dict, race_dict, lines_parsed
+
+    def compare(self, old: dict, new: dict) -> dict:
+        """Names added, removed and changed between two class or race dicts"""
+        return {
+            'added': [name for name in new if name not in old],
+            'removed': [name for name in old if name not in new],
+            'changed': [name for name in new if name in old and new[name] != old[name]],
+        }
+
+
+WATCHERS = {}
+WATCHERS_LOCK = threading.Lock()
+
+
+def watch_rules(file_path: str = RULES_FILE, interval: float = WATCH_INTERVAL) -> RulesWatcher:
+    """
+    Gives the process-wide watcher for a rules file, started on first use, so the wizard and a service in the same process share one thread
+
+    Returns:
+    RulesWatcher: None when interval is 0 or less, which turns watching off
+    """
+    if interval <= 0:
+        return None
+    file_path = os.path.abspath(file_path)
+    with WATCHERS_LOCK:
+        if file_path not in WATCHERS:
+            WATCHERS[file_path] = RulesWatcher(file_path, interval).start()
+        return WATCHERS[file_path]
@@ -0,0 +1,508 @@
+import argparse
+import asyncio
+import collections
+import json
+import multiprocessing
+import os
+import random
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from dnd_batch import ASSIGNMENTS, METHODS, BatchGenerator, chunk_jobs
+from dnd_dice import compile_expression
+from dnd_rules import CharacterRules
+from dnd_rules_cache import RULES_FILE, load_rules
+from dnd_rules_watch import WATCH_INTERVAL, watch_rules
+from dnd_session_manager import SESSION_DIR, SESSION_TTL, SessionManager
+
+HOST = '127.0.0.1'
+PORT = int(os.environ.get('DND_SERVICE_PORT', 8765))
+STREAM_THRESHOLD = 1000
+INLINE_DICE = 24000
+MAX_BODY_BYTES = 16 * 1024 * 1024
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+
+class HTTPError(Exception):
+    """An error answered with an HTTP status and a JSON {'error': message} body"""
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+_worker_generators = {}
+_worker_data = {}
+
+
+def _init_worker(rules_file: str, point_buys: list) -> None:
+    """Process pool initialiser, keeps the rules file and points buy list so each worker builds its BatchGenerators once per rules version"""
+    _worker_data.update(rules_file=rules_file, point_buys=point_buys, digest=None)
+
+
+def _generate_chunk(job: tuple) -> list:
+    """Process pool task, generates one chunk with the worker's BatchGenerator for the job's assignment and dice, reloading the rules first when the job was made with a newer version"""
+    method, seed, chunk, count, assign, dice, digest = job
+    if digest != _worker_data['digest']:
+        rules = load_rules(_worker_data['rules_file'])
+        _worker_data.update(rules=rules, digest=digest)
+        _worker_generators.clear()
+    if (assign, dice) not in _worker_generators:
+        rules = _worker_data['rules']
+        _worker_generators[assign, dice] = BatchGenerator(rules.class_dict, rules.race_dict, point_buys=_worker_data['point_buys'], assign=assign, dice=dice)
+    return _worker_generators[assign, dice].generate_chunk(method, seed, chunk, count)
+
+
+def _roll_chunk(job: tuple) -> list:
+    """Process pool task, rolls one chunk of characters' dice from the chunk's own random stream"""
+    seed, chunk, count, dice = job
+    rules = CharacterRules()
+    rng = random.Random(f'{seed}-{chunk}')
+    return [roll_record(rules.roll_5e(rng, dice)) for _ in range(count)]
+
+
+def _roll_characters(job: tuple) -> list:
+    """Rolls count characters' dice from one seeded stream, on the event loop for small jobs or as a pool task for expensive ones"""
+    seed, count, dice = job
+    rules = CharacterRules()
+    rng = random.Random(seed) if seed is not None else random
+    return [roll_record(rules.roll_5e(rng, dice)) for _ in range(count)]
+
+
+def roll_record(roll: tuple) -> dict:
+    """Names the three lists CharacterRules.roll_5e returns"""
+    score_totals, score_dice, dice_rolled = roll
+    return {'score_totals': score_totals, 'score_dice': score_dice, 'dice_rolled': dice_rolled}
+
+
+class CharacterService():
+    """
+    Local HTTP/JSON service for the generation rules, loading the rules once and keeping a bounded process pool for large batches
+
+    Every endpoint takes a JSON object, or a JSON list of objects to batch many requests in one round trip. Large rolls and every generate request stream JSON lines back with chunked transfer encoding
+    """
+    def __init__(self, rules_file: str = RULES_FILE, workers: int = None, chunk_size: int = 10000, watch_interval: float = WATCH_INTERVAL, sessions: SessionManager = None):
+        self.rules_file = rules_file
+        self.rules = load_rules(rules_file)
+        self.watch_interval = watch_interval
+        self.RULES = CharacterRules()
+        self.CONSTANTS = self.RULES.CONSTANTS
+        self.generator = BatchGenerator(self.class_dict, self.race_dict, self.RULES)
+        self.sessions = sessions if sessions is not None else SessionManager(self.rules, character_rules=self.RULES)
+        self.watcher = None
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.executor = None
+        self.slots = None
+        self.routes = {
+            '/roll': self.roll,
+            '/point-buy/validate': self.validate_point_buy,
+            '/apply-race': self.apply_race,
+            '/finalise': self.finalise,
+            '/generate': self.generate,
+            '/session/new': self.new_session,
+            '/session/event': self.session_event,
+            '/session/get': self.get_session,
+            '/session/delete': self.delete_session,
+            '/session/stats': self.session_stats,
+        }
+
+    @property
+    def class_dict(self) -> dict:
+        """Class data of the current rules"""
+        return self.rules.class_dict
+
+    @property
+    def race_dict(self) -> dict:
+        """Race data of the current rules"""
+        return self.rules.race_dict
+
+    async def start(self, host: str = HOST, port: int = PORT) -> asyncio.AbstractServer:
+        """Builds the points buy list off the event loop, starts the worker pool and the rules watcher and listens on host and port. Workers start from a forkserver, so they never inherit client sockets open when the pool grows"""
+        loop = asyncio.get_running_loop()
+        point_buys = await loop.run_in_executor(None, self.generator.point_buy_choices)
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('forkserver'), initializer=_init_worker, initargs=(self.rules_file, point_buys))
+        self.slots = asyncio.Semaphore(2 * self.workers)
+        self.watcher = watch_rules(self.rules_file, self.watch_interval)
+        if self.watcher is not None:
+            self.watcher.subscribe(self.on_rules_changed)
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+    def on_rules_changed(self, rules, changes: dict) -> None:
+        """Called on the watcher thread, swaps the reloaded rules in for the requests that start after it, workers reload when they get a job made with them"""
+        self.rules = rules
+        self.sessions.set_rules(rules)
+        print(f'Rules reloaded: {changes}', file=sys.stderr)
+
+    def close(self) -> None:
+        """Stops listening for rules changes and shuts the worker pool down"""
+        if self.watcher is not None:
+            self.watcher.unsubscribe(self.on_rules_changed)
+            self.watcher = None
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+
+    async def submit(self, function, job: tuple) -> asyncio.Future:
+        """Queues a job on the pool once a slot is free, at most 2 jobs per worker are queued or running across all requests"""
+        await self.slots.acquire()
+        future = asyncio.get_running_loop().run_in_executor(self.executor, function, job)
+        future.add_done_callback(lambda _: self.slots.release())
+        return future
+
+    async def run_jobs(self, function, jobs: list):
+        """
+        Runs jobs on the pool, a few ahead of the one being sent, yielding results in job order
+
+        Args:
+        function: module level task taking one job tuple
+        jobs (list): job tuples
+
+        Yields:
+        list: result of each job
+        """
+        jobs = iter(jobs)
+        pending = collections.deque()
+        try:
+            for job in jobs:
+                pending.append(await self.submit(function, job))
+                if len(pending) >= self.workers:
+                    break
+            while pending:
+                result = await pending.popleft()
+                job = next(jobs, None)
+                if job is not None:
+                    pending.append(await self.submit(function, job))
+                yield result
+        finally:
+            for future in pending:
+                future.cancel()
+
+    async def roll(self, request: dict):
+        """
+        Rolls 4d6 drop lowest, or another dice expression, for count characters, {'count': 1, 'seed': None, 'dice': '4d6kh3'}
+
+        Returns:
+        dict: {'rolls': [...]} with score_totals, score_dice and dice_rolled per character, or a stream of them when count is over STREAM_THRESHOLD. Up to INLINE_DICE dice are rolled on the event loop, more go to the worker pool so a large expression does not hold up other requests
+        """
+        count = int(request.get('count', 1))
+        seed = request.get('seed')
+        dice = self.check_dice(request)
+        if count <= STREAM_THRESHOLD:
+            job = (seed, count, dice)
+            if count * self.CONSTANTS.ROLLS_PER_CHARACTER * compile_expression(dice or self.CONSTANTS.ROLL_EXPRESSION).dice_count <= INLINE_DICE:
+                return {'rolls': _roll_characters(job)}
+            return {'rolls': await (await self.submit(_roll_characters, job))}
+        seed = seed if seed is not None else random.randrange(2 ** 32)
+        jobs = [(seed, chunk, size, dice) for _, seed, chunk, size in chunk_jobs(count, self.chunk_size, 'roll', seed)]
+        return self.run_jobs(_roll_chunk, jobs)
+
+    async def validate_point_buy(self, request: dict) -> dict:
+        """
+        Checks a points buy, {'scores': [...] or {...}, 'require_all_spent': True}
+
+        Returns:
+        dict: 'valid' and 'points_remaining', None when a score is outside the buyable range
+        """
+        scores = self.score_list(request)
+        try:
+            remaining = self.RULES.points_remaining(scores)
+        except ValueError:
+            remaining = None
+        return {'valid': self.RULES.is_valid_point_buy(scores, request.get('require_all_spent', True)), 'points_remaining': remaining}
+
+    async def apply_race(self, request: dict) -> dict:
+        """
+        Adds race bonuses, {'scores': {...}, 'race': 'Elf', 'haelf_select': [...]}
+
+        Returns:
+        dict: 'bonus' and the race adjusted 'scores'
+        """
+        race = self.check_race(request)
+        bonus = self.RULES.race_bonus(self.race_dict, race, request.get('haelf_select'))
+        return {'bonus': bonus, 'scores': self.RULES.apply_race(self.score_dict(request), bonus)}
+
+    async def finalise(self, request: dict) -> dict:
+        """
+        Produces a finished character, {'scores': {...}, 'class': 'Bard', 'race': 'Elf', 'haelf_select': [...]}
+
+        Returns:
+        dict: 'character', 'scores' and 'modifiers', what FinalisePage.write_file saves
+        """
+        race = self.check_race(request)
+        class_name = request.get('class')
+        if class_name not in self.class_dict:
+            raise HTTPError(400, f'Unknown class {class_name}')
+        character_dict, score_dict, modifier_dict = self.RULES.finalise(self.score_dict(request), class_name, race, self.race_dict, request.get('haelf_select'))
+        return {'character': character_dict, 'scores': score_dict, 'modifiers': modifier_dict}
+
+    async def generate(self, request: dict):
+        """
+        Streams count complete characters from the worker pool, {'count': 1000, 'method': 'mixed', 'seed': 0, 'assign': 'rolled', 'dice': '4d6kh3'}
+
+        Returns:
+        async generator: lists of character dicts from BatchGenerator.generate_character, in chunk order
+        """
+        count = int(request.get('count', 1))
+        method = request.get('method', 'mixed')
+        assign = request.get('assign', 'rolled')
+        if method not in METHODS + ['mixed']:
+            raise HTTPError(400, f'Unknown method {method}, expected one of {METHODS + ["mixed"]}')
+        if assign not in ASSIGNMENTS:
+            raise HTTPError(400, f'Unknown assignment {assign}, expected one of {ASSIGNMENTS}')
+        seed = request.get('seed', 0)
+        dice = self.check_dice(request)
+        jobs = [job + (assign, dice, self.rules.digest) for job in chunk_jobs(count, self.chunk_size, method, seed)]
+        return self.run_jobs(_generate_chunk, jobs)
+
+    async def new_session(self, request: dict) -> dict:
+        """
+        Starts a wizard session held by the SessionManager, {}
+
+        Returns:
+        dict: the 'session' id to send with its events, and the landing page view
+        """
+        session_id = self.sessions.create()
+        return {'session': session_id, **self.sessions.get(session_id).view()}
+
+    async def session_event(self, request: dict) -> dict:
+        """
+        Runs wizard events on a session, {'session': id, 'event': {'event': 'spin', 'index': 0, 'value': 9}} or 'events' with a list, in the form dnd_replay records
+
+        Returns:
+        dict: the 'result' of each event, e.g. False for a vetoed Next, and the session's view after them
+        """
+        session_id = self.check_session(request)
+        events = request['events'] if 'events' in request else request.get('event')
+        if not isinstance(events, (dict, list)):
+            raise HTTPError(400, "Send an 'event' object or an 'events' list")
+        try:
+            result, session = self.sessions.apply(session_id, events)
+        except (KeyError, IndexError, TypeError, ValueError) as error:
+            raise HTTPError(400, f'Bad event: {error!r}')
+        return {'session': session_id, 'result': result, **session.view()}
+
+    async def get_session(self, request: dict) -> dict:
+        """The view of a session, {'session': id}"""
+        session_id = self.check_session(request)
+        return {'session': session_id, **self.sessions.get(session_id).view()}
+
+    async def delete_session(self, request: dict) -> dict:
+        """Forgets a finished or abandoned session, {'session': id}"""
+        return {'deleted': self.sessions.delete(str(request.get('session')))}
+
+    async def session_stats(self, request: dict) -> dict:
+        """How many sessions are live, compact and spilled, with the running counts of SessionManager.stats"""
+        return self.sessions.stats()
+
+    def check_session(self, request: dict) -> str:
+        """The request's session id, raising a 404 when it is unknown or expired"""
+        session_id = str(request.get('session'))
+        try:
+            self.sessions.get(session_id)
+        except KeyError:
+            raise HTTPError(404, f'Unknown or expired session {session_id}')
+        return session_id
+
+    def score_list(self, request: dict) -> list:
+        """The request's scores in ABILITY_NAMES order, given as a list or as a dict keyed by ability"""
+        scores = request.get('scores')
+        if isinstance(scores, dict):
+            return [scores[ability] for ability in self.CONSTANTS.ABILITY_NAMES]
+        if isinstance(scores, list):
+            return scores
+        raise HTTPError(400, 'scores must be a list or an object keyed by ability')
+
+    def score_dict(self, request: dict) -> dict:
+        """The request's scores as a score_dict"""
+        return dict(zip(self.CONSTANTS.ABILITY_NAMES, self.score_list(request)))
+
+    def check_dice(self, request: dict) -> str:
+        """The request's dice expression, None for the default, raising a 400 when it cannot be rolled"""
+        dice = request.get('dice')
+        if dice is None:
+            return None
+        try:
+            return compile_expression(str(dice)).text
+        except ValueError as error:
+            raise HTTPError(400, str(error))
+
+    def check_race(self, request: dict) -> str:
+        """The request's race, raising a 400 when it is not in the rules"""
+        race = request.get('race')
+        if race not in self.race_dict:
+            raise HTTPError(400, f'Unknown race {race}')
+        return race
+
+    async def dispatch(self, path: str, payload):
+        """Runs the endpoint for path on one request object, or on each object of a batched list"""
+        handler = self.routes[path]
+        if isinstance(payload, list):
+            if not all(isinstance(request, dict) for request in payload):
+                raise HTTPError(400, 'Body must be a JSON object or a list of objects')
+            results = [await handler(request) for request in payload]
+            if any(hasattr(result, '__aiter__') for result in results):
+                raise HTTPError(400, 'Streamed requests cannot be batched')
+            return results
+        if not isinstance(payload, dict):
+            raise HTTPError(400, 'Body must be a JSON object or a list of objects')
+        return await handler(payload)
+
+    async def read_request(self, reader: asyncio.StreamReader) -> tuple:
+        """
+        Reads one HTTP request
+
+        Returns:
+        tuple: method, path without the query string, lower case headers and body bytes, or None when the client has closed the connection
+        """
+        line = await reader.readline()
+        if not line.strip():
+            return None
+        try:
+            method, target, _ = line.decode('latin-1').split(' ', 2)
+        except ValueError:
+            raise HTTPError(400, 'Malformed request line')
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            raise HTTPError(400, 'Content-Length must be a whole number')
+        if length < 0:
+            raise HTTPError(400, 'Content-Length cannot be negative')
+        if length > MAX_BODY_BYTES:
+            raise HTTPError(413, f'Body over {MAX_BODY_BYTES} bytes')
+        body = await reader.readexactly(length) if length else b''
+        return method.upper(), target.split('?', 1)[0], headers, body
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Answers requests on one connection until the client closes it or asks to"""
+        try:
+            while True:
+                try:
+                    request = await self.read_request(reader)
+                except HTTPError as error:
+                    await self.send_json(writer, error.status, {'error': error.message}, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                method, path, headers, body = request
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                if not await self.respond(writer, method, path, body, keep_alive):
+                    break
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, writer: asyncio.StreamWriter, method: str, path: str, body: bytes, keep_alive: bool) -> bool:
+        """
+        Runs one request and writes its response
+
+        Returns:
+        bool: False when the connection has to be closed, after a stream failed part way
+        """
+        try:
+            if path not in self.routes:
+                raise HTTPError(404, f'No endpoint {path}, expected one of {list(self.routes)}')
+            if method not in ('GET', 'POST'):
+                raise HTTPError(405, f'{method} not allowed, use POST')
+            result = await self.dispatch(path, json.loads(body) if body else {})
+        except HTTPError as error:
+            await self.send_json(writer, error.status, {'error': error.message}, keep_alive)
+            return True
+        except (ValueError, KeyError, TypeError) as error:
+            await self.send_json(writer, 400, {'error': f'{type(error).__name__}: {error}'}, keep_alive)
+            return True
+        except Exception as error:
+            print(f'Request to {path} failed: {error!r}', file=sys.stderr)
+            await self.send_json(writer, 500, {'error': f'{type(error).__name__}: {error}'}, keep_alive)
+            return True
+        if hasattr(result, '__aiter__'):
+            return await self.send_stream(writer, result, keep_alive)
+        await self.send_json(writer, 200, result, keep_alive)
+        return True
+
+    def head(self, status: int, content_type: str, keep_alive: bool, length: int = None) -> bytes:
+        """Status line and headers, chunked transfer encoding when length is None"""
+        lines = [f'HTTP/1.1 {status} {STATUS_TEXT[status]}', f'Content-Type: {content_type}', f'Connection: {"keep-alive" if keep_alive else "close"}']
+        lines.append(f'Content-Length: {length}' if length is not None else 'Transfer-Encoding: chunked')
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+    async def send_json(self, writer: asyncio.StreamWriter, status: int, payload, keep_alive: bool = True) -> None:
+        """Writes a whole JSON response"""
+        data = json.dumps(payload).encode()
+        writer.write(self.head(status, 'application/json', keep_alive, len(data)) + data)
+        await writer.drain()
+
+    async def send_stream(self, writer: asyncio.StreamWriter, results, keep_alive: bool) -> bool:
+        """
+        Writes each list of records as one chunk of JSON lines as soon as it is ready, waiting on drain so a slow client holds back the pool
+
+        Returns:
+        bool: False when a job failed part way, the response is cut short and the connection must close
+        """
+        writer.write(self.head(200, 'application/x-ndjson', keep_alive))
+        try:
+            async for records in results:
+                data = ''.join(json.dumps(record) + '\n' for record in records).encode()
+                writer.write(f'{len(data):X}\r\n'.encode() + data + b'\r\n')
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            raise
+        except Exception as error:
+            print(f'Stream failed: {error!r}', file=sys.stderr)
+            return False
+        finally:
+            await results.aclose()
+        writer.write(b'0\r\n\r\n')
+        await writer.drain()
+        return True
+
+
+def parse_args(argv: list = None) -> argparse.Namespace:
+    """Parses the command line arguments of the service"""
+    parser = argparse.ArgumentParser(description='Serve the character generation rules over local HTTP/JSON')
+    parser.add_argument('--host', default=HOST, help='address to listen on, local only by default')
+    parser.add_argument('-p', '--port', type=int, default=PORT, help='port to listen on, DND_SERVICE_PORT by default')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='worker processes for large batches, defaults to the CPU count')
+    parser.add_argument('--chunk-size', type=int, default=10000, help='characters per streamed chunk')
+    parser.add_argument('--rules', default=RULES_FILE, help='class and race data file')
+    parser.add_argument('--watch-interval', type=float, default=WATCH_INTERVAL, help='seconds between rules file checks, 0 to stop watching')
+    parser.add_argument('--session-capacity', type=int, default=10000, help='wizard sessions kept compact in memory before the oldest are spilled')
+    parser.add_argument('--session-live', type=int, default=256, help='wizard sessions kept ready as objects')
+    parser.add_argument('--session-ttl', type=float, default=SESSION_TTL, help='seconds an unused wizard session is kept, DND_SESSION_TTL by default')
+    parser.add_argument('--session-dir', default=SESSION_DIR, help='folder sessions are spilled to, DND_SESSION_DIR by default, without one the oldest are dropped')
+    return parser.parse_args(argv)
+
+
+async def serve(args: argparse.Namespace) -> None:
+    """Runs the service until cancelled"""
+    rules = load_rules(args.rules)
+    sessions = SessionManager(rules, args.session_capacity, args.session_live, args.session_ttl, args.session_dir)
+    service = CharacterService(args.rules, args.workers, args.chunk_size, args.watch_interval, sessions)
+    server = await service.start(args.host, args.port)
+    print(f'Serving on http://{args.host}:{args.port} with {service.workers} workers', file=sys.stderr)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+
+def main(argv: list = None) -> None:
+    """Runs the service from the command line, Ctrl+C stops it"""
+    try:
+        asyncio.run(serve(parse_args(argv)))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
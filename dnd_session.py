@@ -0,0 +1,371 @@
+import random
+from dnd_dice import compile_expression
+from dnd_graph import CharacterGraph
+from dnd_rules import CharacterRules
+from dnd_rules_cache import load_rules
+
+STATE_VERSION = 1
+PAGES = ['l_page', 'eeeee_page', 'a_page', 'pb_page', 'c_page', 'f_page', 'done']
+METHOD_PAGES = {1: 'eeeee_page', 2: 'pb_page'}
+EVENTS = {
+    'method': 'choose_method',
+    'next': 'next',
+    'back': 'back',
+    'spin': 'spin',
+    'reset': 'reset',
+    'roll': 'roll',
+    'assign': 'assign',
+    'class': 'choose_class',
+    'race': 'choose_race',
+    'haelf': 'choose_haelf',
+    'confirm': 'confirm',
+}
+EVENT_PAGES = {
+    'method': 'l_page',
+    'spin': 'pb_page',
+    'reset': 'pb_page',
+    'roll': 'eeeee_page',
+    'assign': 'a_page',
+    'class': 'c_page',
+    'race': 'c_page',
+    'haelf': 'c_page',
+    'confirm': 'f_page',
+}
+UNREPORTED_CHANGES = {('f_page', 'c_page')}
+LANDING_CHOICES = (-1, 0, *METHOD_PAGES)
+
+
+class WizardSession():
+    """
+    One wizard run with no wx, the state MyWizard's pages keep and the same rules their handlers apply
+
+    Each page's handler is a method here: spin for PointsBuyPage.on_spin, assign for AssignRollsPage.on_choice_made, choose_race and choose_haelf for the ClassPage choices, and next and back for the page changes, which are vetoed in the same cases the pages veto them. apply takes one recorded event dict, so a session recorded by dnd_replay.SessionRecorder replays through here thousands of times a second
+    """
+    def __init__(self, rules=None, character_rules: CharacterRules = None, rng: random.Random = None):
+        self.RULES = character_rules if character_rules is not None else CharacterRules()
+        self.CONSTANTS = self.RULES.CONSTANTS
+        self.RaceClass = rules if rules is not None else load_rules()
+        self.rng = rng
+        self.page = 'l_page'
+        self.page_2 = ''
+        self.method_choice = 0
+        self.points_available = self.CONSTANTS.POINTS_AVAILABLE_MAX
+        self.pb_scores = [self.CONSTANTS.MIN_POINTS] * len(self.CONSTANTS.ABILITY_NAMES)
+        self.expression = self.CONSTANTS.ROLL_EXPRESSION
+        self.rolls = 0
+        self.score_totals = None
+        self.dice_rolled = None
+        self.assign_totals = None
+        self.values_list = []
+        self.colours = []
+        self.score_dict = {}
+        self.class_graph = None
+        self.haelf_select = list(self.CONSTANTS.HALF_ELF_DEFAULT)
+        self.character_dict = {}
+        self.final_dict = {}
+        self.modifier_dict = {}
+        self.saved = False
+
+    @property
+    def graph(self) -> CharacterGraph:
+        """ClassPage's CharacterGraph, built on first use so sessions still on the earlier pages stay small and quick to restore"""
+        if self.class_graph is None:
+            self.class_graph = CharacterGraph(self.RaceClass.class_dict, self.RaceClass.race_dict, self.RULES)
+        return self.class_graph
+
+    def to_state(self) -> list:
+        """
+        The session as a short JSON ready list, what SessionManager keeps for a session that is not in use
+
+        Returns:
+        list: STATE_VERSION, then page and rolls state, assignment, ClassPage picks and the final scores, ints rather than the str the pages show and None for anything not reached yet
+        """
+        ints = lambda values: [int(value) for value in values] if values is not None else None
+        graph = self.class_graph
+        class_name, race, base = (graph.get('class'), graph.get('race'), graph.get('base')) if graph is not None else (None, None, None)
+        haelf_select = self.haelf_select if self.haelf_select != self.CONSTANTS.HALF_ELF_DEFAULT else None
+        return [
+            STATE_VERSION, PAGES.index(self.page), self.page_2, self.method_choice, self.points_available, self.pb_scores,
+            self.expression if self.expression != self.CONSTANTS.ROLL_EXPRESSION else None, self.rolls, ints(self.score_totals), self.dice_rolled,
+            self.assign_totals is not None, ints(self.values_list), ''.join(colour[0] if colour else '-' for colour in self.colours),
+            ints([self.score_dict[ability] for ability in self.CONSTANTS.ABILITY_NAMES]) if self.score_dict else None, ints(base),
+            class_name, race, haelf_select, [self.character_dict['Class'], self.character_dict['Race']] if self.character_dict else None,
+            ints([self.final_dict[ability] for ability in self.CONSTANTS.ABILITY_NAMES]) if self.final_dict else None, self.saved,
+        ]
+
+    @classmethod
+    def from_state(cls, state: list, rules=None, character_rules: CharacterRules = None, rng: random.Random = None) -> 'WizardSession':
+        """Rebuilds a session from to_state, with the given rules, raising ValueError for a state saved by another STATE_VERSION"""
+        if not state or state[0] != STATE_VERSION:
+            raise ValueError(f'Session state version {state[0] if state else None}, expected {STATE_VERSION}')
+        (_, page, page_2, method_choice, points_available, pb_scores, expression, rolls, score_totals, dice_rolled,
+         assigning, values_list, colours, score_dict, base, class_name, race, haelf_select, character_dict, final_scores, saved) = state
+        strs = lambda values: [str(value) for value in values] if values is not None else None
+        session = cls(rules, character_rules, rng)
+        abilities = session.CONSTANTS.ABILITY_NAMES
+        session.page = PAGES[page]
+        session.page_2 = page_2
+        session.method_choice = method_choice
+        session.points_available = points_available
+        session.pb_scores = list(pb_scores)
+        session.expression = expression or session.CONSTANTS.ROLL_EXPRESSION
+        session.rolls = rolls
+        session.score_totals = strs(score_totals)
+        session.dice_rolled = dice_rolled
+        session.assign_totals = list(session.score_totals) if assigning else None
+        session.values_list = strs(values_list)
+        session.colours = [{'g': 'green', 'r': 'red'}.get(colour) for colour in colours]
+        session.score_dict = dict(zip(abilities, strs(score_dict))) if score_dict is not None else {}
+        session.haelf_select = list(haelf_select) if haelf_select is not None else list(session.CONSTANTS.HALF_ELF_DEFAULT)
+        if base is not None:
+            session.graph.set_scores(dict(zip(abilities, base)))
+        if class_name is not None or race is not None:
+            session.graph.set_class(class_name)
+            session.graph.set_race(race, haelf_select)
+        session.character_dict = dict(zip(['Class', 'Race'], character_dict)) if character_dict is not None else {}
+        session.final_dict = dict(zip(abilities, strs(final_scores))) if final_scores is not None else {}
+        session.saved = saved
+        if saved:
+            session.modifier_dict = session.RULES.modifiers(session.final_dict)
+        return session
+
+    def view(self) -> dict:
+        """What the wizard would be showing, for a client driving the session over dnd_service"""
+        graph = self.class_graph
+        scores = graph.get('scores') if graph is not None else None
+        return {
+            'page': self.page,
+            'points_available': self.points_available,
+            'pb_scores': self.pb_scores,
+            'rolls': self.score_totals[:self.rolls] if self.score_totals is not None else [],
+            'values_list': self.values_list,
+            'colours': self.colours,
+            'class': graph.get('class') if graph is not None else None,
+            'race': graph.get('race') if graph is not None else None,
+            'haelf_select': self.haelf_select,
+            'scores': graph.ability_dict('scores') if scores is not None else {},
+            'character': self.character_dict,
+            'final': self.final_dict,
+            'modifiers': self.modifier_dict,
+            'saved': self.saved,
+        }
+
+    def apply(self, event: dict):
+        """
+        Runs one event
+
+        Args:
+        event (dict): 'event' names the handler in EVENTS, the other keys are its arguments, keys it does not take such as 'allowed' are what the wizard did and are left for the caller to check
+
+        Returns:
+        the handler's result, True or False for page changes, spins and rolls
+        """
+        name = event['event']
+        if name not in EVENTS:
+            raise ValueError(f'Unknown event {name}')
+        if name in EVENT_PAGES:
+            self.check_page(EVENT_PAGES[name])
+        return getattr(self, EVENTS[name])(event)
+
+    def check_page(self, page: str) -> None:
+        """
+        Checks an event happened on page, the wizard only lets each page's controls be used while it is shown. Nothing changes when it raises, so a bad event cannot leave the session in a state to_state cannot pack
+
+        Args:
+        page (str): the page the event came from, which becomes the tracked page when the wizard got there by a change it does not report, Back from FinalisePage being the one case in UNREPORTED_CHANGES
+        """
+        if page == self.page:
+            return
+        if page not in PAGES:
+            raise ValueError(f'Unknown page {page}')
+        if (self.page, page) not in UNREPORTED_CHANGES:
+            raise ValueError(f'Event for {page} while on {self.page}')
+        self.page = page
+
+    def choose_method(self, event: dict) -> None:
+        """LandingPage.type_choose, 0 is the 'Choose from dropdown' entry, 1 rolls and 2 is points buy, -1 is wx.NOT_FOUND for no selection"""
+        if event['choice'] not in LANDING_CHOICES:
+            raise ValueError(f"Unknown method choice {event['choice']}")
+        self.method_choice = event['choice']
+
+    def next(self, event: dict = None) -> bool:
+        """Moves forward from the current page, or from event['page'] when given, returning False where the page vetoes the change"""
+        return self.change_page(event, True)
+
+    def back(self, event: dict = None) -> bool:
+        """Moves back from the current page, or from event['page'] when given, returning False where the page vetoes the change"""
+        return self.change_page(event, False)
+
+    def change_page(self, event: dict, forward: bool) -> bool:
+        """
+        Runs the before page changed handler of the page being left and moves on when it allows the change
+
+        Args:
+        event (dict): may name the 'page' being left, checked with check_page since the wizard does not report leaving FinalisePage
+        forward (bool): True for Next, False for Back
+
+        Returns:
+        bool: False when the change was vetoed
+        """
+        if event and event.get('page'):
+            self.check_page(event['page'])
+        page = self.page
+        if page == 'l_page':
+            if not forward or self.method_choice not in METHOD_PAGES:
+                return False
+            self.page_2 = METHOD_PAGES[self.method_choice]
+            self.page = self.page_2
+            return True
+        if page == 'pb_page':
+            if self.points_available != 0:
+                return False
+            self.score_dict = {ability: str(score) for ability, score in zip(self.CONSTANTS.ABILITY_NAMES, self.pb_scores)}
+            self.page = self.enter_class_page() if forward else 'l_page'
+            return True
+        if page == 'eeeee_page':
+            if self.score_totals is None:
+                return False
+            if self.assign_totals is None or self.assign_totals != self.score_totals:
+                self.reset_assign()
+            self.page = 'a_page' if forward else 'l_page'
+            return True
+        if page == 'a_page':
+            if sorted(self.values_list) != sorted(self.assign_totals):
+                return False
+            self.score_dict = dict(zip(self.CONSTANTS.ABILITY_NAMES, self.values_list))
+            self.page = self.enter_class_page() if forward else 'eeeee_page'
+            return True
+        if page == 'c_page':
+            if not self.has_race():
+                return False
+            self.final_dict = {ability: str(score) for ability, score in self.graph.ability_dict('scores').items()}
+            character_dict = self.graph.finalise()[0]
+            self.character_dict = {key: value if value is not None else '' for key, value in character_dict.items()}
+            self.page = 'f_page' if forward else self.method_last_page()
+            return True
+        if page == 'f_page':
+            self.page = 'done' if forward else 'c_page'
+            return True
+        if page == 'done':
+            return False
+        raise ValueError(f'Unknown page {page}')
+
+    def method_last_page(self) -> str:
+        """The page chained before ClassPage, AssignRollsPage after rolling since on_move_from_eeeee chains it in between"""
+        return 'a_page' if self.page_2 == 'eeeee_page' else self.page_2
+
+    def enter_class_page(self) -> str:
+        """MyWizard.next_page_dict for ClassPage, hands the base scores to the graph"""
+        self.graph.set_scores(self.score_dict)
+        return 'c_page'
+
+    def spin(self, event: dict) -> bool:
+        """
+        GUIElements.on_spin for one points buy spin button
+
+        Args:
+        event (dict): 'index' of the ability and the spin button's new 'value'
+
+        Returns:
+        bool: False when the step is not allowed and the spin button is put back
+        """
+        index, new_score = event['index'], event['value']
+        if index not in range(len(self.pb_scores)):
+            raise ValueError(f'No spin button {index}')
+        current_score = self.pb_scores[index]
+        if not self.CONSTANTS.MIN_POINTS <= new_score <= self.CONSTANTS.MAX_POINTS:
+            return False
+        if not self.RULES.spin_allowed(current_score, new_score, self.points_available):
+            return False
+        self.points_available += self.RULES.update_values_logic(current_score, new_score)
+        self.pb_scores[index] = new_score
+        return True
+
+    def reset(self, event: dict = None) -> None:
+        """PointsBuyPage.on_reset, every score back to MIN_POINTS and every point available"""
+        self.pb_scores = [self.CONSTANTS.MIN_POINTS] * len(self.CONSTANTS.ABILITY_NAMES)
+        self.points_available = self.CONSTANTS.POINTS_AVAILABLE_MAX
+
+    def roll(self, event: dict = None) -> bool:
+        """
+        Roll5ePage.roll_dice, the first roll rolls all six scores and each press shows the next one
+
+        Args:
+        event (dict): a recorded first roll holds the 'expression' and the 'totals' and 'dice' the wizard rolled, which are used as they are so a replay sees the same scores. Without them the session rolls its expression with rng
+
+        Returns:
+        bool: False once all six have been shown, as the disabled ROLL! button would
+        """
+        event = event or {}
+        if self.score_totals is None:
+            expression = compile_expression(event.get('expression') or self.expression).text
+            if 'totals' in event:
+                totals = event['totals']
+                if len(totals) != len(self.CONSTANTS.ABILITY_NAMES) or not all(isinstance(total, int) for total in totals):
+                    raise ValueError(f'Recorded totals must be {len(self.CONSTANTS.ABILITY_NAMES)} ints, got {totals}')
+                self.dice_rolled = [list(dice) for dice in event.get('dice', [])]
+                self.score_totals = [str(total) for total in totals]
+            else:
+                score_totals, _, self.dice_rolled = self.RULES.roll_5e(self.rng, expression)
+                self.score_totals = [str(total) for total in score_totals]
+            self.expression = expression
+        if self.rolls >= self.CONSTANTS.ROLLS_PER_CHARACTER:
+            return False
+        self.rolls += 1
+        return True
+
+    def reset_assign(self) -> None:
+        """AssignRollsPage creation or reset for the rolled totals, each ability starts on the roll in its column and every remaining score is green"""
+        self.assign_totals = list(self.score_totals)
+        self.values_list = list(self.score_totals)
+        self.colours = ['green'] * len(self.score_totals)
+
+    def assign(self, event: dict) -> None:
+        """GUIElements.on_choice_made, sets the roll chosen for event['index'] to event['value'] and recolours the remaining scores"""
+        index, value = event['index'], str(event['value'])
+        if index not in range(len(self.values_list)) or value not in self.assign_totals:
+            raise ValueError(f'Cannot assign {value} to {index}, the choices are {self.assign_totals}')
+        old_list = list(self.values_list)
+        self.values_list[index] = value
+        for index, colour in self.RULES.colour_changes(old_list, self.values_list, self.assign_totals, self.colours, self.assign_totals):
+            self.colours[index] = colour
+
+    def choose_class(self, event: dict) -> None:
+        """ClassPage.on_class_choice"""
+        if event['value'] not in self.RaceClass.class_dict:
+            raise ValueError(f"Unknown class {event['value']}")
+        self.graph.set_class(event['value'])
+
+    def choose_race(self, event: dict) -> None:
+        """ClassPage.apply_race_choice, the Half-Elf picks go back to their defaults as the shown choices do"""
+        if event['value'] not in self.RaceClass.race_dict:
+            raise ValueError(f"Unknown race {event['value']}")
+        self.haelf_select = list(self.CONSTANTS.HALF_ELF_DEFAULT)
+        self.graph.set_race(event['value'])
+
+    def choose_haelf(self, event: dict) -> None:
+        """HalfElfElements.on_halfelf_choice, event['index'] is 0 or 1 and event['value'] the ability picked, only shown while Half-Elf is the race"""
+        if self.graph.get('race') != self.CONSTANTS.HALF_ELF:
+            raise ValueError('Half-Elf picks are only shown for Half-Elf')
+        if event['index'] not in range(len(self.haelf_select)) or event['value'] not in self.CONSTANTS.ABILITY_NAMES:
+            raise ValueError(f"Cannot pick {event['value']} for Half-Elf choice {event['index']}")
+        if self.haelf_select[event['index']] != event['value']:
+            self.haelf_select[event['index']] = event['value']
+            self.graph.set_haelf_select(self.haelf_select)
+
+    def has_race(self) -> bool:
+        """True once a race from the rules file is chosen, ClassGridModel.has_race"""
+        return self.graph.get('race') in self.graph.get('race_dict')
+
+    def confirm(self, event: dict = None) -> tuple:
+        """
+        FinalisePage.on_confirm_button without the name dialog or the file write
+
+        Returns:
+        character_dict (dict): 'Class' and 'Race' keys
+        score_dict (dict): race adjusted str scores
+        modifier_dict (dict): int modifiers
+        """
+        self.modifier_dict = self.RULES.modifiers(self.final_dict)
+        self.saved = True
+        return self.character_dict, self.final_dict, self.modifier_dict
@@ -0,0 +1,222 @@
+import collections
+import json
+import os
+import re
+import secrets
+import sys
+import threading
+import time
+from dnd_rules import CharacterRules
+from dnd_rules_cache import load_rules
+from dnd_session import WizardSession
+
+SESSION_DIR = os.environ.get('DND_SESSION_DIR')
+SESSION_TTL = float(os.environ.get('DND_SESSION_TTL', 3600))
+SWEEP_INTERVAL = 60
+SESSION_ID = re.compile(r'[0-9a-f]{16}')
+
+
+class SessionManager():
+    """
+    Holds many wizard sessions in bounded memory, so one process can host thousands of characters in progress
+
+    A session lives in one of three places. The most recently used live_capacity are WizardSession objects ready for the next event. Up to capacity more are kept as compact to_state JSON, about 130 bytes each. Older ones are spilled to spill_dir as one file each, or dropped when there is no spill_dir. Using a session moves it back to the front. A session unused for ttl seconds expires wherever it is held
+    """
+    def __init__(self, rules=None, capacity: int = 10000, live_capacity: int = 256, ttl: float = SESSION_TTL, spill_dir: str = SESSION_DIR, character_rules: CharacterRules = None):
+        self.rules = rules if rules is not None else load_rules()
+        self.RULES = character_rules if character_rules is not None else CharacterRules()
+        self.capacity = capacity
+        self.live_capacity = max(1, live_capacity)
+        self.ttl = ttl
+        self.spill_dir = spill_dir
+        self.live = collections.OrderedDict()
+        self.states = collections.OrderedDict()
+        self.used = {}
+        self.lock = threading.RLock()
+        self.last_sweep = time.time()
+        self.counts = dict.fromkeys(['created', 'restored', 'spilled', 'unspilled', 'dropped', 'expired', 'corrupt'], 0)
+
+    def create(self) -> str:
+        """Starts a new session on the landing page, returning its id"""
+        with self.lock:
+            self.sweep_due()
+            session_id = secrets.token_hex(8)
+            self.hold(session_id, WizardSession(self.rules, self.RULES))
+            self.counts['created'] += 1
+            return session_id
+
+    def get(self, session_id: str) -> WizardSession:
+        """The session with session_id, made live if it was compact or spilled, raising KeyError when it is unknown or expired"""
+        with self.lock:
+            return self.take(session_id)
+
+    def apply(self, session_id: str, events) -> tuple:
+        """
+        Runs events on a session, see WizardSession.apply
+
+        Args:
+        session_id (str): id from create
+        events (dict or list): one event, or a list of them run in order
+
+        Returns:
+        result: the handler's result, a list of results for a list of events
+        session (WizardSession): the session after the events
+        """
+        with self.lock:
+            session = self.take(session_id)
+            if isinstance(events, dict):
+                return session.apply(events), session
+            return [session.apply(event) for event in events], session
+
+    def delete(self, session_id: str) -> bool:
+        """Forgets a session wherever it is held, returning False when it was not found"""
+        with self.lock:
+            found = self.live.pop(session_id, None) is not None or self.states.pop(session_id, None) is not None
+            self.used.pop(session_id, None)
+            return self.remove_spilled(session_id) or found
+
+    def set_rules(self, rules) -> None:
+        """Swaps in reloaded rules, live sessions recompute their ClassPage values and the others pick the rules up when restored"""
+        with self.lock:
+            self.rules = rules
+            for session in self.live.values():
+                session.RaceClass = rules
+                if session.class_graph is not None:
+                    session.class_graph.set_rules(rules.class_dict, rules.race_dict)
+
+    def take(self, session_id: str) -> WizardSession:
+        """Finds a session, restores it when it is not live and marks it used, raising KeyError when it is unknown or expired"""
+        now = time.time()
+        if session_id in self.live:
+            session = self.live[session_id]
+            self.live.move_to_end(session_id)
+        else:
+            if session_id in self.states:
+                state = self.states.pop(session_id)
+            else:
+                state = self.read_spilled(session_id)
+                self.counts['unspilled'] += 1
+            session = self.unpack(session_id, state)
+            self.counts['restored'] += 1
+            self.hold(session_id, session, self.used.get(session_id, now))
+        if now - self.used[session_id] > self.ttl:
+            self.live.pop(session_id)
+            self.used.pop(session_id)
+            self.counts['expired'] += 1
+            raise KeyError(session_id)
+        self.used[session_id] = now
+        return session
+
+    def hold(self, session_id: str, session: WizardSession, used: float = None) -> None:
+        """Makes a session live, last used at used or now, packing the least recently used live session when there are too many"""
+        self.live[session_id] = session
+        self.used[session_id] = used if used is not None else time.time()
+        while len(self.live) > self.live_capacity:
+            old_id, old_session = self.live.popitem(last=False)
+            state = self.pack(old_id, old_session)
+            if state is not None:
+                self.states[old_id] = state
+        while len(self.states) > self.capacity:
+            old_id, state = self.states.popitem(last=False)
+            if self.spill_dir is not None:
+                self.write_spilled(old_id, state)
+                self.counts['spilled'] += 1
+            else:
+                self.used.pop(old_id, None)
+                self.counts['dropped'] += 1
+
+    def pack(self, session_id: str, session: WizardSession) -> bytes:
+        """A session's compact to_state JSON, None when it cannot be packed, in which case the session is dropped and logged so evicting it never fails the request that caused the eviction"""
+        try:
+            return json.dumps(session.to_state(), separators=(',', ':')).encode()
+        except (ValueError, KeyError, IndexError, TypeError) as error:
+            self.drop_corrupt(session_id, f'packing failed: {error!r}')
+            return None
+
+    def unpack(self, session_id: str, state: bytes) -> WizardSession:
+        """Rebuilds a packed session, dropping and logging one that cannot be read and raising KeyError as for an unknown session"""
+        try:
+            return WizardSession.from_state(json.loads(state), self.rules, self.RULES)
+        except (ValueError, KeyError, IndexError, TypeError) as error:
+            self.drop_corrupt(session_id, f'restoring failed: {error!r}')
+            raise KeyError(session_id)
+
+    def drop_corrupt(self, session_id: str, reason: str) -> None:
+        """Forgets a session that cannot be packed or restored"""
+        self.used.pop(session_id, None)
+        self.counts['corrupt'] += 1
+        print(f'Dropped session {session_id}, {reason}', file=sys.stderr)
+
+    def spill_path(self, session_id: str) -> str:
+        """Spill file of a session, raising KeyError for an id create could not have made so a request cannot name another path"""
+        if not SESSION_ID.fullmatch(session_id or ''):
+            raise KeyError(session_id)
+        return os.path.join(self.spill_dir, f'{session_id}.json')
+
+    def write_spilled(self, session_id: str, state: bytes) -> None:
+        """Writes a packed session atomically, its last use kept as the file's modification time so the TTL holds after a restart. Writes happen under the lock, so the session's own temp name cannot clash"""
+        spill_path = self.spill_path(session_id)
+        os.makedirs(self.spill_dir, exist_ok=True)
+        temp_path = spill_path + '.tmp'
+        with open(temp_path, 'wb') as file:
+            file.write(state)
+        used = self.used.pop(session_id, time.time())
+        os.utime(temp_path, (used, used))
+        os.replace(temp_path, spill_path)
+
+    def read_spilled(self, session_id: str) -> bytes:
+        """Reads and removes a spilled session, raising KeyError when it is not on disk"""
+        if self.spill_dir is None:
+            raise KeyError(session_id)
+        spill_path = self.spill_path(session_id)
+        try:
+            with open(spill_path, 'rb') as file:
+                state = file.read()
+            self.used[session_id] = os.stat(spill_path).st_mtime
+            os.remove(spill_path)
+        except FileNotFoundError:
+            raise KeyError(session_id)
+        return state
+
+    def remove_spilled(self, session_id: str) -> bool:
+        """Removes a spilled session's file, False when there is none"""
+        if self.spill_dir is None:
+            return False
+        try:
+            os.remove(self.spill_path(session_id))
+        except (FileNotFoundError, KeyError):
+            return False
+        return True
+
+    def sweep_due(self) -> None:
+        """Runs sweep when SWEEP_INTERVAL has passed since the last one, called on create so an idle manager does no work"""
+        if time.time() - self.last_sweep >= SWEEP_INTERVAL:
+            self.sweep_expired()
+
+    def sweep(self) -> int:
+        """Drops every session unused for ttl seconds, spilled ones included, returning how many went"""
+        with self.lock:
+            return self.sweep_expired()
+
+    def sweep_expired(self) -> int:
+        """sweep without taking the lock"""
+        now = time.time()
+        self.last_sweep = now
+        expired = [session_id for session_id, used in self.used.items() if now - used > self.ttl]
+        for session_id in expired:
+            self.live.pop(session_id, None)
+            self.states.pop(session_id, None)
+            self.used.pop(session_id)
+        if self.spill_dir is not None and os.path.isdir(self.spill_dir):
+            for entry in os.scandir(self.spill_dir):
+                if entry.name.endswith('.json') and now - entry.stat().st_mtime > self.ttl:
+                    os.remove(entry.path)
+                    expired.append(entry.name)
+        self.counts['expired'] += len(expired)
+        return len(expired)
+
+    def stats(self) -> dict:
+        """Session counts per place and the running totals of what happened to them"""
+        with self.lock:
+            spilled = sum(1 for name in os.listdir(self.spill_dir) if name.endswith('.json')) if self.spill_dir is not None and os.path.isdir(self.spill_dir) else 0
+            return {'live': len(self.live), 'compact': len(self.states), 'compact_bytes': sum(len(state) for state in self.states.values()), 'on_disk': spilled, **self.counts}
@@ -0,0 +1,202 @@
+import gzip
+import io
+import mmap
+import os
+import sys
+from dnd_character import Character, CharacterCodes
+
+SHEET_SUFFIXES = ('.txt', '.txt.gz')
+SECTIONS = {b'Character Details': 'character', b'Ability Scores': 'scores', b'Score Modifiers': 'modifiers'}
+
+
+class SheetReader():
+    """Parses saved character sheets in the write_file layout back into character dicts, one sheet per file or many per exported shard"""
+    def __init__(self, recursive: bool = False):
+        self.recursive = recursive
+        self.skipped = []
+
+    def scan(self, folder: str):
+        """
+        Yields the paths of sheet files in a folder using os.scandir
+
+        Args:
+        folder (str): folder to scan
+
+        Yields:
+        str: path of each file ending in a SHEET_SUFFIXES suffix, in name order per folder
+        """
+        with os.scandir(folder) as entries:
+            entries = sorted(entries, key=lambda entry: entry.name)
+        for entry in entries:
+            if entry.is_file() and entry.name.endswith(SHEET_SUFFIXES):
+                yield entry.path
+            elif self.recursive and entry.is_dir():
+                yield from self.scan(entry.path)
+
+    def read_folder(self, folder: str):
+        """Yields every sheet in every sheet file of a folder, see read_file for the records. A file that is not a sheet, such as a README.txt, or that cannot be parsed is added to skipped and reported on stderr, and the scan goes on"""
+        for path in self.scan(folder):
+            try:
+                yield from self.read_file(path)
+            except ValueError as error:
+                self.skipped.append(path)
+                print(f'Skipped {path}: {error}', file=sys.stderr)
+
+    def read_file(self, path: str):
+        """
+        Yields the sheets in one file, memory mapping plain files so lines are read without loading the whole file
+
+        Args:
+        path (str): sheet file, gzipped shards are decompressed as a stream instead
+
+        Yields:
+        dict: 'name', 'source', 'character', 'scores' and 'modifiers' keys, scores and modifiers as ints
+        """
+        if path.endswith('.gz'):
+            with gzip.open(path, 'rb') as file:
+                yield from self.parse_lines(iter(io.BufferedReader(file).readline, b''), path)
+            return
+        with open(path, 'rb') as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                yield from self.parse_lines(iter(mapped.readline, b''), path)
+
+    def parse_lines(self, lines, source: str):
+        """
+        Parses sheet lines, a 'Character Details' line starts each sheet, lines that do not start with one are not a sheet and give nothing, with source added to skipped
+
+        Args:
+        lines (iterable): bytes lines
+        source (str): path the lines came from, the file name is used for sheets with no Name line
+
+        Yields:
+        dict: one record per sheet, see read_file
+        """
+        stem = os.path.basename(source)
+        for suffix in SHEET_SUFFIXES:
+            if stem.endswith(suffix):
+                stem = stem[:-len(suffix)]
+                break
+        sheet = None
+        section = None
+        count = 0
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            if sheet is None and SECTIONS.get(line) != 'character':
+                self.skipped.append(source)
+                return
+            if line in SECTIONS:
+                section = SECTIONS[line]
+                if section == 'character':
+                    if sheet is not None:
+                        yield self.finish_sheet(sheet, stem, count, source)
+                        count += 1
+                    sheet = {'character': {}, 'scores': {}, 'modifiers': {}}
+                continue
+            key, _, value = line.decode().partition(':')
+            value = value.strip()
+            sheet[section][key.strip()] = value if section == 'character' else int(value)
+        if sheet is not None:
+            yield self.finish_sheet(sheet, stem, count, source)
+
+    def finish_sheet(self, sheet: dict, stem: str, count: int, source: str) -> dict:
+        """Adds the name and source to a parsed sheet"""
+        name = sheet['character'].pop('Name', None)
+        if name is None:
+            name = stem if count == 0 else f'{stem}#{count}'
+        return {'name': name, 'source': source, **sheet}
+
+
+class SheetIndex():
+    """In-memory index of parsed sheets by class, race and each ability score, holding each sheet as a compact Character"""
+    def __init__(self):
+        self.codes = CharacterCodes()
+        self.characters = []
+        self.sources = []
+        self.by_class = {}
+        self.by_race = {}
+        self.by_score = {}
+
+    def add(self, record: dict) -> int:
+        """
+        Adds one parsed sheet to the index
+
+        Args:
+        record (dict): from SheetReader, with a score for every ability
+
+        Returns:
+        int: id of the record
+        """
+        record_id = len(self.characters)
+        character = Character.from_dicts(record['character'], record['scores'], self.codes, name=record['name'])
+        self.characters.append(character)
+        self.sources.append(sys.intern(record['source']))
+        self.by_class.setdefault(self.codes.class_name(character.class_code), []).append(record_id)
+        self.by_race.setdefault(self.codes.race_name(character.race_code), []).append(record_id)
+        for ability, score in zip(Character.CONSTANTS.ABILITY_NAMES, character.scores):
+            self.by_score.setdefault(ability, {}).setdefault(score, []).append(record_id)
+        return record_id
+
+    def record(self, record_id: int) -> dict:
+        """The SheetReader record for an id, with the modifiers worked out from the scores"""
+        character = self.characters[record_id]
+        character_dict, score_dict, modifier_dict = character.to_dicts(self.codes)
+        return {'name': character.name, 'source': self.sources[record_id], 'character': character_dict, 'scores': score_dict, 'modifiers': modifier_dict}
+
+    def add_all(self, records) -> int:
+        """Adds every record from an iterable, giving the number added"""
+        count = 0
+        for record in records:
+            self.add(record)
+            count += 1
+        return count
+
+    @classmethod
+    def from_folder(cls, folder: str, recursive: bool = False) -> 'SheetIndex':
+        """Builds an index from every sheet in a folder"""
+        index = cls()
+        index.add_all(SheetReader(recursive).read_folder(folder))
+        return index
+
+    def __len__(self) -> int:
+        return len(self.characters)
+
+    def ability_ids(self, ability: str, minimum: int = None, maximum: int = None) -> set:
+        """Ids of records with an ability score within minimum and maximum"""
+        ids = set()
+        for score, score_ids in self.by_score.get(ability, {}).items():
+            if (minimum is None or score >= minimum) and (maximum is None or score <= maximum):
+                ids.update(score_ids)
+        return ids
+
+    def query_ids(self, class_name: str = None, race: str = None, minimums: dict = None, maximums: dict = None) -> list:
+        """
+        Finds the ids of records matching every given condition, e.g. query_ids('Fighter', 'Half-Orc', {'Strength': 17})
+
+        Args:
+        class_name (str): class to match, or None for any
+        race (str): race to match, or None for any
+        minimums (dict): ability names as keys and lowest score as values
+        maximums (dict): ability names as keys and highest score as values
+
+        Returns:
+        list: matching ids in the order they were added
+        """
+        candidates = [set(self.by_class.get(class_name, ()))] if class_name is not None else []
+        if race is not None:
+            candidates.append(set(self.by_race.get(race, ())))
+        abilities = set(minimums or {}) | set(maximums or {})
+        for ability in abilities:
+            candidates.append(self.ability_ids(ability, (minimums or {}).get(ability), (maximums or {}).get(ability)))
+        if not candidates:
+            return list(range(len(self.characters)))
+        candidates.sort(key=len)
+        ids = candidates[0].intersection(*candidates[1:])
+        return sorted(ids)
+
+    def query(self, class_name: str = None, race: str = None, minimums: dict = None, maximums: dict = None) -> list:
+        """Same as query_ids, giving the records"""
+        return [self.record(record_id) for record_id in self.query_ids(class_name, race, minimums, maximums)]
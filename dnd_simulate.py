@@ -0,0 +1,246 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from functools import lru_cache
+from itertools import combinations_with_replacement
+import numpy as np
+from dnd_assign import RollAssigner
+from dnd_batch_roll import BatchRoller
+from dnd_rules import RuleConstants
+from dnd_rules_cache import RULES_FILE, load_rules
+
+QUANTILES = (0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99)
+
+
+@lru_cache(maxsize=None)
+def multiset_table(low: int, high: int, rolls: int) -> tuple:
+    """
+    Every sorted set of rolls, 54264 for six 4d6 drop lowest scores, with their packed keys, built once per process
+
+    Returns:
+    multisets (np.ndarray): int8 of shape (sets, rolls), rows sorted ascending and ordered by key
+    keys (np.ndarray): int64 packed key of each row, ascending
+    """
+    multisets = np.array(list(combinations_with_replacement(range(low, high + 1), rolls)), dtype=np.int8)
+    keys = pack_sorted(multisets, low, high)
+    order = np.argsort(keys)
+    return multisets[order], keys[order]
+
+
+def pack_sorted(rows: np.ndarray, low: int, high: int) -> np.ndarray:
+    """Packs each sorted row of scores into one int64, base high - low + 1"""
+    weights = (high - low + 1) ** np.arange(rows.shape[1], dtype=np.int64)
+    return ((rows.astype(np.int64) - low) * weights).sum(axis=1)
+
+
+def histogram_quantiles(histogram: np.ndarray, quantiles: tuple = QUANTILES) -> dict:
+    """
+    Quantiles of an integer histogram, the lowest value whose cumulative count reaches each fraction
+
+    Args:
+    histogram (np.ndarray): counts indexed by value
+    quantiles (tuple): fractions between 0 and 1
+
+    Returns:
+    dict: fraction as keys and value as values, empty for an empty histogram
+    """
+    total = histogram.sum()
+    if not total:
+        return {}
+    cumulative = np.cumsum(histogram)
+    return {quantile: int(np.searchsorted(cumulative, quantile * total)) for quantile in quantiles}
+
+
+def histogram_mean(histogram: np.ndarray, offset: int = 0) -> float:
+    """Mean of an integer histogram whose index 0 stands for offset"""
+    total = histogram.sum()
+    return float((np.arange(len(histogram)) + offset) @ histogram / total) if total else 0.0
+
+
+class RollStatistics():
+    """
+    Constant memory counts over any number of simulated characters, rolled as RollDice rolls them and assigned in rolled order
+
+    Only counts are kept, per ability score counts and counts of each sorted set of rolls, so partial results from any number of processes add together and every class and race result is worked out from the sorted set counts at the end
+    """
+    def __init__(self, constants: RuleConstants = None):
+        self.CONSTANTS = constants if constants is not None else RuleConstants()
+        self.low = self.CONSTANTS.DICE_PER_ROLL - 1
+        self.high = (self.CONSTANTS.DICE_PER_ROLL - 1) * self.CONSTANTS.DICE_SIDES
+        self.multisets, self.keys = multiset_table(self.low, self.high, self.CONSTANTS.ROLLS_PER_CHARACTER)
+        self.count = 0
+        self.ability_counts = np.zeros((self.CONSTANTS.ROLLS_PER_CHARACTER, self.high + 1), dtype=np.int64)
+        self.multiset_counts = np.zeros(len(self.multisets), dtype=np.int64)
+
+    def add_totals(self, score_totals: np.ndarray) -> None:
+        """
+        Counts a batch of rolled characters
+
+        Args:
+        score_totals (np.ndarray): shape (count, 6), from BatchRoller.roll_totals_batch
+        """
+        self.count += len(score_totals)
+        for ability in range(score_totals.shape[1]):
+            self.ability_counts[ability] += np.bincount(score_totals[:, ability], minlength=self.high + 1)
+        indexes = np.searchsorted(self.keys, pack_sorted(np.sort(score_totals, axis=1), self.low, self.high))
+        self.multiset_counts += np.bincount(indexes, minlength=len(self.keys))
+
+    def counts(self) -> tuple:
+        """The counts alone, small enough to send back from a worker process"""
+        return self.count, self.ability_counts, self.multiset_counts
+
+    def merge(self, counts: tuple) -> None:
+        """Adds the counts of another RollStatistics, from counts"""
+        count, ability_counts, multiset_counts = counts
+        self.count += count
+        self.ability_counts += ability_counts
+        self.multiset_counts += multiset_counts
+
+    def ability_histograms(self) -> dict:
+        """Ability names as keys and {score: count} as values, rolled order"""
+        return {ability: {score: int(count) for score, count in enumerate(counts) if count} for ability, counts in zip(self.CONSTANTS.ABILITY_NAMES, self.ability_counts)}
+
+    def seen(self) -> tuple:
+        """The sorted sets of rolls that came up, with how often"""
+        present = self.multiset_counts > 0
+        return self.multisets[present], self.multiset_counts[present]
+
+    def modifier_sum_histogram(self, scores: np.ndarray = None, weights: np.ndarray = None) -> tuple:
+        """
+        Distribution of the sum of the six modifiers
+
+        Args:
+        scores (np.ndarray): scores per sorted set, defaults to the rolls themselves
+        weights (np.ndarray): count of each row of scores, needed with scores
+
+        Returns:
+        histogram (np.ndarray): counts indexed by sum - offset
+        offset (int): lowest sum the histogram can hold
+        """
+        if scores is None:
+            scores, weights = self.seen()
+        sums = ((scores.astype(np.int64) - 10) // 2).sum(axis=1)
+        offset = int(sums.min()) if len(sums) else 0
+        return np.bincount(sums - offset, weights=weights).astype(np.int64), offset
+
+    def assigned(self, assigner: RollAssigner, class_name: str, race: str = None) -> tuple:
+        """
+        Final scores of every sorted set that came up, assigned with RollAssigner for the class and race, Half-Elf takes its rules file picks
+
+        Returns:
+        scores (np.ndarray): shape (sets, 6), race adjusted when race is given, in ABILITY_NAMES order
+        weights (np.ndarray): count of each set
+        """
+        multisets, weights = self.seen()
+        scores = assigner.solve_sorted(multisets, class_name, race).astype(np.int64)
+        if race is not None:
+            bonus = assigner.RULES.race_bonus(assigner.race_dict, race)
+            scores += np.array([bonus.get(ability, 0) for ability in self.CONSTANTS.ABILITY_NAMES])
+        return scores, weights
+
+    def distribution(self, histogram: np.ndarray, offset: int = 0, quantiles: tuple = QUANTILES) -> dict:
+        """Mean and quantiles of a histogram, for the summary"""
+        return {'mean': histogram_mean(histogram, offset), 'quantiles': {str(q): value + offset for q, value in histogram_quantiles(histogram, quantiles).items()}}
+
+    def class_summary(self, assigner: RollAssigner, class_name: str, race: str = None, quantiles: tuple = QUANTILES) -> dict:
+        """Primary ability score distributions and the modifier sum distribution for one class, race adjusted when race is given"""
+        scores, weights = self.assigned(assigner, class_name, race)
+        primary = {}
+        for ability in assigner.class_dict[class_name]:
+            column = scores[:, self.CONSTANTS.ABILITY_NAMES.index(ability)]
+            primary[ability] = self.distribution(np.bincount(column, weights=weights).astype(np.int64), 0, quantiles)
+        return {'primary': primary, 'modifier_sum': self.distribution(*self.modifier_sum_histogram(scores, weights), quantiles)}
+
+    def summary(self, class_dict: dict, race_dict: dict, quantiles: tuple = QUANTILES) -> dict:
+        """
+        Everything the balance reports use
+
+        Returns:
+        dict: 'characters', 'abilities' histograms, 'modifier_sum' with its histogram, and per class 'primary' and 'modifier_sum' distributions without race and under each race
+        """
+        assigner = RollAssigner(class_dict, race_dict)
+        histogram, offset = self.modifier_sum_histogram()
+        classes = {}
+        for class_name in class_dict:
+            classes[class_name] = self.class_summary(assigner, class_name, None, quantiles)
+            classes[class_name]['races'] = {race: self.class_summary(assigner, class_name, race, quantiles) for race in race_dict}
+        modifier_sum = self.distribution(histogram, offset, quantiles)
+        modifier_sum['histogram'] = {int(value + offset): int(count) for value, count in enumerate(histogram) if count}
+        return {'characters': self.count, 'abilities': self.ability_histograms(), 'modifier_sum': modifier_sum, 'classes': classes}
+
+
+def _simulate_chunk(job: tuple) -> tuple:
+    """Process pool task, rolls one chunk from its own random stream and returns its counts"""
+    seed, chunk, count = job
+    statistics = RollStatistics()
+    statistics.add_totals(BatchRoller([seed, chunk]).roll_totals_batch(count))
+    return statistics.counts()
+
+
+def simulate(count: int, seed: int = 0, workers: int = None, chunk_size: int = 1_000_000) -> RollStatistics:
+    """
+    Rolls count characters across a process pool and adds up their counts, keeping at most 2 chunks per worker in flight so memory does not grow with count
+
+    Args:
+    count (int): characters to simulate
+    seed (int): seed of the run, each chunk rolls from (seed, chunk) so the totals are the same for any worker count
+    workers (int): worker processes, defaults to the CPU count, 1 runs in this process
+    chunk_size (int): characters per chunk
+
+    Returns:
+    RollStatistics: counts of the whole run
+    """
+    statistics = RollStatistics()
+    jobs = ((seed, chunk, min(chunk_size, count - start)) for chunk, start in enumerate(range(0, count, chunk_size)))
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        for job in jobs:
+            statistics.merge(_simulate_chunk(job))
+        return statistics
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = set()
+        for job in jobs:
+            pending.add(executor.submit(_simulate_chunk, job))
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    statistics.merge(future.result())
+        for future in pending:
+            statistics.merge(future.result())
+    return statistics
+
+
+def parse_args(argv: list = None) -> argparse.Namespace:
+    """Parses the command line arguments of the simulator"""
+    parser = argparse.ArgumentParser(description='Simulate rolled characters in constant memory and report score distributions')
+    parser.add_argument('-n', '--count', type=int, default=1_000_000, help='number of characters to simulate')
+    parser.add_argument('-s', '--seed', type=int, default=0, help='seed of the run, the result is the same for any worker count')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='worker processes, defaults to the CPU count')
+    parser.add_argument('--chunk-size', type=int, default=1_000_000, help='characters per chunk')
+    parser.add_argument('--rules', default=RULES_FILE, help='class and race data file')
+    parser.add_argument('-o', '--output', default='-', help='JSON summary file, - for stdout')
+    return parser.parse_args(argv)
+
+
+def main(argv: list = None) -> None:
+    """Runs the simulator from the command line and reports throughput on stderr"""
+    args = parse_args(argv)
+    start = time.perf_counter()
+    statistics = simulate(args.count, args.seed, args.workers, args.chunk_size)
+    elapsed = time.perf_counter() - start
+    print(f'Simulated {statistics.count} characters in {elapsed:.2f}s ({statistics.count / elapsed if elapsed else 0:.0f} characters/s)', file=sys.stderr)
+    race_class = load_rules(args.rules)
+    summary = statistics.summary(race_class.class_dict, race_class.race_dict)
+    if args.output == '-':
+        json.dump(summary, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, 'w') as file:
+            json.dump(summary, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
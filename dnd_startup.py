@@ -0,0 +1,56 @@
+import os
+import sys
+import time
+
+STARTUP_TIMING = bool(os.environ.get('DND_STARTUP_TIMING')) or '--startup-timing' in sys.argv
+
+
+class StartupTimer():
+    """Marks the stages of wizard startup, from when this module is imported to the first paint of the wizard, and reports them on stderr"""
+    def __init__(self, start: float = None):
+        self.start = start if start is not None else time.perf_counter()
+        self.marks = []
+
+    def mark(self, name: str) -> None:
+        """Records the end of a startup stage"""
+        self.marks.append((name, time.perf_counter()))
+
+    def watch_first_paint(self, window) -> None:
+        """Queues the first paint mark and the report, they run once the wizard's event loop has shown window"""
+        import wx
+        wx.CallAfter(self.first_paint, window)
+
+    def first_paint(self, window) -> None:
+        """Flushes window's pending paint, then marks first paint and prints the report"""
+        window.Update()
+        self.mark('first paint')
+        print(self.report(), file=sys.stderr)
+
+    def report(self) -> str:
+        """
+        Formats the marks as a table of stage and cumulative times
+
+        Returns:
+        str: one line per mark, with ms spent in the stage and ms since start
+        """
+        lines = [f'{"startup stage":<20}{"stage ms":>10}{"total ms":>10}']
+        previous = self.start
+        for name, moment in self.marks:
+            lines.append(f'{name:<20}{(moment - previous) * 1000:>10.1f}{(moment - self.start) * 1000:>10.1f}')
+            previous = moment
+        return '\n'.join(lines)
+
+
+STARTUP_TIMER = StartupTimer() if STARTUP_TIMING else None
+
+
+def mark(name: str) -> None:
+    """Marks a startup stage when startup timing is on, does nothing otherwise"""
+    if STARTUP_TIMER is not None:
+        STARTUP_TIMER.mark(name)
+
+
+def watch_first_paint(window) -> None:
+    """Reports startup times after window's first paint when startup timing is on"""
+    if STARTUP_TIMER is not None:
+        STARTUP_TIMER.watch_first_paint(window)
@@ -0,0 +1,151 @@
+import os
+import sqlite3
+import time
+from dnd_rules import RuleConstants
+
+DATABASE_PATH = os.environ.get('DND_DATABASE')
+
+
+class CharacterStore():
+    """SQLite storage for finalised characters, holding the character_dict, score_dict and modifier_dict that write_file saves"""
+    def __init__(self, database_path: str, batch_size: int = 10000, constants: RuleConstants = None):
+        self.CONSTANTS = constants if constants is not None else RuleConstants()
+        self.database_path = database_path
+        self.batch_size = batch_size
+        self.score_columns = [ability.lower() for ability in self.CONSTANTS.ABILITY_NAMES]
+        self.modifier_columns = [f'{column}_modifier' for column in self.score_columns]
+        folder = os.path.dirname(os.path.abspath(database_path))
+        os.makedirs(folder, exist_ok=True)
+        self.connection = sqlite3.connect(database_path)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.create_schema()
+
+    def __enter__(self) -> 'CharacterStore':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def create_schema(self) -> None:
+        """Creates the characters table and its indexes if they do not exist"""
+        columns = ', '.join(f'{column} INTEGER NOT NULL' for column in self.score_columns + self.modifier_columns)
+        with self.connection:
+            self.connection.execute(f'CREATE TABLE IF NOT EXISTS characters (id INTEGER PRIMARY KEY, name TEXT, method TEXT, class TEXT, race TEXT, {columns}, created REAL NOT NULL)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS characters_class ON characters (class)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS characters_race ON characters (race)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS characters_race_class ON characters (race, class)')
+            for column in self.score_columns:
+                self.connection.execute(f'CREATE INDEX IF NOT EXISTS characters_{column} ON characters ({column})')
+
+    def row(self, character_dict: dict, score_dict: dict, modifier_dict: dict, name: str = None, method: str = None) -> tuple:
+        """Flattens one character into the values of an INSERT, scores may be str as they are on the wizard pages"""
+        abilities = self.CONSTANTS.ABILITY_NAMES
+        scores = [int(score_dict[ability]) for ability in abilities]
+        modifiers = [int(modifier_dict[ability]) for ability in abilities]
+        return (name, method, character_dict.get('Class'), character_dict.get('Race'), *scores, *modifiers, time.time())
+
+    def insert_sql(self) -> str:
+        """The INSERT statement for one character"""
+        columns = ['name', 'method', 'class', 'race'] + self.score_columns + self.modifier_columns + ['created']
+        return f'INSERT INTO characters ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})'
+
+    def save(self, character_dict: dict, score_dict: dict, modifier_dict: dict, name: str = None, method: str = None) -> int:
+        """
+        Saves one character in its own transaction, as FinalisePage does on confirm
+
+        Args:
+        character_dict (dict): 'Class' and 'Race' keys
+        score_dict (dict): ability names as keys and scores as values
+        modifier_dict (dict): ability names as keys and modifiers as values
+        name (str): character name, optional
+        method (str): generation method, optional
+
+        Returns:
+        int: id of the saved row
+        """
+        with self.connection:
+            cursor = self.connection.execute(self.insert_sql(), self.row(character_dict, score_dict, modifier_dict, name, method))
+        return cursor.lastrowid
+
+    def save_many(self, characters) -> int:
+        """
+        Saves characters in the batch generator's dict form, one transaction per batch_size characters
+
+        Args:
+        characters (iterable): dicts with 'character', 'scores' and 'modifiers' keys and optional 'name' and 'method'
+
+        Returns:
+        int: number of characters saved
+        """
+        sql = self.insert_sql()
+        batch = []
+        saved = 0
+        for character in characters:
+            batch.append(self.row(character['character'], character['scores'], character['modifiers'], character.get('name'), character.get('method')))
+            if len(batch) >= self.batch_size:
+                saved += self.write_batch(sql, batch)
+                batch = []
+        if batch:
+            saved += self.write_batch(sql, batch)
+        return saved
+
+    def write_batch(self, sql: str, batch: list) -> int:
+        """Inserts one batch of rows in a single transaction"""
+        with self.connection:
+            self.connection.executemany(sql, batch)
+        return len(batch)
+
+    def query(self, class_name: str = None, race: str = None, minimums: dict = None, maximums: dict = None, limit: int = None) -> list:
+        """
+        Finds characters matching every given condition, e.g. query('Fighter', 'Half-Orc', {'Strength': 17})
+
+        Args:
+        class_name (str): class to match, or None for any
+        race (str): race to match, or None for any
+        minimums (dict): ability names as keys and lowest score as values
+        maximums (dict): ability names as keys and highest score as values
+        limit (int): most rows to return, or None for all
+
+        Returns:
+        list: dicts with 'id', 'name', 'method', 'character', 'scores' and 'modifiers' keys
+        """
+        where, values = self.where(class_name, race, minimums, maximums)
+        sql = f'SELECT * FROM characters{where} ORDER BY id'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            values.append(limit)
+        return [self.record(row) for row in self.connection.execute(sql, values)]
+
+    def count(self, class_name: str = None, race: str = None, minimums: dict = None, maximums: dict = None) -> int:
+        """Number of characters matching a query, see query for the arguments"""
+        where, values = self.where(class_name, race, minimums, maximums)
+        return self.connection.execute(f'SELECT COUNT(*) FROM characters{where}', values).fetchone()[0]
+
+    def where(self, class_name: str, race: str, minimums: dict, maximums: dict) -> tuple:
+        """Builds the WHERE clause and its values for query and count"""
+        conditions, values = [], []
+        if class_name is not None:
+            conditions.append('class = ?')
+            values.append(class_name)
+        if race is not None:
+            conditions.append('race = ?')
+            values.append(race)
+        for limits, operator in ((minimums, '>='), (maximums, '<=')):
+            for ability, score in (limits or {}).items():
+                if ability not in self.CONSTANTS.ABILITY_NAMES:
+                    raise ValueError(f'Unknown ability {ability}')
+                conditions.append(f'{ability.lower()} {operator} ?')
+                values.append(score)
+        return (' WHERE ' + ' AND '.join(conditions) if conditions else ''), values
+
+    def record(self, row: tuple) -> dict:
+        """Turns a characters row back into the dicts write_file saves"""
+        abilities = self.CONSTANTS.ABILITY_NAMES
+        scores = row[5:5 + len(abilities)]
+        modifiers = row[5 + len(abilities):5 + 2 * len(abilities)]
+        return {'id': row[0], 'name': row[1], 'method': row[2], 'character': {'Class': row[3], 'Race': row[4]}, 'scores': dict(zip(abilities, scores)), 'modifiers': dict(zip(abilities, modifiers))}
+
+    def close(self) -> None:
+        """Closes the database connection"""
+        self.connection.close()
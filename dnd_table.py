@@ -0,0 +1,281 @@
+import json
+import os
+import numpy as np
+from dnd_character import CharacterCodes
+from dnd_export import format_text
+from dnd_rules import RuleConstants
+
+
+SCORE_MIN, SCORE_MAX = int(np.iinfo(np.int8).min), int(np.iinfo(np.int8).max)
+
+
+def check_scores(scores: np.ndarray) -> np.ndarray:
+    """Gives scores as an array, raising ValueError when one does not fit the int8 scores column, such as a 1d200 roll, rather than letting numpy wrap it"""
+    scores = np.asarray(scores)
+    if scores.size and (scores.min() < SCORE_MIN or scores.max() > SCORE_MAX):
+        raise ValueError(f'CharacterTable holds scores from {SCORE_MIN} to {SCORE_MAX}, got {scores.min()} to {scores.max()}')
+    return scores
+
+
+def row_dtype(constants: RuleConstants = None) -> np.dtype:
+    """One packed 19 byte row: six int8 scores in ABILITY_NAMES order, int16 class and race codes, int8 method code and the int64 seed of the run"""
+    constants = constants if constants is not None else RuleConstants()
+    return np.dtype([('scores', np.int8, (len(constants.ABILITY_NAMES),)), ('class_code', np.int16), ('race_code', np.int16), ('method', np.int8), ('seed', np.int64)])
+
+
+class CharacterTable():
+    """
+    Columnar store for any number of finalised characters as one numpy structured array, kept in memory or memory mapped from a file
+
+    Class, race and method are held as codes, numbered by CharacterCodes in rules file order, and the names are saved next to the rows in path + '.json'. Slices are views that copy nothing, filters are boolean masks over whole columns, and only export turns rows back into the dicts write_file saves
+    """
+    def __init__(self, rows: np.ndarray, codes: CharacterCodes, method_names: list = None, path: str = None, constants: RuleConstants = None):
+        self.CONSTANTS = constants if constants is not None else RuleConstants()
+        self.rows = rows
+        self.codes = codes
+        self.method_names = method_names if method_names is not None else []
+        self.path = path
+        self.file = None
+        self.count = len(rows)
+
+    @classmethod
+    def from_rules(cls, class_dict: dict, race_dict: dict, capacity: int = 0, constants: RuleConstants = None) -> 'CharacterTable':
+        """An empty in memory table coded from initRaceClass or load_rules dicts, with room for capacity rows before it grows"""
+        table = cls(np.zeros(capacity, dtype=row_dtype(constants)), CharacterCodes.from_rules(class_dict, race_dict), constants=constants)
+        table.count = 0
+        return table
+
+    @classmethod
+    def create(cls, path: str, class_dict: dict, race_dict: dict, constants: RuleConstants = None) -> 'CharacterTable':
+        """An empty table backed by a new file at path, rows are appended straight into the mapped file"""
+        folder = os.path.dirname(os.path.abspath(path))
+        os.makedirs(folder, exist_ok=True)
+        table = cls(np.zeros(0, dtype=row_dtype(constants)), CharacterCodes.from_rules(class_dict, race_dict), path=path, constants=constants)
+        table.count = 0
+        table.file = open(path, 'w+b')
+        table.save_metadata()
+        return table
+
+    @classmethod
+    def open(cls, path: str, mode: str = 'r', constants: RuleConstants = None) -> 'CharacterTable':
+        """
+        Maps a saved table without reading its rows
+
+        Args:
+        path (str): rows file written by create
+        mode (str): 'r' for read only, 'r+' to change rows in place or append
+        constants (RuleConstants): must have the ability names the table was saved with
+
+        Returns:
+        CharacterTable: backed by the file
+        """
+        with open(path + '.json') as file:
+            metadata = json.load(file)
+        constants = constants if constants is not None else RuleConstants()
+        if metadata['abilities'] != constants.ABILITY_NAMES:
+            raise ValueError(f'{path} was saved with abilities {metadata["abilities"]}, expected {constants.ABILITY_NAMES}')
+        dtype = row_dtype(constants)
+        count = metadata['count']
+        rows = np.memmap(path, dtype=dtype, mode=mode, shape=(count,)) if count else np.zeros(0, dtype=dtype)
+        table = cls(rows, CharacterCodes(metadata['classes'], metadata['races']), metadata['methods'], path, constants)
+        if mode == 'r+':
+            table.file = open(path, 'r+b')
+        return table
+
+    def __enter__(self) -> 'CharacterTable':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, key) -> 'CharacterTable':
+        """Rows by slice, boolean mask or index array, a slice is a view of the same memory"""
+        if isinstance(key, (int, np.integer)):
+            key = slice(key, key + 1 if key != -1 else None)
+        return CharacterTable(self.view()[key], self.codes, self.method_names, constants=self.CONSTANTS)
+
+    def view(self) -> np.ndarray:
+        """The filled rows, a view that copies nothing"""
+        return self.rows[:self.count]
+
+    def method_code(self, method: str) -> int:
+        """Code of a generation method, adding it when new, -1 for None"""
+        if method is None:
+            return -1
+        if method not in self.method_names:
+            self.method_names.append(method)
+        return self.method_names.index(method)
+
+    def reserve(self, needed: int) -> None:
+        """Makes room for needed rows, doubling the capacity so appends stay cheap, a file backed table grows its file and maps it again"""
+        if needed <= len(self.rows):
+            return
+        capacity = max(needed, 2 * len(self.rows), 1024)
+        if self.file is None:
+            rows = np.zeros(capacity, dtype=self.rows.dtype)
+            rows[:self.count] = self.view()
+            self.rows = rows
+            return
+        self.flush()
+        self.file.truncate(capacity * self.rows.dtype.itemsize)
+        self.rows = np.memmap(self.path, dtype=self.rows.dtype, mode='r+', shape=(capacity,))
+
+    def append_arrays(self, scores: np.ndarray, class_codes, race_codes, method: str = None, seed: int = 0) -> int:
+        """
+        Appends characters given as whole columns, the fast path for generated data
+
+        Args:
+        scores (np.ndarray): shape (count, 6), final scores in ABILITY_NAMES order
+        class_codes: codes from self.codes, one per row or one for all
+        race_codes: codes from self.codes, one per row or one for all
+        method (str): generation method of every row
+        seed (int): seed of the run
+
+        Returns:
+        int: rows appended, ValueError is raised before anything is written when a score does not fit the int8 column
+        """
+        scores = check_scores(scores)
+        added = len(scores)
+        self.reserve(self.count + added)
+        block = self.rows[self.count:self.count + added]
+        block['scores'] = scores
+        block['class_code'] = class_codes
+        block['race_code'] = race_codes
+        block['method'] = self.method_code(method)
+        block['seed'] = seed
+        self.count += added
+        return added
+
+    def append_records(self, characters, seed: int = 0) -> int:
+        """
+        Appends characters in the batch generator's dict form
+
+        Args:
+        characters (list): dicts with 'character' and 'scores' keys and an optional 'method'
+        seed (int): seed of the run that generated them
+
+        Returns:
+        int: rows appended, ValueError is raised before anything is written when a score does not fit the int8 column
+        """
+        characters = list(characters)
+        abilities = self.CONSTANTS.ABILITY_NAMES
+        scores = check_scores(np.array([[character['scores'][ability] for ability in abilities] for character in characters], dtype=np.int64).reshape(-1, len(abilities)))
+        self.reserve(self.count + len(characters))
+        block = self.rows[self.count:self.count + len(characters)]
+        block['scores'] = scores
+        block['class_code'] = [self.codes.class_code(character['character'].get('Class')) for character in characters]
+        block['race_code'] = [self.codes.race_code(character['character'].get('Race')) for character in characters]
+        block['method'] = [self.method_code(character.get('method')) for character in characters]
+        block['seed'] = seed
+        self.count += len(characters)
+        return len(characters)
+
+    def filter(self, class_name: str = None, race: str = None, minimums: dict = None, maximums: dict = None, method: str = None) -> np.ndarray:
+        """
+        Boolean mask of the rows matching every given condition, e.g. filter('Fighter', 'Half-Orc', {'Strength': 17})
+
+        Args:
+        class_name (str): class to match, or None for any
+        race (str): race to match, or None for any
+        minimums (dict): ability names as keys and lowest score as values
+        maximums (dict): ability names as keys and highest score as values
+        method (str): generation method to match, or None for any
+
+        Returns:
+        np.ndarray: bool of shape (count,), index the table with it to get the rows
+        """
+        rows = self.view()
+        mask = np.ones(len(rows), dtype=bool)
+        if class_name is not None:
+            mask &= rows['class_code'] == self.codes.class_codes.get(class_name, -2)
+        if race is not None:
+            mask &= rows['race_code'] == self.codes.race_codes.get(race, -2)
+        if method is not None:
+            mask &= rows['method'] == (self.method_names.index(method) if method in self.method_names else -2)
+        for limits, compare in ((minimums, np.greater_equal), (maximums, np.less_equal)):
+            for ability, score in (limits or {}).items():
+                if ability not in self.CONSTANTS.ABILITY_NAMES:
+                    raise ValueError(f'Unknown ability {ability}')
+                mask &= compare(rows['scores'][:, self.CONSTANTS.ABILITY_NAMES.index(ability)], score)
+        return mask
+
+    def query(self, class_name: str = None, race: str = None, minimums: dict = None, maximums: dict = None, method: str = None) -> 'CharacterTable':
+        """The rows matching a filter, see filter for the arguments"""
+        return self[self.filter(class_name, race, minimums, maximums, method)]
+
+    def scores(self) -> np.ndarray:
+        """int8 scores of shape (count, 6), a view of the rows"""
+        return self.view()['scores']
+
+    def modifiers(self) -> np.ndarray:
+        """int8 ability modifiers of shape (count, 6), worked out for every row at once"""
+        return ((self.scores().astype(np.int16) - 10) // 2).astype(np.int8)
+
+    def to_dicts(self, index: int) -> tuple:
+        """
+        The three dicts FinalisePage.write_file saves for one row
+
+        Returns:
+        character_dict (dict): 'Class' and 'Race' keys, leaving out a missing class or race
+        score_dict (dict): int scores
+        modifier_dict (dict): int modifiers
+        """
+        row = self.view()[index]
+        abilities = self.CONSTANTS.ABILITY_NAMES
+        character_dict = {}
+        if row['class_code'] >= 0:
+            character_dict['Class'] = self.codes.class_name(int(row['class_code']))
+        if row['race_code'] >= 0:
+            character_dict['Race'] = self.codes.race_name(int(row['race_code']))
+        scores = row['scores'].tolist()
+        return character_dict, dict(zip(abilities, scores)), {ability: (score - 10) // 2 for ability, score in zip(abilities, scores)}
+
+    def format_text(self, index: int) -> str:
+        """One row in the write_file text layout"""
+        return format_text(*self.to_dicts(index))
+
+    def export(self, exporter, chunk_size: int = 100000) -> int:
+        """
+        Writes every row through a CharacterExporter, reading the mapped rows a chunk at a time
+
+        Args:
+        exporter (CharacterExporter): open exporter, its txt format gives the write_file layout
+        chunk_size (int): rows converted at once
+
+        Returns:
+        int: rows written
+        """
+        written = 0
+        for start in range(0, self.count, chunk_size):
+            chunk = self[start:start + chunk_size]
+            for index in range(len(chunk)):
+                row = chunk.view()[index]
+                method = row['method']
+                exporter.write(*chunk.to_dicts(index), method=self.method_names[method] if method >= 0 else None)
+                written += 1
+        return written
+
+    def save_metadata(self) -> None:
+        """Writes the row count and the class, race and method names next to the rows file"""
+        metadata = {'count': self.count, 'abilities': self.CONSTANTS.ABILITY_NAMES, 'classes': self.codes.class_names, 'races': self.codes.race_names, 'methods': self.method_names}
+        with open(self.path + '.json', 'w') as file:
+            json.dump(metadata, file)
+
+    def flush(self) -> None:
+        """Writes mapped rows and the metadata to disk"""
+        if isinstance(self.rows, np.memmap):
+            self.rows.flush()
+        if self.file is not None:
+            self.save_metadata()
+
+    def close(self) -> None:
+        """Flushes, trims the file to the filled rows and unmaps it, a read only or in memory table just drops its rows"""
+        if self.file is not None:
+            self.flush()
+            self.rows = self.rows[:0]
+            self.file.truncate(self.count * row_dtype(self.CONSTANTS).itemsize)
+            self.file.close()
+            self.file = None
@@ -0,0 +1,116 @@
+from dnd_graph import CharacterGraph
+from dnd_rules import RuleConstants
+
+
+class GridView():
+    """Remembers the labels shown in a list of windows so only changed labels are set, all in one Freeze/Thaw with a single Layout"""
+    def __init__(self, page, windows: list):
+        self.page = page
+        self.windows = windows
+        self.shown = [window.GetLabel() for window in windows]
+
+    def changes(self, labels: list) -> list:
+        """
+        Compares wanted labels with the shown ones
+
+        Args:
+        labels (list): one label per window
+
+        Returns:
+        list: (index, label) for each window whose label differs
+        """
+        return [(index, label) for index, (label, shown) in enumerate(zip(labels, self.shown)) if label != shown]
+
+    def apply(self, labels: list) -> int:
+        """
+        Sets the changed labels between Freeze and Thaw and lays the page out once, doing nothing when no label changed
+
+        Args:
+        labels (list): one label per window
+
+        Returns:
+        int: number of labels set
+        """
+        return self.set_cells(self.changes(labels))
+
+    def set_cells(self, changes: list) -> int:
+        """
+        Sets the given labels between Freeze and Thaw and lays the page out once, doing nothing for an empty list
+
+        Args:
+        changes (list): (index, label) pairs, labels already shown are skipped
+
+        Returns:
+        int: number of labels set
+        """
+        changes = [(index, label) for index, label in changes if label != self.shown[index]]
+        if not changes:
+            return 0
+        self.page.Freeze()
+        try:
+            for index, label in changes:
+                self.windows[index].SetLabel(label)
+                self.shown[index] = label
+        finally:
+            self.page.Thaw()
+        self.page.Layout()
+        return len(changes)
+
+
+class ClassGridModel(GridView):
+    """ClassPage's 3 x 6 grid of ability names, race adjusted scores and race bonuses, worked out by a CharacterGraph and drawn through GridView one changed ability at a time"""
+    def __init__(self, page, windows: list, constants: RuleConstants = None, graph: CharacterGraph = None):
+        super().__init__(page, windows)
+        self.CONSTANTS = constants if constants is not None else RuleConstants()
+        self.abilities = self.CONSTANTS.ABILITY_NAMES
+        self.graph = graph if graph is not None else CharacterGraph({}, {})
+        self.drawn = False
+
+    def set_scores(self, score_dict: dict, apply: bool = True) -> int:
+        """Sets the base scores from the previous page's score_dict, keeping any race bonus already chosen"""
+        self.graph.set_scores(score_dict)
+        return self.refresh() if apply else 0
+
+    def set_race(self, race: str, haelf_select: list = None, apply: bool = True) -> int:
+        """Sets the chosen race, None when no race is chosen, with the Half-Elf picks or their defaults"""
+        self.graph.set_race(race, haelf_select)
+        return self.refresh() if apply else 0
+
+    def set_haelf_select(self, haelf_select: list, apply: bool = True) -> int:
+        """Sets the two Half-Elf picks, only the abilities whose bonus moved are redrawn"""
+        self.graph.set_haelf_select(haelf_select)
+        return self.refresh() if apply else 0
+
+    def scores(self) -> list:
+        """Race adjusted scores as ints, in ABILITY_NAMES order"""
+        return list(self.graph.get('scores'))
+
+    def has_race(self) -> bool:
+        """True once a race from the rules file is chosen, ClassPage checks this before leaving the page"""
+        return self.graph.get('race') in self.graph.get('race_dict')
+
+    def score_dict(self) -> dict:
+        """Race adjusted scores as the str score_dict the later pages expect"""
+        return {ability: str(score) for ability, score in self.graph.ability_dict('scores').items()}
+
+    def labels(self) -> list:
+        """The 18 labels the grid should show, blank score rows keep their placeholders until scores arrive"""
+        scores = self.graph.get('scores')
+        if scores is None:
+            return list(self.shown)
+        return list(self.abilities) + [str(score) for score in scores] + [f'+{bonus}' for bonus in self.graph.get('bonuses')]
+
+    def refresh(self) -> int:
+        """Draws the cells of the abilities the graph reports as changed since the last refresh, the whole grid when scores first arrive"""
+        changes = self.graph.take_changes()
+        scores = self.graph.get('scores')
+        if scores is None:
+            return 0
+        if not self.drawn:
+            self.drawn = True
+            return self.apply(self.labels())
+        count = len(self.abilities)
+        bonuses = self.graph.get('bonuses')
+        cells = [(count + index, str(scores[index])) for index in changes.get('scores') or ()]
+        cells += [(2 * count + index, f'+{bonuses[index]}') for index in changes.get('bonuses') or ()]
+        return self.set_cells(cells)
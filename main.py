@@ -1,11 +1,20 @@
+import dnd_startup
+from dnd_instrument import install_from_environment
+from dnd_replay import install_from_environment as install_recorder
 from dnd_GUID import MyWizard
 import wx
 
 def main():
+    dnd_startup.mark('imports')
     app = wx.App()
     app.MainLoop()
+    dnd_startup.mark('app init')
+    install_from_environment()
+    install_recorder()
     wizard = MyWizard()
+    dnd_startup.mark('wizard init')
+    dnd_startup.watch_first_paint(wizard)
     wizard.RunWizard(wizard.l_page)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()